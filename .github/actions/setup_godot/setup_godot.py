@@ -1,14 +1,38 @@
 import argparse
+import fnmatch
+import hashlib
+import json
 import os
+import shutil
+import time
+import urllib.error
+import urllib.request
 import zipfile
 import sys
 import stat
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Dict, List
 
-import wget
 
+download_chunk_size = 1024 * 1024
+download_retries = 5
+download_timeout = 60
 
-def get_dirs(version_string):
+# written into the install dir once everything is extracted and verified
+install_marker_name = ".setup_godot.json"
+
+# the export templates every export platform of export_game.py needs, version.txt is always extracted
+export_template_files = {
+    "windows_amd64": ["windows_*_x86_64*.exe"],
+    "windows_arm64": ["windows_*_arm64*.exe"],
+    "linux_amd64": ["linux_*.x86_64"],
+    "linux_arm64": ["linux_*.arm64"],
+    "macos": ["macos.zip"],
+}
+
+
+def get_dirs(version_string, install_root="", template_root=""):
     system_type = ""
     export_template_dir = ""
     godot_program_subdir = ""
@@ -31,56 +55,265 @@ def get_dirs(version_string):
             godot_program_subdir = f"Godot.app/Contents/MacOS/Godot"
             godot_console_subdir = godot_program_subdir
         case _:
-            print(sys.platform) 
+            print(sys.platform)
             sys.exit(1)
 
+    if template_root != "":
+        export_template_dir = os.path.join(template_root, template_version_string)
     export_template_dir = str(Path(export_template_dir).expanduser())
 
-    godot_installs_dir = os.path.join("~", ".godot_installs", version_string)
+    godot_installs_dir = os.path.join(install_root or os.path.join("~", ".godot_installs"), version_string)
     godot_installs_dir = str(Path(godot_installs_dir).expanduser())
 
     return system_type, export_template_dir, godot_installs_dir, godot_program_subdir, godot_console_subdir
 
 
+def get_download_dir(godot_installs_dir: str) -> str:
+    # the downloads are kept next to the installs, so a reinstall doesn't download them again
+    return os.path.join(os.path.dirname(godot_installs_dir), "downloads", os.path.basename(godot_installs_dir))
+
+
+def get_file_sha512(path: str) -> str:
+    file_hash = hashlib.sha512()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(download_chunk_size), b""):
+            file_hash.update(chunk)
+
+    return file_hash.hexdigest()
+
+
+def open_url(url: str, offset: int = 0):
+    request = urllib.request.Request(url, headers={"User-Agent": "openchamp-setup-godot"})
+    if offset > 0:
+        request.add_header("Range", f"bytes={offset}-")
+    return urllib.request.urlopen(request, timeout=download_timeout)
+
+
+def get_checksums(godot_repo: str, godot_version: str) -> Dict[str, str]:
+    # godot publishes the sha512 of every release file in SHA512-SUMS.txt
+    sums_url = f"{godot_repo}/releases/download/{godot_version}/SHA512-SUMS.txt"
+    try:
+        with open_url(sums_url) as response:
+            sums_text = response.read().decode()
+    except urllib.error.URLError as error:
+        print(f"Could not download {sums_url}: {error}")
+        return {}
+
+    checksums = {}
+    for line in sums_text.splitlines():
+        parts = line.split()
+        if len(parts) == 2:
+            checksums[parts[1].lstrip("*")] = parts[0].lower()
+
+    return checksums
+
+
+def download_file(url: str, destination: str, expected_sha512: str | None) -> bool:
+    # Streams url into destination while hashing it. An already downloaded file that matches
+    # the checksum is reused, interrupted downloads are resumed from <destination>.part.
+    if expected_sha512 and os.path.exists(destination):
+        if get_file_sha512(destination) == expected_sha512:
+            print(f"Using the cached {os.path.basename(destination)}")
+            return True
+        os.remove(destination)
+
+    part_file = destination + ".part"
+    hasher = hashlib.sha512()
+    offset = 0
+    if os.path.exists(part_file):
+        with open(part_file, "rb") as f:
+            for chunk in iter(lambda: f.read(download_chunk_size), b""):
+                hasher.update(chunk)
+                offset += len(chunk)
+
+    attempt = 0
+    while True:
+        try:
+            with open_url(url, offset) as response:
+                if offset > 0 and response.status != 206:
+                    # the server ignored the range request, start from scratch
+                    hasher = hashlib.sha512()
+                    offset = 0
+
+                content_length = response.headers.get("Content-Length")
+                expected_end = offset + int(content_length) if content_length else None
+                with open(part_file, "ab" if offset > 0 else "wb") as f:
+                    for chunk in iter(lambda: response.read(download_chunk_size), b""):
+                        f.write(chunk)
+                        hasher.update(chunk)
+                        offset += len(chunk)
+
+                # urllib reads a dropped connection as the end of the file
+                if expected_end is not None and offset < expected_end:
+                    raise OSError(f"connection closed after {offset} of {expected_end} bytes")
+            break
+        except urllib.error.HTTPError as error:
+            if error.code == 416 and offset > 0:
+                # the partial file already contains everything
+                break
+            print(f"Failed to download {url}: {error}")
+            return False
+        except (urllib.error.URLError, OSError) as error:
+            attempt += 1
+            if attempt >= download_retries:
+                print(f"Failed to download {url} after {attempt} attempts: {error}")
+                return False
+            print(f"Download of {url} interrupted ({error}), retrying")
+            time.sleep(2 ** attempt)
+
+    if expected_sha512 and hasher.hexdigest() != expected_sha512:
+        print(f"Checksum mismatch for {url}")
+        os.remove(part_file)
+        return False
+
+    os.replace(part_file, destination)
+    return True
+
+
+def install_editor(archive: str, godot_installs_dir: str):
+    with zipfile.ZipFile(archive, "r") as zip_ref:
+        zip_ref.extractall(godot_installs_dir)
+
+
+def get_template_patterns(export_platforms: List[str]) -> List[str]:
+    # no export platforms means all the templates
+    if not export_platforms:
+        return ["*"]
+
+    patterns = ["version.txt"]
+    for export_platform in export_platforms:
+        patterns += export_template_files[export_platform]
+    return patterns
+
+
+def is_wanted_template(file_name: str, patterns: List[str]) -> bool:
+    return any(fnmatch.fnmatchcase(file_name, pattern) for pattern in patterns)
+
+
+def templates_installed(export_template_dir: str, patterns: List[str]) -> bool:
+    # every pattern has to match at least one installed template
+    if not os.path.isdir(export_template_dir):
+        return False
+
+    installed = os.listdir(export_template_dir)
+    if "version.txt" not in installed:
+        return False
+    if patterns == ["*"]:
+        patterns = get_template_patterns(list(export_template_files.keys()))
+    return all(any(fnmatch.fnmatchcase(file, pattern) for file in installed) for pattern in patterns)
+
+
+def install_templates(archive: str, export_template_dir: str, patterns: List[str]):
+    # All the export templates are in the templates subdir of the archive. Only the wanted ones
+    # that aren't installed yet are extracted, straight into the template dir.
+    with zipfile.ZipFile(archive, "r") as zip_ref:
+        for info in zip_ref.infolist():
+            file_name = info.filename.removeprefix("templates/")
+            if info.is_dir() or "/" in file_name or not is_wanted_template(file_name, patterns):
+                continue
+
+            destination = os.path.join(export_template_dir, file_name)
+            if os.path.exists(destination) and os.path.getsize(destination) == info.file_size:
+                continue
+
+            temp_file = f"{destination}.{os.getpid()}.tmp"
+            with zip_ref.open(info) as source, open(temp_file, "wb") as target:
+                shutil.copyfileobj(source, target, download_chunk_size)
+            os.replace(temp_file, destination)
+
+
+def is_installed(godot_installs_dir: str, godot_console_subdir: str) -> bool:
+    # the marker is only written after the editor was verified and extracted
+    if not os.path.exists(os.path.join(godot_installs_dir, install_marker_name)):
+        return False
+
+    return os.path.exists(os.path.join(godot_installs_dir, godot_console_subdir))
+
+
 def main(args):
     godot_repo = args["godot_repo"]
     godot_version = args["godot_version"]
 
-    system_type, export_template_dir, godot_installs_dir, godot_program_subdir, godot_console_subdir = get_dirs(godot_version)
+    system_type, export_template_dir, godot_installs_dir, godot_program_subdir, godot_console_subdir = get_dirs(
+        godot_version, args["install_dir"], args["export_template_dir"]
+    )
+
+    template_patterns = get_template_patterns(args["export_platforms"])
+
+    # an install that was verified before needs no network at all
+    install_editor_needed = args["action"] == "download" and not is_installed(godot_installs_dir, godot_console_subdir)
+    install_templates_needed = not templates_installed(export_template_dir, template_patterns)
+    if not install_editor_needed and not install_templates_needed:
+        print(f"Godot {godot_version} is installed already")
+        return 0
+
+    download_dir = get_download_dir(godot_installs_dir)
+    godot_exe_zip = f"Godot_v{godot_version}_{system_type}.zip"
+    godot_templates_zip_name = f"Godot_v{godot_version}_export_templates.tpz"
+
+    # missing templates can be taken from the archive of an earlier download
+    templates_archive = os.path.join(download_dir, godot_templates_zip_name)
+    if not install_editor_needed and os.path.exists(templates_archive):
+        print(f"Extracting the missing templates from the cached {godot_templates_zip_name}")
+        os.makedirs(export_template_dir, exist_ok=True)
+        install_templates(templates_archive, export_template_dir, template_patterns)
+        if templates_installed(export_template_dir, template_patterns):
+            return 0
+
+    if args["offline"]:
+        print(f"The downloads of godot {godot_version} are not cached, run the download action first")
+        return 1
 
     # create the .godot_installs dir and the templates dir
     os.makedirs(godot_installs_dir, exist_ok=True)
     os.makedirs(export_template_dir, exist_ok=True)
+    os.makedirs(download_dir, exist_ok=True)
 
-    # download the godot executable
-    godot_exe_zip = f"Godot_v{godot_version}_{system_type}.zip"
-    godot_download_link = f"{godot_repo}/releases/download/{godot_version}/{godot_exe_zip}"
-    godot_zip = wget.download(godot_download_link)
+    checksums = get_checksums(godot_repo, godot_version)
+    if not checksums and not args["allow_unverified"]:
+        print("No checksums available, use --allow_unverified to install anyway")
+        return 1
 
-    # unzip the godot executable
-    with zipfile.ZipFile(godot_zip, "r") as zip_ref:
-        zip_ref.extractall(godot_installs_dir)
+    # both files are downloaded and extracted at the same time
+    def provision(file_name: str, install) -> bool:
+        if checksums and file_name not in checksums:
+            print(f"{file_name} is not listed in SHA512-SUMS.txt")
+            if not args["allow_unverified"]:
+                return False
 
-    # remove the zip file
-    os.remove(godot_zip)
+        archive = os.path.join(download_dir, file_name)
+        download_link = f"{godot_repo}/releases/download/{godot_version}/{file_name}"
+        if not download_file(download_link, archive, checksums.get(file_name)):
+            return False
 
-    # download the export templates
-    godot_templates_zip_name = f"Godot_v{godot_version}_export_templates.tpz"
-    godot_templates_link = f"{godot_repo}/releases/download/{godot_version}/{godot_templates_zip_name}"
-    godot_templates_zip = wget.download(godot_templates_link)
+        print(f"Extracting {file_name}")
+        install(archive)
+        return True
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        futures = []
+        if install_editor_needed:
+            futures.append(executor.submit(provision, godot_exe_zip, lambda archive: install_editor(archive, godot_installs_dir)))
+        if install_templates_needed:
+            futures.append(executor.submit(provision, godot_templates_zip_name, lambda archive: install_templates(archive, export_template_dir, template_patterns)))
+        success = all([future.result() for future in futures])
 
-    # unzip the export templates
-    with zipfile.ZipFile(godot_templates_zip, "r") as zip_ref:
-        zip_ref.extractall(export_template_dir)
+    if not success:
+        return 1
 
-    # all the export templates are in the templates subdir. Move them to the root
-    templates_subdir = os.path.join(export_template_dir, "templates")
-    for file in os.listdir(templates_subdir):
-        os.rename(os.path.join(templates_subdir, file), os.path.join(export_template_dir, file))
+    if not install_editor_needed:
+        print(f"Installed the godot {godot_version} templates into {export_template_dir}")
+        return 0
 
-    # remove the zip file
-    os.remove(godot_templates_zip)
+    with open(os.path.join(godot_installs_dir, install_marker_name), "w") as f:
+        json.dump({
+            "checksums": {name: checksums.get(name, "") for name in [godot_exe_zip, godot_templates_zip_name]},
+            "export_template_dir": export_template_dir,
+            "export_platforms": args["export_platforms"],
+        }, f, indent=2)
 
+    print(f"Installed godot {godot_version} into {godot_installs_dir}")
+    return 0
 
 
 if __name__ == "__main__":
@@ -95,7 +328,7 @@ if __name__ == "__main__":
     parser.add_argument(
         "--godot_repo",
         action="store",
-        help="The repository to download the godot executable from",
+        help="The repository to download the godot executable from, any http server with the same layout works",
         default="https://github.com/godotengine/godot-builds",
         dest="godot_repo",
         required=False,
@@ -110,26 +343,71 @@ if __name__ == "__main__":
         required=False,
     )
 
+    parser.add_argument(
+        "--install_dir",
+        action="store",
+        help="The dir the godot versions are installed in (default: ~/.godot_installs)",
+        default="",
+        required=False,
+    )
+
+    parser.add_argument(
+        "--export_template_dir",
+        action="store",
+        help="The dir the export templates of all versions are installed in (default: the one godot uses)",
+        default="",
+        required=False,
+    )
+
+    parser.add_argument(
+        "--allow_unverified",
+        action="store_true",
+        help="Install even if the files can't be verified with SHA512-SUMS.txt",
+    )
+
+    parser.add_argument(
+        "--export_platforms",
+        action="store",
+        help="A comma separated list of the export platforms to extract the templates for (default: all of them). "
+             "Choices: " + ", ".join(export_template_files.keys()),
+        default="",
+        required=False,
+    )
+
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="Only use the cached downloads, for the templates action",
+    )
+
     parser.add_argument(
         "action",
         action="store",
-        choices=["download", "print_console", "print_program"],
-        help="The action to perform",
+        choices=["download", "templates", "print_console", "print_program"],
+        help="The action to perform, templates only installs the missing export templates",
     )
 
     args = vars(parser.parse_args())
 
-    if args["action"] == "download":
-        main(args)
+    args["export_platforms"] = [export_platform.strip() for export_platform in args["export_platforms"].split(",") if export_platform.strip()]
+    unknown_platforms = [export_platform for export_platform in args["export_platforms"] if export_platform not in export_template_files]
+    if unknown_platforms:
+        print("Unknown export platforms: " + ", ".join(unknown_platforms))
+        sys.exit(1)
+
+    if args["action"] in ["download", "templates"]:
+        sys.exit(main(args))
     else:
-        _, _, godot_installs_dir, godot_program_subdir, godot_console_subdir = get_dirs(args["godot_version"])
+        _, _, godot_installs_dir, godot_program_subdir, godot_console_subdir = get_dirs(
+            args["godot_version"], args["install_dir"], args["export_template_dir"]
+        )
         godot_exe = ""
         var_name = ""
 
         if args["action"] == "print_console":
             godot_exe = os.path.join(godot_installs_dir, godot_console_subdir)
             var_name = "GODOT_CONSOLE_EXE"
-            
+
         elif args["action"] == "print_program":
             godot_exe = os.path.join(godot_installs_dir, godot_program_subdir)
             var_name = "GODOT_EXE"
@@ -145,4 +423,4 @@ if __name__ == "__main__":
         env_file = os.getenv('GITHUB_OUTPUT')
         with open(env_file, "a") as file:
             file.write(f"{var_name}={godot_exe}\n")
-    
+
@@ -10,6 +10,13 @@ export SCCACHE_DIR=".sccache"
 
 export CCACHE_SLOPPINESS="locale,time_macros,include_file_ctime,include_file_mtime"
 
+# make the cache entries independent of the checkout location,
+# so imported cache bundles also hit in a fresh clone
+if [ -z "$CCACHE_BASEDIR" ]; then
+    export CCACHE_BASEDIR="$(cd "$(dirname "$0")/.." && pwd)"
+fi
+export CCACHE_NOHASHDIR="true"
+
 # check if ccache is installed
 if [ -x "$(command -v ccache)" ]; then
     ccache "$@"
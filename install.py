@@ -1,14 +1,39 @@
 import argparse
+import hashlib
+import io
+import json
 import os
+import shutil
+import struct
 import subprocess
 import sys
+import time
 import zipfile
+import zlib
+
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 
 import requests
+from requests.adapters import HTTPAdapter
+
+if sys.platform == "win32":
+    import msvcrt
+else:
+    import fcntl
 
 requiredPythonMajorVersion = 3
 requiredPythonMinorVersion = 12
 
+github_api_url = "https://api.github.com"
+extension_asset_name = "extension.zip"
+
+download_chunk_size = 64 * 1024
+download_retries = 5
+download_timeout = 30
+
+default_cache_size_mb = 2048
+
 def main(args):
 
     # check if python version is what we expect
@@ -17,7 +42,12 @@ def main(args):
 
     # update the submodules unless the user specifies otherwise
     if args["update_submodules"]:
-        update_submodules()
+        update_submodules(
+            args["submodule_jobs"],
+            args["submodule_depth"],
+            args["submodule_filter"],
+            args["submodule_reference"],
+        )
 
     subprocess.run([sys.executable, "default_assets/manifests.py"])
 
@@ -27,7 +57,12 @@ def main(args):
 
         # try to download and install the extension
         if args["extension_setup"] != "COMPILE_ONLY":
-            download_success = download_and_install_extension()
+            download_success = download_and_install_extension(
+                args["api_url"],
+                args["cache_dir"],
+                args["cache_size"] * 1024 * 1024,
+                args["extract_mode"] == "DELTA",
+            )
 
         # if the download wasn't successful and shouldn't be compiled, exit
         if not download_success and args["extension_setup"] == "DOWNLOAD_ONLY":
@@ -52,7 +87,659 @@ def validate_python_version() -> bool:
 
     return False
 
-def download_and_install_extension() -> bool:
+class StreamingZipExtractor:
+    # Extracts zip members from a byte stream as soon as each member is complete.
+    # This only works with the local file headers, so archives that can't be read
+    # that way (stored members with data descriptors, encryption) mark the extractor
+    # as not streamable and have to be extracted once the download is finished.
+
+    local_header_signature = 0x04034b50
+    data_descriptor_signature = 0x08074b50
+    central_directory_signatures = (0x02014b50, 0x06054b50, 0x06064b50)
+
+    def __init__(self, output_dir: str):
+        self.output_dir = output_dir
+        self.reset()
+
+    def reset(self):
+        shutil.rmtree(self.output_dir, ignore_errors=True)
+        os.makedirs(self.output_dir, exist_ok=True)
+
+        self.buffer = bytearray()
+        self.streamable = True
+        self.finished = False
+        self.members = []
+        self.current = None
+
+    def feed(self, data: bytes):
+        if self.finished or not self.streamable:
+            return
+
+        self.buffer += data
+        while self._process():
+            pass
+
+    def _process(self) -> bool:
+        if self.current is None:
+            return self._read_local_header()
+
+        return self._read_member_data()
+
+    def _read_local_header(self) -> bool:
+        if len(self.buffer) < 4:
+            return False
+
+        signature = struct.unpack_from("<I", self.buffer)[0]
+        if signature in self.central_directory_signatures:
+            # all members have been read, the rest is the central directory
+            self.finished = True
+            self.buffer.clear()
+            return False
+
+        if signature != self.local_header_signature:
+            self.streamable = False
+            return False
+
+        if len(self.buffer) < 30:
+            return False
+
+        (_, _, flags, method, _, _, crc, compressed_size, file_size,
+         name_length, extra_length) = struct.unpack_from("<IHHHHHIIIHH", self.buffer)
+
+        header_size = 30 + name_length + extra_length
+        if len(self.buffer) < header_size:
+            return False
+
+        raw_name = bytes(self.buffer[30:30 + name_length])
+        extra = bytes(self.buffer[30 + name_length:header_size])
+        del self.buffer[:header_size]
+
+        name = raw_name.decode("utf-8" if flags & 0x800 else "cp437")
+        has_descriptor = bool(flags & 0x08)
+        zip64 = False
+
+        # zip64 members store the real sizes in the extra field
+        if compressed_size == 0xFFFFFFFF or file_size == 0xFFFFFFFF:
+            zip64 = True
+            compressed_size, file_size = self._read_zip64_sizes(extra, compressed_size, file_size)
+
+        if flags & 0x01 or method not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+            self.streamable = False
+            return False
+
+        if has_descriptor and method == zipfile.ZIP_STORED:
+            # the end of a stored member with a data descriptor can't be detected
+            self.streamable = False
+            return False
+
+        target = self._member_path(name)
+        if target is None:
+            print(f"Refusing to extract unsafe path {name}")
+            self.streamable = False
+            return False
+
+        self.current = {
+            "name": name,
+            "path": target,
+            "method": method,
+            "has_descriptor": has_descriptor,
+            "zip64": zip64,
+            "crc": crc,
+            "compressed_size": compressed_size,
+            "file_size": file_size,
+            "remaining": compressed_size,
+            "running_crc": 0,
+            "written": 0,
+            "decompressor": zlib.decompressobj(-15) if method == zipfile.ZIP_DEFLATED else None,
+            "file": None,
+        }
+
+        if name.endswith("/"):
+            os.makedirs(target, exist_ok=True)
+        else:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            self.current["file"] = open(target, "wb")
+
+        return True
+
+    def _read_member_data(self) -> bool:
+        member = self.current
+
+        if member["has_descriptor"]:
+            # the compressed size is unknown, let the deflate stream tell us where it ends
+            if len(self.buffer) > 0 and not member["decompressor"].eof:
+                data = bytes(self.buffer)
+                self.buffer.clear()
+                self._write_member(member["decompressor"].decompress(data))
+                if member["decompressor"].eof:
+                    self.buffer[:0] = member["decompressor"].unused_data
+
+            if not member["decompressor"].eof:
+                return False
+
+            return self._read_data_descriptor()
+
+        if member["remaining"] > 0:
+            if len(self.buffer) == 0:
+                return False
+
+            data = bytes(self.buffer[:member["remaining"]])
+            del self.buffer[:len(data)]
+            member["remaining"] -= len(data)
+
+            if member["decompressor"] is not None:
+                data = member["decompressor"].decompress(data)
+            self._write_member(data)
+
+            if member["remaining"] > 0:
+                return False
+
+        if member["decompressor"] is not None:
+            self._write_member(member["decompressor"].flush())
+
+        return self._finish_member()
+
+    def _read_data_descriptor(self) -> bool:
+        member = self.current
+        size_format = "<IQQ" if member["zip64"] else "<III"
+        descriptor_size = struct.calcsize(size_format)
+
+        # the descriptor signature is optional
+        if len(self.buffer) < 4:
+            return False
+        offset = 4 if struct.unpack_from("<I", self.buffer)[0] == self.data_descriptor_signature else 0
+
+        if len(self.buffer) < offset + descriptor_size:
+            return False
+
+        crc, compressed_size, file_size = struct.unpack_from(size_format, self.buffer, offset)
+        del self.buffer[:offset + descriptor_size]
+
+        member["crc"] = crc
+        member["compressed_size"] = compressed_size
+        member["file_size"] = file_size
+
+        return self._finish_member()
+
+    def _finish_member(self) -> bool:
+        member = self.current
+        if member["file"] is not None:
+            member["file"].close()
+
+        if member["running_crc"] != member["crc"] or member["written"] != member["file_size"]:
+            print(f"Corrupted zip member {member['name']}")
+            self.streamable = False
+            return False
+
+        self.members.append((member["name"], member["crc"], member["file_size"]))
+        self.current = None
+        return True
+
+    def _write_member(self, data: bytes):
+        member = self.current
+        member["running_crc"] = zlib.crc32(data, member["running_crc"])
+        member["written"] += len(data)
+        if member["file"] is not None:
+            member["file"].write(data)
+
+    def _read_zip64_sizes(self, extra: bytes, compressed_size: int, file_size: int):
+        offset = 0
+        while offset + 4 <= len(extra):
+            header_id, data_size = struct.unpack_from("<HH", extra, offset)
+            offset += 4
+            if header_id == 0x0001:
+                values = []
+                for index in range(data_size // 8):
+                    values.append(struct.unpack_from("<Q", extra, offset + index * 8)[0])
+
+                # the zip64 extra only contains the fields that overflowed, in this order
+                if file_size == 0xFFFFFFFF and values:
+                    file_size = values.pop(0)
+                if compressed_size == 0xFFFFFFFF and values:
+                    compressed_size = values.pop(0)
+                break
+            offset += data_size
+
+        return compressed_size, file_size
+
+    def _member_path(self, name: str):
+        output_dir = os.path.abspath(self.output_dir)
+        target = os.path.abspath(os.path.join(output_dir, name))
+        if os.path.commonpath([output_dir, target]) != output_dir:
+            return None
+
+        return target
+
+    def close(self):
+        if self.current is not None and self.current["file"] is not None:
+            self.current["file"].close()
+        self.current = None
+
+
+def get_asset_sha256(session: requests.Session, release: dict, asset: dict) -> str | None:
+    # GitHub publishes the digest of every uploaded asset as "sha256:<hex>"
+    digest = asset.get("digest") or ""
+    if digest.startswith("sha256:"):
+        return digest[len("sha256:"):].lower()
+
+    # older releases might have the checksum as a separate asset
+    checksum_name = f"{asset['name']}.sha256"
+    for checksum_asset in release.get("assets", []):
+        if checksum_asset["name"] != checksum_name:
+            continue
+
+        response = session.get(checksum_asset["browser_download_url"], timeout=download_timeout)
+        if response.status_code != 200:
+            return None
+
+        checksum = response.text.strip().split()
+        if checksum:
+            return checksum[0].lower()
+
+    return None
+
+
+def download_file(
+    session: requests.Session,
+    url: str,
+    destination: str,
+    expected_sha256: str | None = None,
+    extractor: StreamingZipExtractor | None = None,
+) -> str | None:
+    # Streams the url into destination while hashing (and optionally extracting) the data.
+    # Partial downloads are kept as <destination>.part and resumed using range requests.
+    part_file = destination + ".part"
+    hasher = hashlib.sha256()
+    offset = 0
+
+    # feed the data of a previously interrupted download
+    if os.path.exists(part_file):
+        with open(part_file, "rb") as file:
+            for chunk in iter(lambda: file.read(download_chunk_size), b""):
+                hasher.update(chunk)
+                if extractor is not None:
+                    extractor.feed(chunk)
+                offset += len(chunk)
+
+        if offset > 0:
+            print(f"Resuming the download at byte {offset}")
+
+    attempt = 0
+    while True:
+        headers = {}
+        if offset > 0:
+            headers["Range"] = f"bytes={offset}-"
+
+        try:
+            with session.get(url, headers=headers, stream=True, timeout=download_timeout) as response:
+                if offset > 0 and response.status_code == 416:
+                    # the partial file already contains everything
+                    break
+
+                response.raise_for_status()
+
+                if offset > 0 and response.status_code != 206:
+                    # the server ignored the range request, start from scratch
+                    print("The server does not support resuming, restarting the download")
+                    hasher = hashlib.sha256()
+                    offset = 0
+                    if extractor is not None:
+                        extractor.reset()
+
+                with open(part_file, "ab" if offset > 0 else "wb") as file:
+                    for chunk in response.iter_content(download_chunk_size):
+                        file.write(chunk)
+                        hasher.update(chunk)
+                        if extractor is not None:
+                            extractor.feed(chunk)
+                        offset += len(chunk)
+
+            break
+        except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as error:
+            attempt += 1
+            if attempt >= download_retries:
+                print(f"Download failed after {attempt} attempts: {error}")
+                return None
+
+            wait_time = min(2 ** attempt, 30)
+            print(f"Download interrupted at byte {offset}, retrying in {wait_time}s: {error}")
+            time.sleep(wait_time)
+        except requests.HTTPError as error:
+            print(f"Download failed: {error}")
+            return None
+
+    digest = hasher.hexdigest()
+    if expected_sha256 is not None and digest != expected_sha256:
+        print(f"Checksum mismatch for {url}: expected {expected_sha256}, got {digest}")
+        os.remove(part_file)
+        return None
+
+    os.replace(part_file, destination)
+    return digest
+
+
+def create_session() -> requests.Session:
+    # one pooled session for all requests, so the connections to github are reused
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=3)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers["Accept"] = "application/vnd.github+json"
+
+    # authenticated requests get a much higher rate limit
+    github_token = os.getenv("GITHUB_TOKEN")
+    if github_token:
+        session.headers["Authorization"] = f"Bearer {github_token}"
+
+    return session
+
+
+def cached_get_json(session: requests.Session, url: str, cache_dir: str):
+    # Sends a conditional request using the stored ETag/Last-Modified of the last response.
+    # A 304 answer is served from disk and doesn't count against the api rate limit.
+    http_cache_dir = os.path.join(cache_dir, "http")
+    os.makedirs(http_cache_dir, exist_ok=True)
+    cache_file = os.path.join(http_cache_dir, hashlib.sha256(url.encode()).hexdigest() + ".json")
+
+    cached = None
+    try:
+        with open(cache_file, "r") as file:
+            cached = json.load(file)
+    except (OSError, ValueError):
+        pass
+
+    headers = {}
+    if cached is not None:
+        if cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+
+    response = session.get(url, headers=headers, timeout=download_timeout)
+    if response.status_code == 304 and cached is not None:
+        return cached["body"], cached.get("next")
+
+    if response.status_code != 200:
+        return None, None
+
+    body = response.json()
+    next_url = response.links.get("next", {}).get("url")
+
+    if "ETag" in response.headers or "Last-Modified" in response.headers:
+        write_file_atomic(cache_file, io.BytesIO(json.dumps({
+            "url": url,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "next": next_url,
+            "body": body,
+        }).encode()))
+
+    return body, next_url
+
+
+def resolve_release(session: requests.Session, repo_url: str, tag: str, cache_dir: str) -> dict | None:
+    # ask for the tag directly first
+    release, _ = cached_get_json(session, f"{repo_url}/releases/tags/{tag}", cache_dir)
+    if release is not None:
+        return release
+
+    # fall back to walking all the release pages
+    print(f"Release lookup for {tag} failed, searching all releases")
+    page_url = f"{repo_url}/releases?per_page=100"
+    while page_url:
+        releases, page_url = cached_get_json(session, page_url, cache_dir)
+        if releases is None:
+            break
+
+        for candidate in releases:
+            if candidate['tag_name'] == tag:
+                return candidate
+
+    return None
+
+
+def get_default_cache_dir() -> str:
+    # the cache is shared between all checkouts of the current user
+    if sys.platform == "win32":
+        cache_root = os.getenv("LOCALAPPDATA") or os.path.expanduser("~")
+    elif sys.platform == "darwin":
+        cache_root = os.path.expanduser("~/Library/Caches")
+    else:
+        cache_root = os.getenv("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+
+    return os.path.join(cache_root, "openchamp", "artifacts")
+
+
+def get_cache_key(repo_url: str, tag: str, asset_name: str) -> str:
+    # the full url, so forks with the same tags don't share entries
+    return f"{repo_url}/releases/tags/{tag}/{asset_name}"
+
+
+@contextmanager
+def cache_index_lock(cache_dir: str):
+    # Serializes the read-modify-write of the index between concurrent installs.
+    # The os releases the lock when an install is killed, so the lock file is never removed.
+    lock_fd = os.open(os.path.join(cache_dir, "index.lock"), os.O_CREAT | os.O_RDWR)
+    try:
+        if sys.platform == "win32":
+            while True:
+                try:
+                    # retries for about 10 seconds before it gives up
+                    msvcrt.locking(lock_fd, msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+        else:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX)
+
+        try:
+            yield
+        finally:
+            if sys.platform == "win32":
+                msvcrt.locking(lock_fd, msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(lock_fd, fcntl.LOCK_UN)
+    finally:
+        os.close(lock_fd)
+
+
+def load_cache_index(cache_dir: str) -> dict:
+    index_file = os.path.join(cache_dir, "index.json")
+    try:
+        with open(index_file, "r") as file:
+            index = json.load(file)
+    except (OSError, ValueError):
+        index = {}
+
+    index.setdefault("entries", {})
+    index.setdefault("blobs", {})
+    return index
+
+
+def save_cache_index(cache_dir: str, index: dict):
+    # concurrent installs never see a half written index, the caller holds the index lock
+    write_file_atomic(os.path.join(cache_dir, "index.json"), io.BytesIO(json.dumps(index, indent=2).encode()))
+
+
+def get_cache_blob(cache_dir: str, digest: str) -> str:
+    return os.path.join(cache_dir, "blobs", digest[:2], digest)
+
+
+def cache_lookup(cache_dir: str, entry_key: str, digest: str | None = None) -> str | None:
+    # Returns the cached file for the (release asset url, digest) key.
+    # Without a digest the last digest stored for the url is used.
+    index = load_cache_index(cache_dir)
+
+    if digest is None:
+        digest = index["entries"].get(entry_key)
+        if digest is None:
+            return None
+
+    blob = get_cache_blob(cache_dir, digest)
+    if not os.path.isfile(blob):
+        return None
+
+    # make sure the cached file wasn't corrupted
+    hasher = hashlib.sha256()
+    with open(blob, "rb") as file:
+        for chunk in iter(lambda: file.read(download_chunk_size), b""):
+            hasher.update(chunk)
+
+    if hasher.hexdigest() != digest:
+        print(f"Removing corrupted cache entry {digest}")
+        with cache_index_lock(cache_dir):
+            os.remove(blob)
+            index = load_cache_index(cache_dir)
+            index["blobs"].pop(digest, None)
+            save_cache_index(cache_dir, index)
+        return None
+
+    with cache_index_lock(cache_dir):
+        index = load_cache_index(cache_dir)
+        index["entries"][entry_key] = digest
+        index["blobs"][digest] = {"size": os.path.getsize(blob), "last_used": time.time()}
+        save_cache_index(cache_dir, index)
+
+    return blob
+
+
+def cache_store(cache_dir: str, entry_key: str, file_path: str, digest: str, max_size: int) -> str:
+    # Moves the file into the cache and evicts the least recently used blobs above max_size
+    blob = get_cache_blob(cache_dir, digest)
+    os.makedirs(os.path.dirname(blob), exist_ok=True)
+
+    with cache_index_lock(cache_dir):
+        os.replace(file_path, blob)
+
+        index = load_cache_index(cache_dir)
+        index["entries"][entry_key] = digest
+        index["blobs"][digest] = {"size": os.path.getsize(blob), "last_used": time.time()}
+
+        evict_cache(cache_dir, index, max_size, keep=digest)
+        save_cache_index(cache_dir, index)
+
+    return blob
+
+
+def evict_cache(cache_dir: str, index: dict, max_size: int, keep: str | None = None):
+    # forget blobs that were removed by hand
+    for digest in list(index["blobs"]):
+        if not os.path.isfile(get_cache_blob(cache_dir, digest)):
+            del index["blobs"][digest]
+
+    total_size = sum(blob["size"] for blob in index["blobs"].values())
+    by_age = sorted(index["blobs"].items(), key=lambda item: item[1]["last_used"])
+
+    for digest, blob in by_age:
+        if total_size <= max_size:
+            break
+
+        if digest == keep:
+            continue
+
+        print(f"Evicting {digest} from the artifact cache")
+        try:
+            os.remove(get_cache_blob(cache_dir, digest))
+        except FileNotFoundError:
+            pass
+
+        total_size -= blob["size"]
+        del index["blobs"][digest]
+
+    # drop the tag entries that point to evicted blobs
+    for entry_key, digest in list(index["entries"].items()):
+        if digest not in index["blobs"]:
+            del index["entries"][entry_key]
+
+
+def file_matches(path: str, crc: int, size: int) -> bool:
+    try:
+        if os.path.getsize(path) != size:
+            return False
+    except OSError:
+        return False
+
+    file_crc = 0
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(download_chunk_size), b""):
+            file_crc = zlib.crc32(chunk, file_crc)
+
+    return file_crc == crc
+
+
+def write_file_atomic(target: str, source) -> int:
+    # write next to the target and rename, so nothing ever sees a half written file
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    temp_file = f"{target}.{os.getpid()}.tmp"
+    try:
+        with open(temp_file, "wb") as file:
+            shutil.copyfileobj(source, file, download_chunk_size)
+        os.replace(temp_file, target)
+    except BaseException:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        raise
+
+    return os.path.getsize(target)
+
+
+def install_extension_archive(
+    zip_path: str,
+    staging_dir: str,
+    extractor: StreamingZipExtractor | None = None,
+    delta: bool = True,
+):
+    # Installs the archive into the project. In delta mode only the files whose crc32 or size
+    # differ from the ones on disk are written, so godot doesn't reload unchanged binaries.
+    project_dir = os.path.abspath('.')
+    bytes_written = 0
+    bytes_skipped = 0
+    files_written = 0
+    files_skipped = 0
+
+    if extractor is not None and extractor.streamable and extractor.finished:
+        # use the files that were already extracted during the download
+        members = extractor.members
+        open_member = lambda name: open(os.path.join(staging_dir, name), "rb")
+        zip_ref = None
+    else:
+        zip_ref = zipfile.ZipFile(zip_path, 'r')
+        members = [(info.filename, info.CRC, info.file_size) for info in zip_ref.infolist()]
+        open_member = zip_ref.open
+
+    try:
+        for name, crc, size in members:
+            target = os.path.abspath(os.path.join(project_dir, name))
+            if os.path.commonpath([project_dir, target]) != project_dir:
+                print(f"Refusing to extract unsafe path {name}")
+                continue
+
+            if name.endswith("/"):
+                os.makedirs(target, exist_ok=True)
+                continue
+
+            if delta and file_matches(target, crc, size):
+                bytes_skipped += size
+                files_skipped += 1
+                continue
+
+            with open_member(name) as source:
+                bytes_written += write_file_atomic(target, source)
+            files_written += 1
+    finally:
+        if zip_ref is not None:
+            zip_ref.close()
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+    print(f"Wrote {files_written} files ({bytes_written} bytes), skipped {files_skipped} unchanged files ({bytes_skipped} bytes)")
+
+
+def download_and_install_extension(
+    api_url: str = github_api_url,
+    cache_dir: str | None = None,
+    cache_size: int = default_cache_size_mb * 1024 * 1024,
+    delta: bool = True,
+) -> bool:
     # get the current tag using git
     tag = subprocess.run(["git", "tag", "--points-at", "HEAD"], capture_output=True)
     tag = tag.stdout.decode().strip()
@@ -61,6 +748,12 @@ def download_and_install_extension() -> bool:
         print("Failed to get current tag")
         return False
 
+    if cache_dir is None:
+        cache_dir = get_default_cache_dir()
+    os.makedirs(cache_dir, exist_ok=True)
+
+    staging_dir = os.path.join('.', extension_asset_name + ".staging")
+
     # Download latest extension.zip pre-release
     git_url = subprocess.run(["git", "config", "--get", "remote.origin.url"], capture_output=True)
     git_url = git_url.stdout.decode().strip()
@@ -73,51 +766,153 @@ def download_and_install_extension() -> bool:
         print("Only GitHub repositories are supported using http are supported")
         return False
 
-    url = git_url.replace("https://github.com", "https://api.github.com/repos")
+    url = git_url.replace("https://github.com", f"{api_url.rstrip('/')}/repos")
     # Remove .git from the end
-    url = url[:-4]
-
-    releases_url = f"{url}/releases"
-    releases = requests.get(releases_url).json()
-    release_found = False
-    extension_zip = os.path.join('.', 'extension.zip')
-
-    for release in releases:
-        if release['tag_name'] != tag:
-            continue
-
-        for asset in release['assets']:
-            if asset['name'] != 'extension.zip':
-                continue
-
-            download_url = asset['browser_download_url']
-            response = requests.get(download_url)
-            with open(extension_zip, 'wb') as file:
-                file.write(response.content)
+    url = url.removesuffix(".git")
+    cache_key = get_cache_key(url, tag, extension_asset_name)
+
+    # a previous install of the same tag doesn't need the network at all
+    cached_zip = cache_lookup(cache_dir, cache_key)
+    if cached_zip is not None:
+        print(f"Using cached {extension_asset_name} for {tag}")
+        install_extension_archive(cached_zip, staging_dir, delta=delta)
+        print("Extracted extension")
+        return True
 
-            print("Downloaded latest pre-release extension.zip")
-            release_found = True
-            break
+    session = create_session()
 
-        break
+    release = resolve_release(session, url, tag, cache_dir)
+    asset = None
+    if release is not None:
+        for candidate_asset in release['assets']:
+            if candidate_asset['name'] == extension_asset_name:
+                asset = candidate_asset
+                break
 
-    if not release_found:
+    if asset is None:
         print("No pre-release extension.zip found")
         return False
 
-    # Extract extension.zip into the bin directory
-    with zipfile.ZipFile(extension_zip, 'r') as zip_ref:
-        zip_ref.extractall()
-    
-    os.remove(extension_zip)
+    expected_sha256 = get_asset_sha256(session, release, asset)
+    if expected_sha256 is None:
+        print("No checksum published for extension.zip, skipping verification")
+    else:
+        # the same binaries might have been cached under a different tag
+        cached_zip = cache_lookup(cache_dir, cache_key, expected_sha256)
+        if cached_zip is not None:
+            print(f"Using cached {extension_asset_name} ({expected_sha256})")
+            install_extension_archive(cached_zip, staging_dir, delta=delta)
+            print("Extracted extension")
+            return True
+
+    # download into the cache, every checkout gets its own partial file to resume from
+    checkout_id = hashlib.sha256(os.path.abspath('.').encode()).hexdigest()[:12]
+    download_dir = os.path.join(cache_dir, "downloads")
+    os.makedirs(download_dir, exist_ok=True)
+    extension_zip = os.path.join(download_dir, f"{tag}_{extension_asset_name}.{checkout_id}")
+
+    # extract the members while downloading into a staging dir
+    # they are only moved into the project once the checksum has been verified
+    extractor = StreamingZipExtractor(staging_dir)
+    digest = download_file(session, asset['browser_download_url'], extension_zip, expected_sha256, extractor)
+    extractor.close()
+
+    if digest is None:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        return False
+
+    print("Downloaded latest pre-release extension.zip")
+
+    cached_zip = cache_store(cache_dir, cache_key, extension_zip, digest, cache_size)
+    install_extension_archive(cached_zip, staging_dir, extractor, delta)
 
     print("Extracted extension")
     return True
 
 
-def update_submodules():
-    # Run git submodule update --init
-    subprocess.run(["git", "submodule", "update", "--init"])
+def get_submodules() -> list[tuple[str, str, str]]:
+    # returns (name, path, url) for every submodule in .gitmodules
+    config = subprocess.run(
+        ["git", "config", "--file", ".gitmodules", "--get-regexp", r"^submodule\..*\.(path|url)$"],
+        capture_output=True,
+    )
+
+    submodules = {}
+    for line in config.stdout.decode().splitlines():
+        key, value = line.split(" ", 1)
+        name, option = key[len("submodule."):].rsplit(".", 1)
+        submodules.setdefault(name, {})[option] = value
+
+    return [(name, values["path"], values.get("url", "")) for name, values in submodules.items() if "path" in values]
+
+
+def find_reference_repo(reference_dir: str, name: str, url: str) -> str | None:
+    # mirrors can be named after the submodule or after the repository in the url
+    repo_name = url.rstrip("/").rsplit("/", 1)[-1]
+    candidates = [name, os.path.basename(name), repo_name, repo_name.removesuffix(".git") + ".git"]
+
+    for candidate in candidates:
+        candidate_dir = os.path.join(reference_dir, candidate)
+        if os.path.isdir(candidate_dir):
+            return os.path.abspath(candidate_dir)
+
+    return None
+
+
+def update_submodule(name: str, path: str, url: str, depth: int, filter_spec: str, reference_dir: str) -> tuple[str, float, int]:
+    update_command = ["git", "submodule", "update", "--init"]
+    if depth > 0:
+        update_command.append(f"--depth={depth}")
+    if filter_spec:
+        update_command.append(f"--filter={filter_spec}")
+    if reference_dir:
+        reference_repo = find_reference_repo(reference_dir, name, url)
+        if reference_repo is not None:
+            update_command += ["--reference", reference_repo]
+        else:
+            print(f"No reference mirror for {name} in {reference_dir}")
+    update_command += ["--", path]
+
+    start_time = time.perf_counter()
+    update_output = subprocess.run(update_command, capture_output=True)
+    duration = time.perf_counter() - start_time
+
+    if update_output.returncode != 0:
+        print(f"Failed to update {path}:")
+        print(update_output.stderr.decode())
+
+    return path, duration, update_output.returncode
+
+
+def update_submodules(jobs: int = 0, depth: int = 0, filter_spec: str = "", reference_dir: str = "") -> bool:
+    # Every submodule is updated in its own git process, so they are fetched in parallel
+    # and the time spent on each of them can be reported.
+    submodules = get_submodules()
+    if not submodules:
+        # nothing to parallelize, let git handle it
+        subprocess.run(["git", "submodule", "update", "--init"])
+        return True
+
+    if jobs <= 0:
+        jobs = len(submodules)
+
+    # register the urls once up front, concurrent inits would fight over .git/config
+    subprocess.run(["git", "submodule", "init"], capture_output=True)
+
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        results = list(executor.map(
+            lambda submodule: update_submodule(*submodule, depth, filter_spec, reference_dir),
+            submodules,
+        ))
+    total_time = time.perf_counter() - start_time
+
+    for path, duration, returncode in results:
+        status = "ok" if returncode == 0 else "failed"
+        print(f"{path}: {duration:.2f}s ({status})")
+    print(f"Updated {len(results)} submodules in {total_time:.2f}s")
+
+    return all(returncode == 0 for _, _, returncode in results)
 
 
 if __name__ == "__main__":
@@ -137,6 +932,38 @@ if __name__ == "__main__":
         default=True,
     )
 
+    parser.add_argument(
+        "--submodule_jobs",
+        type=int,
+        required=False,
+        default=0,
+        help="The number of submodules to fetch in parallel (default: 0, all at once)",
+    )
+
+    parser.add_argument(
+        "--submodule_depth",
+        type=int,
+        required=False,
+        default=0,
+        help="Create shallow submodule clones with this history depth (default: 0, full history)",
+    )
+
+    parser.add_argument(
+        "--submodule_filter",
+        type=str,
+        required=False,
+        default="",
+        help="A partial clone filter for the submodules, e.g. blob:none (default: empty, no filter)",
+    )
+
+    parser.add_argument(
+        "--submodule_reference",
+        type=str,
+        required=False,
+        default="",
+        help="A directory with local mirrors of the submodule repositories to borrow objects from",
+    )
+
     parser.add_argument(
         "--extension_setup",
         type=str,
@@ -146,6 +973,40 @@ if __name__ == "__main__":
         help="The extension setup mode (default: DOWNLOAD_OR_COMPILE)",
     )
 
+    parser.add_argument(
+        "--api_url",
+        type=str,
+        required=False,
+        default=github_api_url,
+        help="The GitHub API to query for releases (default: {})".format(github_api_url),
+    )
+
+    parser.add_argument(
+        "--cache_dir", "--cache-dir",
+        type=str,
+        required=False,
+        default=get_default_cache_dir(),
+        dest="cache_dir",
+        help="The user level cache for downloaded artifacts (default: {})".format(get_default_cache_dir()),
+    )
+
+    parser.add_argument(
+        "--cache_size",
+        type=int,
+        required=False,
+        default=default_cache_size_mb,
+        help="The maximum size of the artifact cache in MB (default: {})".format(default_cache_size_mb),
+    )
+
+    parser.add_argument(
+        "--extract_mode",
+        type=str,
+        required=False,
+        choices=["DELTA", "FULL"],
+        default="DELTA",
+        help="DELTA only rewrites files that changed, FULL rewrites all of them (default: DELTA)",
+    )
+
     args = vars(parser.parse_args())
 
     main(args)
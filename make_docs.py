@@ -1,22 +1,145 @@
 import argparse
+import hashlib
+import json
 import os
+import shutil
 import subprocess
+import tempfile
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+from utility_scripts import gdscript_docs
+
+
+# remembers the script hash, the generated files and the duration of every directory
+state_file_name = ".doc_state.json"
+
+# a directory may take this many times longer than last time before it times out
+timeout_factor = 3.0
+min_timeout = 10.0
+
+
+def get_directory_hash(gd_dir: str) -> str:
+    dir_hash = hashlib.sha256()
+    gd_files = []
+    for root, _, files in os.walk(gd_dir):
+        gd_files += [os.path.join(root, file) for file in files if file.endswith(".gd")]
+
+    for gd_file in sorted(gd_files):
+        dir_hash.update(gd_file.replace("\\", "/").encode() + b"\0")
+        with open(gd_file, "rb") as f:
+            dir_hash.update(hashlib.sha256(f.read()).digest())
+
+    return dir_hash.hexdigest()
+
+
+def load_state(doc_dir: str) -> Dict[str, Dict]:
+    try:
+        with open(os.path.join(doc_dir, state_file_name), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(doc_dir: str, state: Dict[str, Dict]):
+    state_file = os.path.join(doc_dir, state_file_name)
+    with open(state_file + ".tmp", "w") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(state_file + ".tmp", state_file)
+
+
+def get_timeout(dir_state: Dict | None, default_timeout: float) -> float:
+    if not dir_state or "duration" not in dir_state:
+        return default_timeout
+
+    return max(min_timeout, dir_state["duration"] * timeout_factor)
+
+
+def generate_directory(gd_exe: str, gd_dir: str, timeout: float) -> Tuple[str | None, float]:
+    # Runs the doctool for one directory into its own temporary output,
+    # so several directories can be generated at the same time.
+    temp_dir = tempfile.mkdtemp(prefix="openchamp_docs_{}_".format(gd_dir))
+    start_time = time.monotonic()
+
+    try:
+        _ret = subprocess.run([
+            gd_exe,
+            "--headless",
+            "--verbose",
+            "--doctool",
+            temp_dir,
+            "--gdscript-docs",
+            "res://" + gd_dir
+        ], check=False, timeout=timeout, capture_output=True)
+    except subprocess.TimeoutExpired:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        print(f"Failed to generate documentation for res://{gd_dir} due to timeout ({timeout:.0f}s)")
+        return None, time.monotonic() - start_time
+
+    duration = time.monotonic() - start_time
+    if _ret.returncode != 0:
+        print(_ret.stdout.decode(errors="replace"))
+        print(_ret.stderr.decode(errors="replace"))
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        print(f"Failed to generate documentation for res://{gd_dir}")
+        return None, duration
+
+    return temp_dir, duration
+
+
+def extract_directory(gd_dir: str) -> Tuple[str | None, float]:
+    # the fast mode, parses the scripts in python instead of starting godot
+    temp_dir = tempfile.mkdtemp(prefix="openchamp_docs_{}_".format(gd_dir))
+    start_time = time.monotonic()
+
+    try:
+        gdscript_docs.extract_directory(".", gd_dir, temp_dir)
+    except (OSError, UnicodeDecodeError) as e:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        print(f"Failed to extract the documentation for res://{gd_dir}: {e}")
+        return None, time.monotonic() - start_time
+
+    return temp_dir, time.monotonic() - start_time
+
+
+def merge_output(doc_dir: str, temp_dir: str, old_files: List[str]) -> List[str]:
+    # replaces the files a directory generated last time with the new ones
+    for old_file in old_files:
+        old_path = os.path.join(doc_dir, old_file)
+        if os.path.exists(old_path):
+            os.remove(old_path)
+
+    new_files = []
+    for root, _, files in os.walk(temp_dir):
+        for file in files:
+            relative_path = os.path.relpath(os.path.join(root, file), temp_dir)
+            target = os.path.join(doc_dir, relative_path)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.move(os.path.join(root, file), target)
+            new_files.append(relative_path.replace("\\", "/"))
+
+    shutil.rmtree(temp_dir, ignore_errors=True)
+    return sorted(new_files)
 
 
 def main(args):
     gd_exe = args["godot_path"]
-    
-    # Check if the godot executable exists
-    if not os.path.exists(gd_exe):
-        print(f"Godot executable not found at {gd_exe}")
-        return
-    
-    # make sure the godot executable is executable
-    _ret = subprocess.run([gd_exe, "--version"], check=True)
-    if _ret.returncode != 0:
-        print(f"Failed to run godot executable at {gd_exe}")
-        return
-    
+    mode = "fast" if args["fast"] else "godot"
+
+    if mode == "godot":
+        # Check if the godot executable exists
+        if gd_exe is None or not os.path.exists(gd_exe):
+            print(f"Godot executable not found at {gd_exe}")
+            return 1
+
+        # make sure the godot executable is executable
+        _ret = subprocess.run([gd_exe, "--version"], check=True)
+        if _ret.returncode != 0:
+            print(f"Failed to run godot executable at {gd_exe}")
+            return 1
+
     os.makedirs(args["doc_dir"], exist_ok=True)
 
     # mat
@@ -28,28 +151,71 @@ def main(args):
         "ui",
     ]
 
-    
+
     print(gd_scrip_dirs)
 
-    # generate the documentation
-    for gd_file in gd_scrip_dirs:
-        gd_dir = "res://" + gd_file
-
-        print(f"Generating documentation for {gd_dir}")
-        try:
-            _ret = subprocess.run([
-                gd_exe,
-                "--headless",
-                "--verbose",
-                "--doctool",
-                args["doc_dir"],
-                "--gdscript-docs",
-                gd_dir
-            ], check=False, timeout=10)
-        except subprocess.TimeoutExpired:
-            print(f"Failed to generate documentation for {gd_dir} due to timeout")
+    state = load_state(args["doc_dir"])
+    dirty_dirs = []
+    dir_hashes = {}
+    for gd_dir in gd_scrip_dirs:
+        if not os.path.isdir(gd_dir):
+            print(f"Skipping res://{gd_dir}, it doesn't exist")
+            continue
+
+        dir_hashes[gd_dir] = get_directory_hash(gd_dir)
+        dir_state = state.get(gd_dir)
+        # the output of the fast mode differs a bit from godot's, so switching the mode regenerates everything
+        if dir_state and dir_state["hash"] == dir_hashes[gd_dir] and dir_state.get("mode", "godot") == mode and not args["force"]:
+            print(f"Documentation for res://{gd_dir} is up to date")
             continue
 
+        dirty_dirs.append(gd_dir)
+
+    # generate the documentation
+    failed_dirs = []
+    jobs = max(1, min(args["jobs"], len(dirty_dirs)))
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = {}
+        for gd_dir in dirty_dirs:
+            timeout = get_timeout(state.get(gd_dir), args["timeout"])
+            print(f"Generating documentation for res://{gd_dir}")
+            if mode == "fast":
+                futures[gd_dir] = executor.submit(extract_directory, gd_dir)
+            else:
+                futures[gd_dir] = executor.submit(generate_directory, gd_exe, gd_dir, timeout)
+
+        # merge in a fixed order, so the output doesn't depend on which run finished first
+        for gd_dir, future in futures.items():
+            temp_dir, duration = future.result()
+            if temp_dir is None:
+                # the old docs stay, but the next run waits longer
+                failed_dirs.append(gd_dir)
+                if gd_dir in state and mode == "godot":
+                    state[gd_dir]["duration"] = max(state[gd_dir].get("duration", 0), duration)
+                continue
+
+            old_state = state.get(gd_dir, {})
+            state[gd_dir] = {
+                "hash": dir_hashes[gd_dir],
+                "mode": mode,
+                "files": merge_output(args["doc_dir"], temp_dir, old_state.get("files", [])),
+            }
+
+            # the timeouts are only based on the godot runs
+            if mode == "godot":
+                state[gd_dir]["duration"] = duration
+            elif "duration" in old_state:
+                state[gd_dir]["duration"] = old_state["duration"]
+            print(f"Generated {len(state[gd_dir]['files'])} files for res://{gd_dir} in {duration:.1f}s")
+
+    save_state(args["doc_dir"], state)
+
+    if failed_dirs:
+        print("Failed to generate the documentation for: " + ", ".join(failed_dirs))
+        return 1
+
+    return 0
+
 
 if __name__ == "__main__":
     # change to the project root, which is the dir of this file
@@ -69,12 +235,41 @@ if __name__ == "__main__":
         required=False,
     )
 
+    parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="How many directories are generated at the same time",
+    )
+
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=60,
+        help="The timeout in seconds for directories that were never generated before",
+    )
+
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Regenerate all directories, even if their scripts didn't change",
+    )
+
+    parser.add_argument(
+        "--fast",
+        action="store_true",
+        help="Extract the documentation with the python parser instead of godot",
+    )
+
     parser.add_argument(
         "godot_path",
         action="store",
-        help="The path to the godot executable",
+        nargs="?",
+        help="The path to the godot executable, not needed with --fast",
     )
 
     args = vars(parser.parse_args())
+    args["doc_dir"] = os.path.abspath(args["doc_dir"])
 
-    main(args)
+    exit(main(args))
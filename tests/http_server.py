@@ -0,0 +1,80 @@
+import json
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class LocalServer:
+    # A local stand-in for github and the godot release downloads.
+    # Serves files from a dict, answers range requests and can drop a connection
+    # halfway through a download to test resuming.
+    def __init__(self):
+        self.files = {}
+        self.requests = []
+        self.drop_after = {}
+        self.ignore_range = False
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                range_header = self.headers.get("Range")
+                server.requests.append((self.path, range_header))
+
+                data = server.files.get(self.path)
+                if data is None:
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+
+                start = 0
+                if range_header and not server.ignore_range:
+                    start = int(range_header.removeprefix("bytes=").split("-")[0])
+                    if start >= len(data):
+                        self.send_response(416)
+                        self.send_header("Content-Length", "0")
+                        self.end_headers()
+                        return
+                    self.send_response(206)
+                    self.send_header("Content-Range", "bytes {}-{}/{}".format(start, len(data) - 1, len(data)))
+                else:
+                    self.send_response(200)
+
+                body = data[start:]
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+
+                drop_after = server.drop_after.pop(self.path, None)
+                if drop_after is not None:
+                    # send a part of the body and close the connection
+                    self.wfile.write(body[:drop_after])
+                    self.wfile.flush()
+                    self.close_connection = True
+                    return
+
+                self.wfile.write(body)
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = "http://127.0.0.1:{}".format(self.httpd.server_address[1])
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def add_file(self, path: str, data: bytes):
+        self.files[path] = data
+
+    def add_json(self, path: str, value):
+        self.files[path] = json.dumps(value).encode()
+
+    def range_requests(self, path: str):
+        return [range_header for request_path, range_header in self.requests if request_path == path and range_header]
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.httpd.shutdown()
+        self.httpd.server_close()
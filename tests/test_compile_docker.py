@@ -0,0 +1,163 @@
+import json
+import os
+import stat
+import sys
+import tempfile
+import unittest
+
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "utility_scripts"))
+
+import compile
+
+# A fake docker executable. It keeps the pulled images and the running containers in a state file
+# and logs every call, so the tests can count pulls and container starts.
+fake_docker = """#!{python}
+import json, os, sys
+
+state_file = os.environ["FAKE_DOCKER_STATE"]
+with open(state_file) as f:
+    state = json.load(f)
+args = sys.argv[1:]
+state["calls"].append(args)
+
+def save():
+    with open(state_file, "w") as f:
+        json.dump(state, f)
+
+if args[:2] == ["image", "inspect"]:
+    image = args[-1]
+    if image not in state["images"]:
+        save()
+        sys.exit(1)
+    print(state["images"][image])
+elif args[0] == "pull":
+    state["images"][args[1]] = state["next_image_id"]
+elif args[0] == "inspect":
+    container = state["containers"].get(args[-1])
+    if container is None:
+        save()
+        sys.exit(1)
+    print("true {{}} {{}}".format(container["image"], container["mount"]))
+elif args[0] == "run" and "--detach" in args:
+    name = args[args.index("--name") + 1]
+    mount = args[args.index("--volume") + 1].rsplit(":", 1)[0]
+    image = args[args.index("sleep") + 1]
+    state["containers"][name] = {{"image": state["images"][image], "mount": mount}}
+elif args[0] == "run":
+    print("#!/bin/sh")
+    print("# dockcross wrapper for " + args[-1])
+elif args[0] == "rm":
+    state["containers"].pop(args[-1], None)
+save()
+"""
+
+
+class DockerToolchainTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        root = self.temp_dir.name
+
+        bin_dir = os.path.join(root, "bin")
+        os.makedirs(bin_dir)
+        docker_path = os.path.join(bin_dir, "docker")
+        with open(docker_path, "w") as f:
+            f.write(fake_docker.format(python=sys.executable))
+        os.chmod(docker_path, os.stat(docker_path).st_mode | stat.S_IXUSR)
+
+        self.state_file = os.path.join(root, "docker_state.json")
+        self.write_state({"images": {}, "containers": {}, "calls": [], "next_image_id": "sha256:" + "1" * 64})
+
+        self.project_dir = os.path.join(root, "project")
+        os.makedirs(os.path.join(self.project_dir, "extensions"))
+
+        self.env = mock.patch.dict(os.environ, {
+            "PATH": bin_dir + os.pathsep + os.environ["PATH"],
+            "FAKE_DOCKER_STATE": self.state_file,
+        })
+        self.env.start()
+
+    def tearDown(self):
+        self.env.stop()
+        self.temp_dir.cleanup()
+
+    def read_state(self) -> dict:
+        with open(self.state_file) as f:
+            return json.load(f)
+
+    def write_state(self, state: dict):
+        with open(self.state_file, "w") as f:
+            json.dump(state, f)
+
+    def count_calls(self, *prefix) -> int:
+        return sum(1 for call in self.read_state()["calls"] if call[:len(prefix)] == list(prefix))
+
+    def test_wrapper_is_cached_per_image(self):
+        build_dir = os.path.join(self.project_dir, "extensions", "build_aarch64_debug")
+        first_command = compile.setup_docker_image("aarch64", self.project_dir, build_dir)
+        second_command = compile.setup_docker_image("aarch64", self.project_dir, build_dir)
+
+        self.assertEqual(first_command, second_command)
+        self.assertEqual(first_command[-1], "cmake")
+        self.assertTrue(os.path.exists(first_command[0]))
+        self.assertEqual(self.count_calls("pull"), 1)
+        self.assertEqual(self.count_calls("run", "--rm"), 1)
+
+    def test_refresh_pulls_and_new_images_get_a_new_wrapper(self):
+        build_dir = os.path.join(self.project_dir, "extensions", "build_aarch64_debug")
+        old_command = compile.setup_docker_image("aarch64", self.project_dir, build_dir)
+
+        state = self.read_state()
+        state["next_image_id"] = "sha256:" + "2" * 64
+        self.write_state(state)
+
+        new_command = compile.setup_docker_image("aarch64", self.project_dir, build_dir, refresh_images=True)
+
+        self.assertEqual(self.count_calls("pull"), 2)
+        self.assertNotEqual(old_command[0], new_command[0])
+        self.assertEqual(self.count_calls("run", "--rm"), 2)
+
+    def test_build_container_is_reused(self):
+        first_command = compile.setup_build_container("aarch64", self.project_dir)
+        second_command = compile.setup_build_container("aarch64", self.project_dir)
+
+        self.assertEqual(first_command, second_command)
+        self.assertEqual(first_command[:2], ["docker", "exec"])
+        self.assertEqual(first_command[-2:], [compile.get_build_container_name("aarch64"), "cmake"])
+        self.assertEqual(self.count_calls("run", "--detach"), 1)
+
+    def test_build_containers_of_other_checkouts_are_replaced(self):
+        compile.setup_build_container("aarch64", self.project_dir)
+
+        other_project = os.path.join(self.temp_dir.name, "other_project")
+        os.makedirs(other_project)
+        compile.setup_build_container("aarch64", other_project)
+
+        self.assertEqual(self.count_calls("run", "--detach"), 2)
+        self.assertEqual(self.count_calls("rm", "--force"), 1)
+        container = self.read_state()["containers"][compile.get_build_container_name("aarch64")]
+        self.assertEqual(container["mount"], os.path.abspath(other_project))
+
+    def test_several_arches_get_their_own_containers(self):
+        compile.setup_build_container("aarch64", self.project_dir)
+        compile.setup_build_container("riscv64", self.project_dir)
+
+        containers = self.read_state()["containers"]
+        self.assertIn(compile.get_build_container_name("aarch64"), containers)
+        self.assertIn(compile.get_build_container_name("riscv64"), containers)
+
+    def test_container_commands_get_the_build_env(self):
+        exec_command = compile.setup_build_container("aarch64", self.project_dir)
+        command = compile.get_container_command(exec_command, {"CMAKE_LINKER_TYPE": "MOLD"})
+
+        self.assertEqual(command[-2:], exec_command[-2:])
+        self.assertIn("CMAKE_LINKER_TYPE=MOLD", command)
+
+        build_dir = os.path.join(self.project_dir, "extensions", "build_aarch64_debug")
+        self.assertEqual(compile.get_container_build_dir(build_dir, self.project_dir), "extensions/build_aarch64_debug")
+        self.assertIsNone(compile.get_container_build_dir(self.temp_dir.name, self.project_dir))
+
+
+if __name__ == "__main__":
+    unittest.main()
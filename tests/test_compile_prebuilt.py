@@ -0,0 +1,75 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "utility_scripts"))
+
+import compile
+
+
+def write_file(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+class PrebuiltCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.project_dir = os.path.join(self.temp_dir.name, "project")
+        self.extensions_dir = os.path.join(self.project_dir, "extensions")
+        self.store_dir = os.path.join(self.temp_dir.name, "prebuilt")
+        self.build_dir = os.path.join(self.extensions_dir, "build")
+        self.bin_dir = os.path.join(self.project_dir, "bin")
+
+        write_file(os.path.join(self.extensions_dir, "CMakeLists.txt"), b"project(openchamp)")
+        write_file(os.path.join(self.extensions_dir, "src", "register_types.cpp"), b"void init() {}")
+        write_file(os.path.join(self.extensions_dir, "include", "register_types.h"), b"void init();")
+        write_file(os.path.join(self.extensions_dir, "gdextension_interface.h"), b"typedef int GDExtensionBool;")
+        write_file(os.path.join(self.extensions_dir, "extension_api.json"), b'{"header": {"version_minor": 3}}')
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def fingerprint(self, cmake_args=None) -> str:
+        return compile.get_build_fingerprint(
+            self.project_dir, "x86_64", "debug", ["cmake"], "default", "default", cmake_args or []
+        )
+
+    def store(self, fingerprint: str):
+        library = "libopenchamp.linux.template_debug.x86_64.so"
+        write_file(os.path.join(self.bin_dir, library), b"library")
+        write_file(os.path.join(self.build_dir, "install_manifest.txt"), os.path.join(self.bin_dir, library).encode())
+        compile.store_prebuilt(self.store_dir, fingerprint, self.build_dir, self.bin_dir, 1024 * 1024)
+
+    def test_unchanged_sources_hit_the_cache(self):
+        self.store(self.fingerprint())
+
+        self.assertTrue(compile.restore_prebuilt(self.store_dir, self.fingerprint(), self.bin_dir))
+
+    def test_godot_api_changes_miss_the_cache(self):
+        self.store(self.fingerprint())
+
+        write_file(os.path.join(self.extensions_dir, "gdextension_interface.h"), b"typedef uint8_t GDExtensionBool;")
+        self.assertFalse(compile.restore_prebuilt(self.store_dir, self.fingerprint(), self.bin_dir))
+
+        self.store(self.fingerprint())
+        write_file(os.path.join(self.extensions_dir, "extension_api.json"), b'{"header": {"version_minor": 4}}')
+        self.assertFalse(compile.restore_prebuilt(self.store_dir, self.fingerprint(), self.bin_dir))
+
+    def test_custom_api_file_is_hashed(self):
+        custom_api_file = os.path.join(self.temp_dir.name, "custom_api.json")
+        write_file(custom_api_file, b'{"header": {"version_minor": 3}}')
+        cmake_args = ["-DGODOT_CUSTOM_API_FILE={}".format(custom_api_file)]
+
+        fingerprint = self.fingerprint(cmake_args)
+        write_file(os.path.join(self.extensions_dir, "extension_api.json"), b'{"header": {"version_minor": 4}}')
+        self.assertEqual(self.fingerprint(cmake_args), fingerprint)
+
+        write_file(custom_api_file, b'{"header": {"version_minor": 4}}')
+        self.assertNotEqual(self.fingerprint(cmake_args), fingerprint)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,145 @@
+import io
+import json
+import os
+import stat
+import sys
+import tarfile
+import tempfile
+import unittest
+
+from contextlib import redirect_stdout
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "utility_scripts"))
+
+import compiler_cache
+
+
+def write_entry(build_dir: str, path: str, size: int, mtime: float):
+    file_path = os.path.join(build_dir, path)
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    with open(file_path, "wb") as f:
+        f.write(os.urandom(size))
+    os.utime(file_path, (mtime, mtime))
+
+
+class CompilerCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.build_dir = os.path.join(self.temp_dir.name, "build")
+
+        # the oldest entries come first
+        for index in range(4):
+            write_entry(self.build_dir, ".ccache/0/entry{}".format(index), 1024, 1000 + index)
+            write_entry(self.build_dir, ".sccache/0/entry{}".format(index), 1024, 1000 + index)
+
+        # trim by mtime even if ccache is installed here
+        self.which = mock.patch("compiler_cache.shutil.which", return_value=None)
+        self.which.start()
+
+    def tearDown(self):
+        self.which.stop()
+        self.temp_dir.cleanup()
+
+    def cache_files(self, cache_dir_name: str):
+        cache_dir = os.path.join(self.build_dir, cache_dir_name)
+        return sorted(os.path.relpath(path, cache_dir) for _, _, path in compiler_cache.get_cache_files(cache_dir))
+
+    def test_trim_removes_the_least_recently_used_entries(self):
+        with redirect_stdout(io.StringIO()):
+            compiler_cache.trim_cache(self.build_dir, 2048)
+
+        for cache_dir_name in compiler_cache.cache_dir_names:
+            self.assertEqual(self.cache_files(cache_dir_name), ["0/entry2", "0/entry3"])
+
+    def test_export_and_import(self):
+        bundle_path = os.path.join(self.temp_dir.name, "bundles", "cache.tar.gz")
+        with redirect_stdout(io.StringIO()):
+            compiler_cache.export_cache(self.build_dir, bundle_path, 6 * 1024)
+
+        # only the newest entries fit into the bundle
+        with tarfile.open(bundle_path) as bundle:
+            names = bundle.getnames()
+        self.assertEqual(len(names), 6)
+        self.assertNotIn(".ccache/0/entry0", names)
+        self.assertEqual(os.listdir(os.path.dirname(bundle_path)), ["cache.tar.gz"])
+
+        other_build_dir = os.path.join(self.temp_dir.name, "other_build")
+        with redirect_stdout(io.StringIO()):
+            self.assertTrue(compiler_cache.import_cache(other_build_dir, bundle_path))
+
+        for name in names:
+            with open(os.path.join(self.build_dir, name), "rb") as f, open(os.path.join(other_build_dir, name), "rb") as g:
+                self.assertEqual(f.read(), g.read())
+
+    def test_import_ignores_files_outside_of_the_caches(self):
+        bundle_path = os.path.join(self.temp_dir.name, "crafted.tar.gz")
+        with tarfile.open(bundle_path, "w:gz") as bundle:
+            for name in [".ccache/0/entry", "CMakeCache.txt", ".ccache/../../escaped", ".sccache/../CMakeCache.txt"]:
+                member = tarfile.TarInfo(name)
+                member.size = 4
+                bundle.addfile(member, io.BytesIO(b"data"))
+
+        other_build_dir = os.path.join(self.temp_dir.name, "other_build")
+        with redirect_stdout(io.StringIO()):
+            self.assertTrue(compiler_cache.import_cache(other_build_dir, bundle_path))
+
+        self.assertTrue(os.path.exists(os.path.join(other_build_dir, ".ccache", "0", "entry")))
+        self.assertFalse(os.path.exists(os.path.join(other_build_dir, "CMakeCache.txt")))
+        self.assertFalse(os.path.exists(os.path.join(self.temp_dir.name, "escaped")))
+
+    def test_import_without_a_bundle(self):
+        with redirect_stdout(io.StringIO()):
+            self.assertFalse(compiler_cache.import_cache(self.build_dir, os.path.join(self.temp_dir.name, "missing.tar.gz")))
+
+    def test_stats(self):
+        output = io.StringIO()
+        with redirect_stdout(output):
+            compiler_cache.show_stats(self.build_dir)
+
+        self.assertIn("4 files, 4.0 KB", output.getvalue())
+
+
+# records the arguments and the size limit of every ccache call
+fake_ccache = """#!{python}
+import json, os, sys
+with open(os.environ["FAKE_CCACHE_LOG"], "a") as f:
+    f.write(json.dumps([sys.argv[1:], os.environ.get("CCACHE_MAXSIZE")]) + "\\n")
+"""
+
+
+class CcacheTrimTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.build_dir = os.path.join(self.temp_dir.name, "build")
+        write_entry(self.build_dir, ".ccache/0/entry", 1024, 1000)
+
+        bin_dir = os.path.join(self.temp_dir.name, "bin")
+        os.makedirs(bin_dir)
+        ccache_path = os.path.join(bin_dir, "ccache")
+        with open(ccache_path, "w") as f:
+            f.write(fake_ccache.format(python=sys.executable))
+        os.chmod(ccache_path, os.stat(ccache_path).st_mode | stat.S_IXUSR)
+
+        self.log_file = os.path.join(self.temp_dir.name, "ccache_calls.log")
+        self.env = mock.patch.dict(os.environ, {
+            "PATH": bin_dir + os.pathsep + os.environ["PATH"],
+            "FAKE_CCACHE_LOG": self.log_file,
+        })
+        self.env.start()
+
+    def tearDown(self):
+        self.env.stop()
+        self.temp_dir.cleanup()
+
+    def test_trim_doesnt_store_the_limit(self):
+        with redirect_stdout(io.StringIO()):
+            compiler_cache.trim_cache(self.build_dir, 2 * 1024 * 1024)
+
+        with open(self.log_file) as f:
+            calls = [json.loads(line) for line in f]
+        self.assertEqual(calls, [[["--cleanup"], "2048k"]])
+
+
+if __name__ == "__main__":
+    unittest.main()
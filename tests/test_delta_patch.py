@@ -0,0 +1,120 @@
+import io
+import json
+import os
+import sys
+import tempfile
+import unittest
+import zipfile
+
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "utility_scripts"))
+
+import delta_patch
+
+
+def write_files(directory: str, files: dict):
+    for path, data in files.items():
+        file_path = os.path.join(directory, path)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open(file_path, "wb") as f:
+            f.write(data)
+
+
+def rewrite_paths(patch_path: str, new_dir: str, paths: dict):
+    # renames files in the manifest of a patch and keeps the tree hash consistent,
+    # like a crafted patch would
+    new_tree = {paths.get(path, path): value for path, value in delta_patch.read_tree(new_dir).items()}
+    with zipfile.ZipFile(patch_path, "r") as patch:
+        manifest = json.loads(patch.read("manifest.json"))
+        blobs = {name: patch.read(name) for name in patch.namelist() if name != "manifest.json"}
+
+    for entry in manifest["files"]:
+        entry["path"] = paths.get(entry["path"], entry["path"])
+    manifest["new_tree"] = delta_patch.get_tree_hash(new_tree)
+
+    with zipfile.ZipFile(patch_path, "w") as patch:
+        patch.writestr("manifest.json", json.dumps(manifest))
+        for name, data in blobs.items():
+            patch.writestr(name, data)
+
+
+class DeltaPatchTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.root = self.temp_dir.name
+        self.old_dir = os.path.join(self.root, "old")
+        self.new_dir = os.path.join(self.root, "new")
+        self.patch_path = os.path.join(self.root, "release.patch")
+
+        write_files(self.old_dir, {"game.pck": os.urandom(64 * 1024), "readme.txt": b"old"})
+        write_files(self.new_dir, {"game.pck": os.urandom(64 * 1024), "readme.txt": b"old", "data/new.txt": b"new"})
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_apply_recreates_the_new_export(self):
+        delta_patch.create_patch(self.old_dir, self.new_dir, self.patch_path)
+
+        output_dir = os.path.join(self.root, "output")
+        delta_patch.apply_patch(self.old_dir, self.patch_path, output_dir)
+
+        self.assertEqual(delta_patch.read_tree(output_dir), delta_patch.read_tree(self.new_dir))
+
+    def test_streamed_chunks_match_across_reads(self):
+        data = os.urandom(300 * 1024) + bytes(200 * 1024) + os.urandom(100 * 1024)
+        chunks = list(delta_patch.iter_chunks(io.BytesIO(data)))
+
+        with mock.patch("delta_patch.read_size", 5000):
+            self.assertEqual(list(delta_patch.iter_chunks(io.BytesIO(data))), chunks)
+        self.assertEqual([offset for offset, _ in chunks], [sum(len(chunk) for _, chunk in chunks[:index]) for index in range(len(chunks))])
+        self.assertEqual(b"".join(chunk for _, chunk in chunks), data)
+
+    def test_diffs_zip_exports(self):
+        old_data = os.urandom(512 * 1024)
+        old_zip = os.path.join(self.root, "old.zip")
+        new_zip = os.path.join(self.root, "new.zip")
+        with zipfile.ZipFile(old_zip, "w") as archive:
+            archive.writestr("game.pck", old_data)
+        with zipfile.ZipFile(new_zip, "w") as archive:
+            archive.writestr("game.pck", old_data[:100 * 1024] + b"inserted" + old_data[100 * 1024:])
+
+        # the files are read in small blocks, so the chunks span several reads
+        with mock.patch("delta_patch.read_size", 16 * 1024):
+            stats = delta_patch.create_patch(old_zip, new_zip, self.patch_path)
+            output_zip = os.path.join(self.root, "output.zip")
+            delta_patch.apply_patch(old_zip, self.patch_path, output_zip)
+
+        self.assertEqual(stats["diffed"], 1)
+        self.assertLess(stats["diffed_bytes"], 16 * 1024)
+        self.assertEqual(delta_patch.read_tree(output_zip), delta_patch.read_tree(new_zip))
+
+    def test_rejects_paths_outside_of_the_output(self):
+        delta_patch.create_patch(self.old_dir, self.new_dir, self.patch_path)
+
+        for unsafe_path in ["../escaped.txt", "data/../../escaped.txt", "/tmp/escaped.txt", "C:/escaped.txt", "..\\escaped.txt"]:
+            with self.subTest(path=unsafe_path):
+                rewrite_paths(self.patch_path, self.new_dir, {"data/new.txt": unsafe_path})
+                output_dir = os.path.join(self.root, "output")
+
+                with self.assertRaises(ValueError):
+                    delta_patch.apply_patch(self.old_dir, self.patch_path, output_dir)
+                with self.assertRaises(ValueError):
+                    delta_patch.apply_patch(self.old_dir, self.patch_path, output_dir + ".zip")
+
+                self.assertFalse(os.path.exists(os.path.join(self.root, "escaped.txt")))
+                self.assertFalse(os.path.exists(output_dir))
+                self.assertFalse(os.path.exists(output_dir + ".zip"))
+
+                # the next case starts from the original paths again
+                delta_patch.create_patch(self.old_dir, self.new_dir, self.patch_path)
+
+    def test_safe_paths(self):
+        self.assertTrue(delta_patch.is_safe_path("data/new.txt"))
+        self.assertTrue(delta_patch.is_safe_path("openchamp..x86_64"))
+        self.assertFalse(delta_patch.is_safe_path(""))
+        self.assertFalse(delta_patch.is_safe_path("data/../../x"))
+
+
+if __name__ == "__main__":
+    unittest.main()
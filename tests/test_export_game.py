@@ -0,0 +1,28 @@
+import os
+import subprocess
+import sys
+import unittest
+
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "utility_scripts"))
+
+import export_game
+
+
+class GodotReleaseTest(unittest.TestCase):
+    def get_release(self, version: str):
+        version_output = subprocess.CompletedProcess([], 0, stdout=version.encode() + b"\n")
+        with mock.patch("export_game.subprocess.run", return_value=version_output):
+            return export_game.get_godot_release("godot")
+
+    def test_release_tags(self):
+        self.assertEqual(self.get_release("4.3.stable.official.77dcf97d8"), ("4.3-stable", False))
+        self.assertEqual(self.get_release("4.3.1.rc2.official.77dcf97d8"), ("4.3.1-rc2", False))
+        self.assertEqual(self.get_release("4.3.stable.official.123456789"), ("4.3-stable", False))
+        self.assertEqual(self.get_release("4.3.stable.mono.official.77dcf97d8"), ("4.3-stable", True))
+        self.assertEqual(self.get_release("4.3.stable.custom_build.123456"), ("4.3-stable", False))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+import io
+import os
+import sys
+import tempfile
+import unittest
+import xml.etree.ElementTree as ElementTree
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "utility_scripts"))
+
+import gdscript_docs
+
+effect_script = '''class_name Effect
+extends Resource
+## Something an ability does.
+##
+## Effects are applied in order.
+## @tutorial(Abilities): https://example.com/abilities
+
+enum Kind { INSTANT, OVER_TIME = 4, AURA }
+
+## The kind of the effect.
+@export var kind: Kind = Kind.INSTANT
+var targets: Array[Node] = []
+var _cache := {}
+
+
+## Applies the effect.
+func apply(target: Node, text: String = "a ) b", values = {"k": ")"}, order: Array[Kind] = []) -> Error:
+	return OK
+
+
+func get_kind() -> Effect.Kind:
+	return kind
+
+
+static func get_mode(node: Node) -> Node.ProcessMode:
+	return node.process_mode
+
+
+signal applied(target: Node, kind: Kind)
+'''
+
+ability_script = '''class_name Ability
+extends Resource
+
+var effects: Array[Effect] = []
+
+
+func get_effect_kind(effect: Effect) -> Effect.Kind:
+	return effect.kind
+'''
+
+
+def parse(source: str) -> dict:
+    return gdscript_docs.parse_script(io.StringIO(source), "res://scripts/test.gd")
+
+
+class GDScriptDocsTest(unittest.TestCase):
+    def test_signatures_with_strings(self):
+        method = next(method for method in parse(effect_script)["methods"] if method["name"] == "apply")
+
+        self.assertEqual([parameter["name"] for parameter in method["parameters"]], ["target", "text", "values", "order"])
+        self.assertEqual(method["parameters"][1]["default"], '"a ) b"')
+        self.assertEqual(method["parameters"][2]["default"], '{"k": ")"}')
+        self.assertEqual(method["return"], "Error")
+
+    def test_class_doc_and_private_members(self):
+        doc = parse(effect_script)
+
+        self.assertEqual(doc["name"], "Effect")
+        self.assertEqual(doc["inherits"], "Resource")
+        self.assertEqual(doc["brief_description"], "Something an ability does.")
+        self.assertEqual(doc["description"], "Effects are applied in order.")
+        self.assertEqual(doc["tutorials"], [("Abilities", "https://example.com/abilities")])
+        self.assertEqual([member["name"] for member in doc["members"]], ["kind", "targets"])
+        self.assertEqual([(constant["name"], constant["value"]) for constant in doc["constants"]], [
+            ("INSTANT", "0"), ("OVER_TIME", "4"), ("AURA", "5"),
+        ])
+
+    def test_types_are_written_like_doctool(self):
+        script_enums = {"Effect": ["Kind"]}
+        resolve = lambda type_name: gdscript_docs.resolve_type(type_name, "Effect", ["Kind"], script_enums)
+
+        self.assertEqual(resolve("Kind"), ("int", "Effect.Kind"))
+        self.assertEqual(resolve("Effect.Kind"), ("int", "Effect.Kind"))
+        self.assertEqual(resolve("Array[Kind]"), ("int[]", "Effect.Kind"))
+        self.assertEqual(resolve("Array[Node]"), ("Node[]", ""))
+        self.assertEqual(resolve("Node.ProcessMode"), ("int", "Node.ProcessMode"))
+        self.assertEqual(resolve("Error"), ("int", "Error"))
+        self.assertEqual(resolve("Effect.Inner"), ("Effect.Inner", ""))
+        self.assertEqual(resolve("Array"), ("Array", ""))
+
+    def test_extract_directory(self):
+        with tempfile.TemporaryDirectory() as project_dir:
+            for path, source in [("scripts/effects/effect.gd", effect_script), ("scripts/abilities/ability.gd", ability_script)]:
+                os.makedirs(os.path.dirname(os.path.join(project_dir, path)), exist_ok=True)
+                with open(os.path.join(project_dir, path), "w", encoding="utf-8") as f:
+                    f.write(source)
+
+            # the enum of a script in another directory is still known
+            output_dir = os.path.join(project_dir, "docs")
+            os.makedirs(output_dir)
+            self.assertEqual(gdscript_docs.extract_directory(project_dir, "scripts/abilities", output_dir), ["Ability.xml"])
+            self.assertEqual(gdscript_docs.extract_directory(project_dir, "scripts/effects", output_dir), ["Effect.xml"])
+
+            ability = ElementTree.parse(os.path.join(output_dir, "Ability.xml")).getroot()
+            method = ability.find("methods/method[@name='get_effect_kind']")
+            self.assertEqual(method.find("return").attrib, {"type": "int", "enum": "Effect.Kind"})
+            self.assertEqual(ability.find("members/member[@name='effects']").get("type"), "Effect[]")
+
+            effect = ElementTree.parse(os.path.join(output_dir, "Effect.xml")).getroot()
+            apply = effect.find("methods/method[@name='apply']")
+            self.assertEqual(apply.find("return").attrib, {"type": "int", "enum": "Error"})
+            self.assertEqual(apply.find("param[@name='values']").get("default"), '{"k": ")"}')
+            self.assertEqual(apply.find("param[@name='order']").attrib["type"], "int[]")
+            self.assertEqual(effect.find("members/member[@name='kind']").get("enum"), "Effect.Kind")
+            self.assertEqual(effect.find("signals/signal/param[@name='kind']").get("enum"), "Effect.Kind")
+            self.assertEqual(effect.find("methods/method[@name='get_mode']").get("qualifiers"), "static")
+
+
+if __name__ == "__main__":
+    unittest.main()
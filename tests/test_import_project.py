@@ -0,0 +1,150 @@
+import glob
+import json
+import os
+import shutil
+import stat
+import subprocess
+import sys
+import tempfile
+import unittest
+
+utility_scripts_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "utility_scripts")
+
+# A fake godot editor. A pass imports the .png files and the .glb files whose textures were
+# imported before the pass started, like godot does for scenes that reference textures
+# imported in the same run. Fonts get no .import file, so godot skips them.
+fake_godot = """#!{python}
+import glob, hashlib, json, os, sys
+
+if "--version" in sys.argv:
+    print("4.3.stable.fake")
+    sys.exit(0)
+
+with open("godot_runs.txt", "a") as f:
+    f.write("run\\n")
+
+def textures_imported():
+    return all(os.path.exists(png + ".import") for png in glob.glob("assets/*.png"))
+
+def import_asset(asset):
+    with open(asset, "rb") as f:
+        md5 = hashlib.md5(f.read()).hexdigest()
+    dest_base = ".godot/imported/{{}}-{{}}".format(os.path.basename(asset), "0" * 32)
+    os.makedirs(".godot/imported", exist_ok=True)
+    with open(dest_base + ".ctex", "w") as f:
+        f.write("imported")
+    with open(dest_base + ".md5", "w") as f:
+        f.write('source_md5="{{}}"\\n'.format(md5))
+    with open(asset + ".import", "w") as f:
+        f.write('[remap]\\nimporter="texture"\\n[deps]\\ndest_files={{}}\\n'.format(json.dumps(["res://" + dest_base + ".ctex"])))
+
+glb_ready = textures_imported()
+for asset in sorted(glob.glob("assets/*.png")):
+    import_asset(asset)
+for asset in sorted(glob.glob("assets/*.glb")):
+    if glb_ready:
+        import_asset(asset)
+    elif not os.path.exists(asset + ".import"):
+        # the import failed, the .import file is written without the outputs
+        with open(asset + ".import", "w") as f:
+            f.write('[remap]\\nimporter="scene"\\n[deps]\\ndest_files=["res://.godot/imported/missing.scn"]\\n')
+
+os.makedirs(".godot/editor", exist_ok=True)
+open(".godot/editor/filesystem_cache8", "w").close()
+sys.exit(int(os.environ.get("FAKE_GODOT_EXIT", "0")))
+"""
+
+
+class ImportProjectTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.project_dir = os.path.join(self.temp_dir.name, "project")
+
+        os.makedirs(os.path.join(self.project_dir, "utility_scripts"))
+        shutil.copy(os.path.join(utility_scripts_dir, "import_project.py"), os.path.join(self.project_dir, "utility_scripts"))
+
+        os.makedirs(os.path.join(self.project_dir, "assets"))
+        for asset in ["icon.png", "tree.png", "tree.glb", "font.ttf"]:
+            with open(os.path.join(self.project_dir, "assets", asset), "wb") as f:
+                f.write(os.urandom(64))
+
+        self.godot_path = os.path.join(self.temp_dir.name, "godot")
+        with open(self.godot_path, "w") as f:
+            f.write(fake_godot.format(python=sys.executable))
+        os.chmod(self.godot_path, os.stat(self.godot_path).st_mode | stat.S_IXUSR)
+
+        self.snapshot_dir = os.path.join(self.temp_dir.name, "snapshots")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def run_import(self, *args, env=None) -> subprocess.CompletedProcess:
+        return subprocess.run(
+            [
+                sys.executable, os.path.join(self.project_dir, "utility_scripts", "import_project.py"),
+                "--godot_path", self.godot_path, "--snapshot_dir", self.snapshot_dir, *args,
+            ],
+            cwd=self.project_dir, capture_output=True, env={**os.environ, **(env or {})},
+        )
+
+    def godot_runs(self) -> int:
+        try:
+            with open(os.path.join(self.project_dir, "godot_runs.txt")) as f:
+                return len(f.readlines())
+        except OSError:
+            return 0
+
+    def manifest(self) -> dict:
+        with open(os.path.join(self.project_dir, ".godot", "imported", "asset_manifest.json")) as f:
+            return json.load(f)["assets"]
+
+    def test_reruns_godot_while_it_makes_progress(self):
+        result = self.run_import()
+
+        self.assertEqual(result.returncode, 0, result.stdout.decode())
+        self.assertTrue(os.path.exists(os.path.join(self.project_dir, "assets", "tree.glb.import")))
+        self.assertEqual(self.godot_runs(), 2)
+
+        manifest = self.manifest()
+        self.assertTrue(manifest["assets/font.ttf"].get("unimported"))
+        self.assertFalse(manifest["assets/tree.glb"].get("unimported"))
+
+        # nothing changed, so godot isn't started again
+        self.assertEqual(self.run_import().returncode, 0)
+        self.assertEqual(self.godot_runs(), 2)
+
+    def test_exact_snapshots_need_no_godot_run(self):
+        self.assertEqual(self.run_import("--save_snapshot").returncode, 0)
+        self.assertEqual(self.godot_runs(), 2)
+
+        # a fresh checkout of the same assets
+        shutil.rmtree(os.path.join(self.project_dir, ".godot"))
+        for import_file in glob.glob(os.path.join(self.project_dir, "assets", "*.import")):
+            os.remove(import_file)
+
+        result = self.run_import("--restore_snapshot")
+        self.assertEqual(result.returncode, 0, result.stdout.decode())
+        self.assertEqual(self.godot_runs(), 2)
+        self.assertTrue(os.path.exists(os.path.join(self.project_dir, "assets", "tree.glb.import")))
+        self.assertTrue(self.manifest()["assets/font.ttf"].get("unimported"))
+
+    def test_fails_if_importable_assets_are_missing(self):
+        result = self.run_import("--max_attempts", "1")
+
+        self.assertEqual(result.returncode, 1)
+        self.assertNotIn("assets/tree.glb", self.manifest())
+        self.assertFalse(os.path.exists(self.snapshot_dir))
+
+        # the next run picks up the missing asset
+        self.assertEqual(self.run_import().returncode, 0)
+        self.assertIn("assets/tree.glb", self.manifest())
+
+    def test_crashes_are_not_recorded_as_skipped(self):
+        result = self.run_import("--max_attempts", "1", env={"FAKE_GODOT_EXIT": "1"})
+
+        self.assertEqual(result.returncode, 1)
+        self.assertNotIn("assets/font.ttf", self.manifest())
+
+
+if __name__ == "__main__":
+    unittest.main()
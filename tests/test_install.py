@@ -0,0 +1,267 @@
+import hashlib
+import io
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+import zipfile
+
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import install
+from http_server import LocalServer
+
+
+def create_extension_zip(files: dict) -> bytes:
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as zip_ref:
+        for name, data in files.items():
+            zip_ref.writestr(name, data)
+    return archive.getvalue()
+
+
+def create_checkout(directory: str, tag: str):
+    # a checkout of a github repository with the tag the extension is downloaded for
+    git = ["git", "-c", "user.name=test", "-c", "user.email=test@example.com"]
+    subprocess.run([*git, "init", "-q", directory], check=True)
+    subprocess.run([*git, "commit", "-q", "--allow-empty", "-m", "release"], cwd=directory, check=True)
+    subprocess.run([*git, "tag", tag], cwd=directory, check=True)
+    subprocess.run([*git, "remote", "add", "origin", "https://github.com/openchamp/client.git"], cwd=directory, check=True)
+
+
+def store_entries(cache_dir: str, worker: int, count: int):
+    for entry in range(count):
+        data = os.urandom(1024)
+        file_path = os.path.join(cache_dir, "..", "download_{}_{}".format(worker, entry))
+        with open(file_path, "wb") as file:
+            file.write(data)
+
+        entry_key = install.get_cache_key("https://api.github.com/repos/a/b", "v{}.{}".format(worker, entry), "extension.zip")
+        install.cache_store(cache_dir, entry_key, file_path, hashlib.sha256(data).hexdigest(), 1024 * 1024 * 1024)
+
+
+def die_holding_the_lock(cache_dir: str):
+    with install.cache_index_lock(cache_dir):
+        os._exit(0)
+
+
+class ArtifactCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache_dir = os.path.join(self.temp_dir.name, "cache")
+        os.makedirs(self.cache_dir)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_entries_are_keyed_by_the_full_url(self):
+        fork_key = install.get_cache_key("https://api.github.com/repos/fork/b", "v1", "extension.zip")
+        upstream_key = install.get_cache_key("https://api.github.com/repos/a/b", "v1", "extension.zip")
+
+        file_path = os.path.join(self.temp_dir.name, "download")
+        with open(file_path, "wb") as file:
+            file.write(b"fork build")
+        install.cache_store(self.cache_dir, fork_key, file_path, hashlib.sha256(b"fork build").hexdigest(), 1024 * 1024)
+
+        self.assertIsNotNone(install.cache_lookup(self.cache_dir, fork_key))
+        self.assertIsNone(install.cache_lookup(self.cache_dir, upstream_key))
+
+    def test_concurrent_installs_keep_every_entry(self):
+        workers = [
+            multiprocessing.Process(target=store_entries, args=(self.cache_dir, worker, 10))
+            for worker in range(6)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+            self.assertEqual(worker.exitcode, 0)
+
+        index = install.load_cache_index(self.cache_dir)
+        self.assertEqual(len(index["entries"]), 60)
+        self.assertEqual(len(index["blobs"]), 60)
+        self.assertEqual(sorted(os.listdir(self.cache_dir)), ["blobs", "index.json", "index.lock"])
+
+    def test_killed_installs_release_the_lock(self):
+        worker = multiprocessing.Process(target=die_holding_the_lock, args=(self.cache_dir,))
+        worker.start()
+        worker.join()
+
+        store_entries(self.cache_dir, 0, 1)
+        self.assertEqual(len(install.load_cache_index(self.cache_dir)["entries"]), 1)
+
+    def test_corrupted_blobs_are_dropped(self):
+        data = b"extension"
+        digest = hashlib.sha256(data).hexdigest()
+        entry_key = install.get_cache_key("https://api.github.com/repos/a/b", "v1", "extension.zip")
+
+        file_path = os.path.join(self.temp_dir.name, "download")
+        with open(file_path, "wb") as file:
+            file.write(data)
+        blob = install.cache_store(self.cache_dir, entry_key, file_path, digest, 1024 * 1024)
+
+        with open(blob, "wb") as file:
+            file.write(b"corrupted")
+
+        self.assertIsNone(install.cache_lookup(self.cache_dir, entry_key))
+        self.assertNotIn(digest, install.load_cache_index(self.cache_dir)["blobs"])
+
+
+class ExtensionDownloadTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.checkout_dir = os.path.join(self.temp_dir.name, "checkout")
+        self.cache_dir = os.path.join(self.temp_dir.name, "cache")
+        create_checkout(self.checkout_dir, "v1.0")
+
+        self.previous_dir = os.getcwd()
+        os.chdir(self.checkout_dir)
+
+        self.files = {
+            "bin/libopenchamp.linux.template_debug.x86_64.so": os.urandom(300 * 1024),
+            "bin/libopenchamp.linux.template_release.x86_64.so": os.urandom(200 * 1024),
+        }
+        self.archive = create_extension_zip(self.files)
+
+        self.server = LocalServer().__enter__()
+        self.download_path = "/download/v1.0/extension.zip"
+        self.server.add_file(self.download_path, self.archive)
+        self.publish_release(hashlib.sha256(self.archive).hexdigest())
+
+    def tearDown(self):
+        self.server.__exit__()
+        os.chdir(self.previous_dir)
+        self.temp_dir.cleanup()
+
+    def publish_release(self, sha256: str):
+        self.server.add_json("/repos/openchamp/client/releases/tags/v1.0", {
+            "tag_name": "v1.0",
+            "assets": [{
+                "name": "extension.zip",
+                "digest": "sha256:" + sha256,
+                "browser_download_url": self.server.url + self.download_path,
+            }],
+        })
+
+    def install(self) -> bool:
+        with mock.patch("install.time.sleep"):
+            return install.download_and_install_extension(self.server.url, self.cache_dir, 1024 * 1024 * 1024)
+
+    def assert_installed(self):
+        for name, data in self.files.items():
+            with open(name, "rb") as file:
+                self.assertEqual(file.read(), data)
+
+    def test_downloads_verifies_and_installs(self):
+        self.assertTrue(self.install())
+        self.assert_installed()
+
+        # the next install is served from the cache without any request
+        self.server.requests.clear()
+        for name in self.files:
+            os.remove(name)
+        self.assertTrue(self.install())
+        self.assert_installed()
+        self.assertEqual(self.server.requests, [])
+
+    def test_resumes_a_dropped_download(self):
+        self.server.drop_after[self.download_path] = 150 * 1024
+
+        self.assertTrue(self.install())
+        self.assert_installed()
+
+        ranges = self.server.range_requests(self.download_path)
+        self.assertEqual(len(ranges), 1)
+        self.assertGreater(int(ranges[0].removeprefix("bytes=").rstrip("-")), 0)
+
+    def test_restarts_if_the_server_ignores_ranges(self):
+        self.server.drop_after[self.download_path] = 150 * 1024
+        self.server.ignore_range = True
+
+        self.assertTrue(self.install())
+        self.assert_installed()
+
+    def test_rejects_a_checksum_mismatch(self):
+        self.publish_release("0" * 64)
+
+        self.assertFalse(self.install())
+        for name in self.files:
+            self.assertFalse(os.path.exists(name))
+
+        downloads_dir = os.path.join(self.cache_dir, "downloads")
+        self.assertEqual([file for file in os.listdir(downloads_dir) if file.endswith(".part")], [])
+
+    def test_resumes_from_a_partial_file(self):
+        destination = os.path.join(self.temp_dir.name, "extension.zip")
+        with open(destination + ".part", "wb") as file:
+            file.write(self.archive[:100 * 1024])
+
+        session = install.create_session()
+        digest = install.download_file(
+            session, self.server.url + self.download_path, destination, hashlib.sha256(self.archive).hexdigest()
+        )
+
+        self.assertEqual(digest, hashlib.sha256(self.archive).hexdigest())
+        self.assertEqual(self.server.range_requests(self.download_path), ["bytes={}-".format(100 * 1024)])
+        with open(destination, "rb") as file:
+            self.assertEqual(file.read(), self.archive)
+
+
+class DeltaInstallTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.previous_dir = os.getcwd()
+        os.chdir(self.temp_dir.name)
+
+    def tearDown(self):
+        os.chdir(self.previous_dir)
+        self.temp_dir.cleanup()
+
+    def install(self, files: dict, delta: bool = True):
+        zip_path = os.path.join(self.temp_dir.name, "extension.zip")
+        with open(zip_path, "wb") as file:
+            file.write(create_extension_zip(files))
+        install.install_extension_archive(zip_path, "extension.zip.staging", delta=delta)
+
+    def test_only_changed_files_are_rewritten(self):
+        files = {"bin/unchanged.so": os.urandom(4096), "bin/changed.so": os.urandom(4096)}
+        self.install(files)
+
+        # an old mtime shows whether a file was written again
+        for name in files:
+            os.utime(name, (1000, 1000))
+
+        files["bin/changed.so"] = os.urandom(4096)
+        files["bin/added.so"] = b"new"
+        self.install(files)
+
+        self.assertEqual(os.path.getmtime("bin/unchanged.so"), 1000)
+        self.assertNotEqual(os.path.getmtime("bin/changed.so"), 1000)
+        for name, data in files.items():
+            with open(name, "rb") as file:
+                self.assertEqual(file.read(), data)
+        self.assertFalse(os.path.exists("extension.zip.staging"))
+
+    def test_full_mode_rewrites_everything(self):
+        files = {"bin/unchanged.so": os.urandom(4096)}
+        self.install(files)
+        os.utime("bin/unchanged.so", (1000, 1000))
+
+        self.install(files, delta=False)
+
+        self.assertNotEqual(os.path.getmtime("bin/unchanged.so"), 1000)
+
+    def test_same_size_changes_are_detected(self):
+        self.install({"bin/library.so": b"a" * 100})
+        self.install({"bin/library.so": b"b" * 100})
+
+        with open("bin/library.so", "rb") as file:
+            self.assertEqual(file.read(), b"b" * 100)
+
+
+if __name__ == "__main__":
+    unittest.main()
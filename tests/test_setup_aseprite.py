@@ -0,0 +1,46 @@
+import io
+import os
+import sys
+import tempfile
+import unittest
+import zipfile
+
+from contextlib import redirect_stdout
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "utility_scripts"))
+
+import setup_aseprite
+
+
+class SkiaDownloadTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache_dir = os.path.join(self.temp_dir.name, "skia")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def get_skia(self, response: bytes) -> str | None:
+        with mock.patch("setup_aseprite.urllib.request.urlopen", return_value=io.BytesIO(response)):
+            with redirect_stdout(io.StringIO()):
+                return setup_aseprite.get_skia(self.cache_dir, "m102", "Skia-Linux-Release-x64-libstdc++")
+
+    def test_extracts_into_the_cache(self):
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, "w") as zip_ref:
+            zip_ref.writestr("out/Release-x64/libskia.a", b"skia")
+
+        skia_dir = self.get_skia(archive.getvalue())
+
+        self.assertEqual(skia_dir, os.path.join(self.cache_dir, "m102-Skia-Linux-Release-x64-libstdc++"))
+        self.assertTrue(os.path.exists(os.path.join(skia_dir, "out", "Release-x64", "libskia.a")))
+        self.assertEqual(os.listdir(self.cache_dir), [os.path.basename(skia_dir)])
+
+    def test_invalid_downloads_leave_nothing_behind(self):
+        self.assertIsNone(self.get_skia(b"<html>rate limited</html>"))
+        self.assertEqual(os.listdir(self.cache_dir), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,146 @@
+import hashlib
+import io
+import os
+import sys
+import tempfile
+import unittest
+import zipfile
+
+from contextlib import redirect_stdout
+from unittest import mock
+
+tests_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(tests_dir, "..", ".github", "actions", "setup_godot"))
+
+import setup_godot
+from http_server import LocalServer
+
+godot_version = "4.3-stable"
+release_path = "/releases/download/" + godot_version
+editor_zip = "Godot_v{}_linux.x86_64.zip".format(godot_version)
+templates_zip = "Godot_v{}_export_templates.tpz".format(godot_version)
+
+
+def create_zip(files: dict) -> bytes:
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as zip_ref:
+        for name, data in files.items():
+            zip_ref.writestr(name, data)
+    return archive.getvalue()
+
+
+@unittest.skipUnless(sys.platform == "linux", "the test release only has a linux editor")
+class SetupGodotTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.install_dir = os.path.join(self.temp_dir.name, "installs")
+        self.template_root = os.path.join(self.temp_dir.name, "templates")
+        self.template_dir = os.path.join(self.template_root, godot_version.replace("-", "."))
+
+        self.editor = create_zip({"Godot_v{}_linux.x86_64".format(godot_version): os.urandom(256 * 1024)})
+        self.templates = create_zip({
+            "templates/version.txt": b"4.3.stable",
+            "templates/linux_debug.x86_64": os.urandom(64 * 1024),
+            "templates/linux_release.x86_64": os.urandom(64 * 1024),
+            "templates/linux_release.arm64": os.urandom(64 * 1024),
+            "templates/windows_release_x86_64.exe": os.urandom(64 * 1024),
+            "templates/windows_release_arm64.exe": os.urandom(64 * 1024),
+            "templates/macos.zip": os.urandom(64 * 1024),
+        })
+
+        self.server = LocalServer().__enter__()
+        self.server.add_file(release_path + "/" + editor_zip, self.editor)
+        self.server.add_file(release_path + "/" + templates_zip, self.templates)
+        self.publish_checksums(hashlib.sha512(self.editor).hexdigest(), hashlib.sha512(self.templates).hexdigest())
+
+        self.sleep = mock.patch("setup_godot.time.sleep")
+        self.sleep.start()
+
+    def tearDown(self):
+        self.sleep.stop()
+        self.server.__exit__()
+        self.temp_dir.cleanup()
+
+    def publish_checksums(self, editor_sha512: str, templates_sha512: str):
+        sums = "{}  {}\n{}  {}\n".format(editor_sha512, editor_zip, templates_sha512, templates_zip)
+        self.server.add_file(release_path + "/SHA512-SUMS.txt", sums.encode())
+
+    def run_setup(self, action: str = "download", export_platforms=None, offline: bool = False) -> int:
+        with redirect_stdout(io.StringIO()):
+            return setup_godot.main({
+                "godot_repo": self.server.url,
+                "godot_version": godot_version,
+                "install_dir": self.install_dir,
+                "export_template_dir": self.template_root,
+                "allow_unverified": False,
+                "export_platforms": export_platforms or [],
+                "offline": offline,
+                "action": action,
+            })
+
+    def download_requests(self):
+        return [path for path, _ in self.server.requests if path.endswith((editor_zip, templates_zip))]
+
+    def test_installs_and_verifies(self):
+        self.assertEqual(self.run_setup(), 0)
+
+        godot_installs_dir = os.path.join(self.install_dir, godot_version)
+        self.assertTrue(os.path.exists(os.path.join(godot_installs_dir, "Godot_v{}_linux.x86_64".format(godot_version))))
+        self.assertTrue(os.path.exists(os.path.join(godot_installs_dir, setup_godot.install_marker_name)))
+        self.assertEqual(
+            sorted(os.listdir(self.template_dir)),
+            [
+                "linux_debug.x86_64", "linux_release.arm64", "linux_release.x86_64", "macos.zip", "version.txt",
+                "windows_release_arm64.exe", "windows_release_x86_64.exe",
+            ],
+        )
+
+        # the second run needs no network
+        self.server.requests.clear()
+        self.assertEqual(self.run_setup(), 0)
+        self.assertEqual(self.server.requests, [])
+
+    def test_rejects_a_checksum_mismatch(self):
+        self.publish_checksums("0" * 128, hashlib.sha512(self.templates).hexdigest())
+
+        self.assertEqual(self.run_setup(), 1)
+
+        godot_installs_dir = os.path.join(self.install_dir, godot_version)
+        self.assertFalse(os.path.exists(os.path.join(godot_installs_dir, setup_godot.install_marker_name)))
+        download_dir = setup_godot.get_download_dir(godot_installs_dir)
+        self.assertNotIn(editor_zip, os.listdir(download_dir))
+        self.assertNotIn(editor_zip + ".part", os.listdir(download_dir))
+
+    def test_resumes_a_dropped_download(self):
+        self.server.drop_after[release_path + "/" + editor_zip] = 100 * 1024
+
+        self.assertEqual(self.run_setup(), 0)
+
+        ranges = self.server.range_requests(release_path + "/" + editor_zip)
+        self.assertEqual(ranges, ["bytes={}-".format(100 * 1024)])
+
+    def test_only_the_wanted_templates_are_extracted(self):
+        self.assertEqual(self.run_setup("templates", ["linux_amd64"]), 0)
+
+        self.assertEqual(sorted(os.listdir(self.template_dir)), ["linux_debug.x86_64", "linux_release.x86_64", "version.txt"])
+        self.assertNotIn(release_path + "/" + editor_zip, self.download_requests())
+
+    def test_offline_templates_come_from_the_cached_archive(self):
+        self.assertEqual(self.run_setup("templates", ["linux_amd64"]), 0)
+
+        self.server.requests.clear()
+        self.assertEqual(self.run_setup("templates", ["macos"], offline=True), 0)
+
+        self.assertIn("macos.zip", os.listdir(self.template_dir))
+        self.assertEqual(self.server.requests, [])
+
+    def test_offline_without_a_cache_creates_nothing(self):
+        self.assertEqual(self.run_setup("templates", offline=True), 1)
+
+        self.assertFalse(os.path.exists(self.install_dir))
+        self.assertFalse(os.path.exists(self.template_root))
+        self.assertEqual(self.server.requests, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
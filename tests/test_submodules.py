@@ -0,0 +1,106 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import install
+
+git = ["git", "-c", "user.name=test", "-c", "user.email=test@example.com", "-c", "protocol.file.allow=always"]
+
+
+def run_git(*args, cwd=None) -> str:
+    return subprocess.run([*git, *args], cwd=cwd, check=True, capture_output=True).stdout.decode().strip()
+
+
+def create_bare_repo(root: str, name: str, commits: int) -> str:
+    # a bare repository with a few commits, served with file:// so shallow clones work
+    work_dir = os.path.join(root, name + "_work")
+    run_git("init", "-q", work_dir)
+    for commit in range(commits):
+        with open(os.path.join(work_dir, "file.txt"), "w") as file:
+            file.write("{} {}\n".format(name, commit))
+        run_git("add", "file.txt", cwd=work_dir)
+        run_git("commit", "-q", "-m", "commit {}".format(commit), cwd=work_dir)
+
+    bare_dir = os.path.join(root, name + ".git")
+    run_git("clone", "-q", "--bare", work_dir, bare_dir)
+    return bare_dir
+
+
+class SubmoduleUpdateTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        root = self.temp_dir.name
+
+        # the submodules are fetched with file:// urls, which git only allows when asked to
+        self.env = mock.patch.dict(os.environ, {
+            "GIT_CONFIG_COUNT": "1",
+            "GIT_CONFIG_KEY_0": "protocol.file.allow",
+            "GIT_CONFIG_VALUE_0": "always",
+        })
+        self.env.start()
+
+        self.remotes = {name: create_bare_repo(root, name, 5) for name in ["godot-cpp", "default_assets"]}
+
+        project_work = os.path.join(root, "project_work")
+        run_git("init", "-q", project_work)
+        run_git("submodule", "add", "-q", "file://" + self.remotes["godot-cpp"], "extensions/godot-cpp", cwd=project_work)
+        run_git("submodule", "add", "-q", "file://" + self.remotes["default_assets"], "default_assets", cwd=project_work)
+        run_git("commit", "-q", "-m", "add submodules", cwd=project_work)
+
+        # a fresh clone without the submodules
+        self.project_dir = os.path.join(root, "project")
+        run_git("clone", "-q", project_work, self.project_dir)
+
+        self.previous_dir = os.getcwd()
+        os.chdir(self.project_dir)
+
+    def tearDown(self):
+        os.chdir(self.previous_dir)
+        self.env.stop()
+        self.temp_dir.cleanup()
+
+    def commit_count(self, path: str) -> int:
+        return int(run_git("rev-list", "--count", "HEAD", cwd=path))
+
+    def test_full_update(self):
+        self.assertTrue(install.update_submodules(jobs=2))
+
+        for path in ["extensions/godot-cpp", "default_assets"]:
+            self.assertTrue(os.path.exists(os.path.join(path, "file.txt")))
+            self.assertEqual(self.commit_count(path), 5)
+
+    def test_shallow_and_partial_update(self):
+        self.assertTrue(install.update_submodules(jobs=2, depth=1, filter_spec="blob:none"))
+
+        for path in ["extensions/godot-cpp", "default_assets"]:
+            self.assertTrue(os.path.exists(os.path.join(path, "file.txt")))
+            self.assertEqual(self.commit_count(path), 1)
+            self.assertEqual(run_git("config", "remote.origin.partialclonefilter", cwd=path), "blob:none")
+
+    def test_reference_mirror(self):
+        reference_dir = os.path.join(self.temp_dir.name, "mirrors")
+        os.makedirs(reference_dir)
+        run_git("clone", "-q", "--mirror", self.remotes["godot-cpp"], os.path.join(reference_dir, "godot-cpp.git"))
+
+        self.assertTrue(install.update_submodules(reference_dir=reference_dir))
+
+        alternates = os.path.join(".git", "modules", "extensions", "godot-cpp", "objects", "info", "alternates")
+        self.assertTrue(os.path.exists(alternates))
+        self.assertFalse(os.path.exists(os.path.join(".git", "modules", "default_assets", "objects", "info", "alternates")))
+
+    def test_failed_submodule(self):
+        run_git("config", "--file", ".gitmodules", "submodule.default_assets.url", "file:///nonexistent/default_assets.git")
+        run_git("submodule", "sync", "-q")
+
+        self.assertFalse(install.update_submodules(jobs=2))
+        self.assertTrue(os.path.exists(os.path.join("extensions", "godot-cpp", "file.txt")))
+
+
+if __name__ == "__main__":
+    unittest.main()
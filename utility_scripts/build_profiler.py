@@ -0,0 +1,283 @@
+import json
+import os
+import shutil
+import subprocess
+import time
+
+from typing import Dict, List, Tuple
+
+
+# the profile reports and the history are kept in the build dir
+profile_dir_name = "build_profile"
+
+
+def get_ninja_log_size(build_dir: str) -> int:
+    try:
+        return os.path.getsize(os.path.join(build_dir, ".ninja_log"))
+    except OSError:
+        return 0
+
+
+def read_ninja_log(build_dir: str, start_offset: int = 0) -> List[Dict]:
+    # Parses the entries ninja appended to .ninja_log since start_offset.
+    # Each line is: start ms, end ms, restat mtime, output path, command hash
+    ninja_log = os.path.join(build_dir, ".ninja_log")
+    if not os.path.exists(ninja_log):
+        return []
+
+    # ninja sometimes recompacts the log, in that case everything is new
+    if os.path.getsize(ninja_log) < start_offset:
+        start_offset = 0
+
+    entries = {}
+    with open(ninja_log, "r") as f:
+        f.seek(start_offset)
+        for line in f:
+            if line.startswith("#"):
+                continue
+
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) < 5:
+                continue
+
+            start, end, _, output, command_hash = fields[:5]
+            # one command can have several outputs, only count it once
+            key = (int(start), int(end), command_hash)
+            if key in entries:
+                entries[key]["outputs"].append(output)
+                continue
+
+            entries[key] = {
+                "output": output,
+                "outputs": [output],
+                "start": int(start),
+                "end": int(end),
+                "duration": int(end) - int(start),
+                "category": get_output_category(output),
+            }
+
+    return sorted(entries.values(), key=lambda entry: entry["start"])
+
+
+def get_output_category(output: str) -> str:
+    output = output.replace("\\", "/")
+    if output.endswith((".so", ".dll", ".dylib", ".a", ".lib")):
+        return "link"
+    if "godot-cpp" in output and "/gen/" in output:
+        return "godot-cpp bindings"
+    if "godot-cpp" in output:
+        return "godot-cpp"
+    if "/gen/" in output or not output.endswith((".o", ".obj")):
+        return "generation"
+
+    return "extension"
+
+
+def get_critical_path(entries: List[Dict]) -> List[Dict]:
+    # .ninja_log has no dependency information, so the critical path is approximated by
+    # walking back from the last finished step to the latest step that ended before it started
+    if not entries:
+        return []
+
+    by_end = sorted(entries, key=lambda entry: entry["end"])
+    path = [by_end[-1]]
+    while True:
+        current = path[-1]
+        previous = [entry for entry in by_end if entry["end"] <= current["start"]]
+        if not previous:
+            break
+        path.append(previous[-1])
+
+    path.reverse()
+    return path
+
+
+def get_compiler_cache_stats(build_dir: str) -> Dict[str, int]:
+    # The compiler launcher runs ccache with CCACHE_DIR=.ccache relative to the build dir
+    if shutil.which("ccache"):
+        env = os.environ.copy()
+        env["CCACHE_DIR"] = os.path.join(os.path.abspath(build_dir), ".ccache")
+        stats_output = subprocess.run(["ccache", "--print-stats"], capture_output=True, env=env)
+        if stats_output.returncode == 0:
+            stats = {}
+            for line in stats_output.stdout.decode().splitlines():
+                key, _, value = line.partition("\t")
+                if value.isdigit():
+                    stats[key] = int(value)
+
+            return {
+                "tool": "ccache",
+                "hits": stats.get("direct_cache_hit", 0) + stats.get("preprocessed_cache_hit", 0),
+                "misses": stats.get("cache_miss", 0),
+            }
+
+    if shutil.which("sccache"):
+        stats_output = subprocess.run(["sccache", "--show-stats", "--stats-format=json"], capture_output=True)
+        if stats_output.returncode == 0:
+            try:
+                stats = json.loads(stats_output.stdout.decode())["stats"]
+            except (ValueError, KeyError):
+                return {}
+
+            return {
+                "tool": "sccache",
+                "hits": sum(stats.get("cache_hits", {}).get("counts", {}).values()),
+                "misses": sum(stats.get("cache_misses", {}).get("counts", {}).values()),
+            }
+
+    return {}
+
+
+def diff_compiler_cache_stats(before: Dict, after: Dict) -> Dict:
+    if not after or before.get("tool") != after.get("tool"):
+        return {}
+
+    hits = after["hits"] - before["hits"]
+    misses = after["misses"] - before["misses"]
+    total = hits + misses
+
+    return {
+        "tool": after["tool"],
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": hits / total if total > 0 else 0.0,
+    }
+
+
+def write_chrome_trace(entries: List[Dict], trace_file: str):
+    # pack the steps into lanes, so the trace shows how many ran in parallel
+    lanes: List[int] = []
+    events = []
+    for entry in entries:
+        lane = 0
+        while lane < len(lanes) and lanes[lane] > entry["start"]:
+            lane += 1
+        if lane == len(lanes):
+            lanes.append(0)
+        lanes[lane] = entry["end"]
+
+        events.append({
+            "name": entry["output"],
+            "cat": entry["category"],
+            "ph": "X",
+            "ts": entry["start"] * 1000,
+            "dur": entry["duration"] * 1000,
+            "pid": 0,
+            "tid": lane,
+        })
+
+    with open(trace_file, "w") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+
+def start_profile(build_dir: str) -> Dict:
+    return {
+        "ninja_log_offset": get_ninja_log_size(build_dir),
+        "compiler_cache": get_compiler_cache_stats(build_dir),
+        "start_time": time.time(),
+    }
+
+
+def finish_profile(build_dir: str, target: str, profile_state: Dict, threshold: float) -> Dict:
+    # Writes report.json and trace.json for the build that just finished
+    # and compares it with the previous build of the same target.
+    entries = read_ninja_log(build_dir, profile_state["ninja_log_offset"])
+    wall_time = time.time() - profile_state["start_time"]
+
+    categories: Dict[str, int] = {}
+    for entry in entries:
+        categories[entry["category"]] = categories.get(entry["category"], 0) + entry["duration"]
+
+    critical_path = get_critical_path(entries)
+    report = {
+        "target": target,
+        "timestamp": profile_state["start_time"],
+        "wall_time": wall_time,
+        "steps": len(entries),
+        "categories_ms": categories,
+        "critical_path_ms": sum(entry["duration"] for entry in critical_path),
+        "critical_path": [{"output": entry["output"], "duration_ms": entry["duration"]} for entry in critical_path],
+        "compiler_cache": diff_compiler_cache_stats(
+            profile_state["compiler_cache"], get_compiler_cache_stats(build_dir)
+        ),
+        "outputs_ms": {
+            entry["output"]: entry["duration"]
+            for entry in sorted(entries, key=lambda entry: entry["duration"], reverse=True)
+        },
+    }
+
+    profile_dir = os.path.join(build_dir, profile_dir_name)
+    os.makedirs(profile_dir, exist_ok=True)
+
+    # only compare builds that actually did something
+    history_file = os.path.join(profile_dir, "history.jsonl")
+    previous = load_previous_profile(history_file, target)
+    report["regressions"] = find_regressions(previous, report, threshold) if previous and entries else []
+
+    with open(os.path.join(profile_dir, "report.json"), "w") as f:
+        json.dump(report, f, indent=2)
+    write_chrome_trace(entries, os.path.join(profile_dir, "trace.json"))
+
+    if entries:
+        with open(history_file, "a") as f:
+            json.dump(report, f)
+            f.write("\n")
+
+    print_profile(report, profile_dir)
+    return report
+
+
+def load_previous_profile(history_file: str, target: str) -> Dict | None:
+    previous = None
+    try:
+        with open(history_file, "r") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if entry.get("target") == target:
+                    previous = entry
+    except OSError:
+        pass
+
+    return previous
+
+
+def find_regressions(previous: Dict, current: Dict, threshold: float) -> List[Tuple[str, float, float]]:
+    # everything that got more than threshold percent slower, ignoring tiny absolute changes
+    regressions = []
+
+    def check(name: str, old: float, new: float, min_delta: float):
+        if old > 0 and new - old > min_delta and (new - old) / old * 100 > threshold:
+            regressions.append((name, old, new))
+
+    check("wall time (s)", previous["wall_time"], current["wall_time"], 1.0)
+    check("critical path (ms)", previous["critical_path_ms"], current["critical_path_ms"], 1000)
+
+    for output, duration in current["outputs_ms"].items():
+        if output in previous["outputs_ms"]:
+            check(output + " (ms)", previous["outputs_ms"][output], duration, 500)
+
+    return regressions
+
+
+def print_profile(report: Dict, profile_dir: str):
+    print("Build profile for {} ({} steps, {:.1f}s wall time)".format(report["target"], report["steps"], report["wall_time"]))
+
+    for category, duration in sorted(report["categories_ms"].items(), key=lambda item: item[1], reverse=True):
+        print("  {:<20} {:>9.1f}s".format(category, duration / 1000))
+
+    print("  {:<20} {:>9.1f}s ({} steps)".format("critical path", report["critical_path_ms"] / 1000, len(report["critical_path"])))
+
+    if report["compiler_cache"]:
+        cache = report["compiler_cache"]
+        print("  {} hit rate: {:.0%} ({} hits, {} misses)".format(cache["tool"], cache["hit_rate"], cache["hits"], cache["misses"]))
+
+    for output, duration in list(report["outputs_ms"].items())[:5]:
+        print("  {:>9.1f}s {}".format(duration / 1000, output))
+
+    for name, old, new in report["regressions"]:
+        print("  REGRESSION {}: {:.1f} -> {:.1f}".format(name, old, new))
+
+    print("  reports written to {}".format(profile_dir))
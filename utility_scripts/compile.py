@@ -1,11 +1,20 @@
 import argparse
+import hashlib
+import json
 import os
 import platform
 import subprocess
 import stat
 import shutil
+import time
 
-from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+import build_profiler
+import compiler_cache
+from file_watcher import FileWatcher
 
 docker_image_map = {
     "x86_64": "x64",
@@ -14,26 +23,78 @@ docker_image_map = {
     "riscv64": "riscv64"
 }
 
+# rough peak memory of a single compile job, used to avoid oversubscribing the machine
+compile_job_memory = 1536 * 1024 * 1024
+
+# the environment the builds are configured with, it has to be passed into the build containers
+container_env_vars = ["CMAKE_LINKER_TYPE", "CMAKE_BUILD_PARALLEL_LEVEL"]
+
+default_prebuilt_cache_size_mb = 1024
+default_compiler_cache_size_mb = 2048
+
+
+def get_docker_image_name(target_arch: str) -> str:
+    return "dockcross/linux-{}:latest".format(docker_image_map[target_arch])
+
+
+def get_docker_image_id(docker_image_name: str) -> str:
+    inspect_output = subprocess.run(
+        ["docker", "image", "inspect", "--format", "{{.Id}}", docker_image_name],
+        capture_output=True,
+    )
+    if inspect_output.returncode != 0:
+        return ""
+
+    return inspect_output.stdout.decode().strip()
+
+
+def ensure_docker_image(docker_image_name: str, refresh_images: bool) -> str:
+    # only pull if the image is missing or a refresh was requested
+    image_id = "" if refresh_images else get_docker_image_id(docker_image_name)
+    if image_id:
+        return image_id
+
+    print("Pulling {}".format(docker_image_name))
+    subprocess.run(["docker", "pull", docker_image_name], check=False)
 
-def setup_docker_image(target_arch: str, project_dir: str, build_dir: str) -> List[str]:
+    image_id = get_docker_image_id(docker_image_name)
+    if not image_id:
+        print("Failed to get the docker image {}".format(docker_image_name))
+        exit(1)
+
+    return image_id
+
+
+def setup_docker_image(target_arch: str, project_dir: str, build_dir: str, refresh_images: bool = False) -> List[str]:
     extensions_dir = os.path.join(project_dir, "extensions")
-    docker_image_name = "dockcross/linux-{}:latest".format(docker_image_map[target_arch])
+    docker_image_name = get_docker_image_name(target_arch)
+    image_id = ensure_docker_image(docker_image_name, refresh_images)
 
+    # the wrapper script only changes with the image, so it is cached per image digest
+    image_digest = image_id.split(":")[-1][:16]
     os.makedirs(os.path.join(extensions_dir, "cross_compile_stuff"), exist_ok=True)
-    compiler_script = os.path.join(extensions_dir, "cross_compile_stuff", "{}.sh".format(target_arch))
+    compiler_script = os.path.join(extensions_dir, "cross_compile_stuff", "{}_{}.sh".format(target_arch, image_digest))
 
-    # run the docker image and capture the output
-    docker_result = subprocess.run(
-        ["docker", "run", "--pull", "always", docker_image_name],
-        cwd=project_dir,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-    )
+    if not os.path.exists(compiler_script):
+        # run the docker image and capture the output
+        docker_result = subprocess.run(
+            ["docker", "run", "--rm", docker_image_name],
+            cwd=project_dir,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        if docker_result.returncode != 0:
+            print("Failed to create the dockcross script for {}".format(docker_image_name))
+            print(docker_result.stderr.decode("utf-8"))
+            exit(1)
 
-    with open(compiler_script, "w") as f:
-        f.write(docker_result.stdout.decode("utf-8"))
+        # write to a temp file first, parallel builds might create the same script
+        temp_script = "{}.{}.tmp".format(compiler_script, os.getpid())
+        with open(temp_script, "w") as f:
+            f.write(docker_result.stdout.decode("utf-8"))
 
-    os.chmod(compiler_script, os.stat(compiler_script).st_mode | stat.S_IXUSR)
+        os.chmod(temp_script, os.stat(temp_script).st_mode | stat.S_IXUSR)
+        os.replace(temp_script, compiler_script)
 
     # create the compile command
     compiler_script = os.path.abspath(compiler_script)
@@ -41,6 +102,897 @@ def setup_docker_image(target_arch: str, project_dir: str, build_dir: str) -> Li
     return [compiler_script, "cmake"]
 
 
+def get_build_container_name(target_arch: str) -> str:
+    return "openchamp_build_{}".format(target_arch)
+
+
+def setup_build_container(target_arch: str, project_dir: str, refresh_images: bool = False) -> List[str]:
+    # Starts (or reuses) a long-lived container for the target arch, so the configure,
+    # build and install steps don't pay the container startup every time.
+    docker_image_name = get_docker_image_name(target_arch)
+    image_id = ensure_docker_image(docker_image_name, refresh_images)
+    container_name = get_build_container_name(target_arch)
+    project_dir = os.path.abspath(project_dir)
+
+    inspect_output = subprocess.run(
+        ["docker", "inspect", "--format", "{{.State.Running}} {{.Image}} {{range .Mounts}}{{.Source}}{{end}}", container_name],
+        capture_output=True,
+    )
+
+    start_container = True
+    if inspect_output.returncode == 0:
+        running, container_image, mount_source = (inspect_output.stdout.decode().strip().split(" ", 2) + ["", ""])[:3]
+        if running == "true" and container_image == image_id and mount_source == project_dir:
+            print("Reusing the build container {}".format(container_name))
+            start_container = False
+        else:
+            # the image was updated or the container belongs to another checkout
+            subprocess.run(["docker", "rm", "--force", container_name], capture_output=True)
+
+    if start_container:
+        print("Starting the build container {}".format(container_name))
+        run_output = subprocess.run(
+            [
+                "docker", "run", "--detach", "--rm",
+                "--name", container_name,
+                "--volume", "{}:/work".format(project_dir),
+                "--workdir", "/work",
+                "--entrypoint", "sleep",
+                docker_image_name, "infinity",
+            ],
+            capture_output=True,
+        )
+        if run_output.returncode != 0:
+            print("Failed to start the build container {}".format(container_name))
+            print(run_output.stderr.decode())
+            exit(1)
+
+    exec_command = ["docker", "exec", "--workdir", "/work"]
+    if hasattr(os, "getuid"):
+        # keep the build output owned by the current user
+        exec_command += ["--user", "{}:{}".format(os.getuid(), os.getgid()), "--env", "HOME=/tmp"]
+
+    return [*exec_command, container_name, "cmake"]
+
+
+def stop_build_containers():
+    for target_arch in docker_image_map:
+        container_name = get_build_container_name(target_arch)
+        stop_output = subprocess.run(["docker", "rm", "--force", container_name], capture_output=True)
+        if stop_output.returncode == 0:
+            print("Stopped the build container {}".format(container_name))
+
+
+def get_container_command(cmake_command: List[str], env: Dict[str, str]) -> List[str]:
+    # Neither docker exec nor the dockcross script pass the host environment on,
+    # so the variables the build depends on are forwarded explicitly
+    forwarded = ["{}={}".format(name, env[name]) for name in container_env_vars if env.get(name)]
+    if len(cmake_command) == 1 or not forwarded:
+        return cmake_command
+
+    if cmake_command[0] == "docker":
+        env_args = [arg for variable in forwarded for arg in ["--env", variable]]
+        return [*cmake_command[:-2], *env_args, *cmake_command[-2:]]
+
+    return [cmake_command[0], "--args", " ".join("-e " + variable for variable in forwarded), *cmake_command[1:]]
+
+
+def get_container_build_dir(build_dir: str, project_dir: str) -> str | None:
+    # The project dir is mounted at /work in the containers, absolute build dirs have to be below it
+    if not os.path.isabs(build_dir):
+        return build_dir
+
+    project_dir = os.path.abspath(project_dir)
+    build_dir = os.path.abspath(build_dir)
+    if os.path.commonpath([project_dir, build_dir]) != project_dir:
+        return None
+
+    return os.path.relpath(build_dir, project_dir).replace("\\", "/")
+
+
+def get_build_dir(target_arch: str, build_mode: str, build_dir: str = "") -> str:
+    if build_dir:
+        return build_dir
+
+    return os.path.join("extensions", "build_{}_{}".format(target_arch, build_mode))
+
+
+def get_cmake_command(
+    target_arch: str,
+    host_arch: str,
+    project_dir: str,
+    build_dir: str,
+    refresh_images: bool = False,
+    build_container: bool = False,
+) -> Tuple[List[str], str]:
+    # returns the cmake command for the target and the linker that should be used
+    if host_arch == target_arch:
+        print("Building natively for the host architecture ({})".format(host_arch))
+
+        linker = ""
+        if shutil.which("mold"):
+            linker = "MOLD"
+
+        return ["cmake"], linker
+
+    print("Building with docker for the target architecture: {}".format(target_arch))
+    if build_container:
+        return setup_build_container(target_arch, project_dir, refresh_images), ""
+
+    return setup_docker_image(target_arch, project_dir, build_dir, refresh_images), ""
+
+
+def run_build(
+    cmake_command: List[str],
+    build_mode: str,
+    build_dir: str,
+    build_system: str,
+    project_dir: str,
+    jobs: int,
+    skip_setup: bool,
+    env: Dict[str, str] | None = None,
+    log_file=None,
+    cmake_args: List[str] | None = None,
+) -> bool:
+    # Runs the configure, compile and install steps for a single build dir
+    if len(cmake_command) > 1:
+        container_build_dir = get_container_build_dir(build_dir, project_dir)
+        if container_build_dir is None:
+            print("Container builds need a build dir inside of {}, got {}".format(os.path.abspath(project_dir), build_dir))
+            return False
+
+        build_dir = container_build_dir
+        cmake_command = get_container_command(cmake_command, env if env is not None else dict(os.environ))
+
+    # Run the setup command
+    if not skip_setup:
+        setup_command = [
+            *cmake_command,
+            "-DCMAKE_BUILD_TYPE={}".format(build_mode.capitalize()),
+            *(cmake_args or []),
+            "-B", build_dir,
+            build_system,
+            "extensions"
+        ]
+        setup_output = subprocess.run(setup_command, cwd=project_dir, check=False, env=env, stdout=log_file, stderr=log_file)
+        if setup_output.returncode != 0:
+            print("Failed to run the setup command")
+            print(setup_output)
+            return False
+
+    # Compile the source file
+    compile_command = [*cmake_command, "--build", build_dir]
+    if jobs > 0:
+        compile_command.append("--parallel")
+        compile_command.append(str(jobs))
+    compile_output = subprocess.run(compile_command, cwd=project_dir, check=False, env=env, stdout=log_file, stderr=log_file)
+    if compile_output.returncode != 0:
+        print("Failed to run the compile command")
+        print(compile_output)
+        return False
+
+    # install the build output
+    install_command = [*cmake_command, "--install", build_dir]
+    install_output = subprocess.run(install_command, cwd=project_dir, check=False, env=env, stdout=log_file, stderr=log_file)
+    if install_output.returncode != 0:
+        print("Failed to install the build output")
+        print(install_output)
+        return False
+
+    return True
+
+
+def get_default_cache_dir() -> str:
+    # the cache is shared between all checkouts of the current user
+    if platform.system() == "Windows":
+        cache_root = os.getenv("LOCALAPPDATA") or os.path.expanduser("~")
+    elif platform.system() == "Darwin":
+        cache_root = os.path.expanduser("~/Library/Caches")
+    else:
+        cache_root = os.getenv("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+
+    return os.path.join(cache_root, "openchamp", "prebuilt")
+
+
+def get_compiler_identity(cmake_command: List[str], target_arch: str) -> str:
+    # cross builds are identified by the docker image, native builds by the compiler version
+    if cmake_command[0] != "cmake":
+        docker_image_name = get_docker_image_name(target_arch)
+        return docker_image_name + get_docker_image_id(docker_image_name)
+
+    identity = ""
+    for command in [["cmake", "--version"], [os.getenv("CXX", "c++"), "--version"]]:
+        try:
+            version_output = subprocess.run(command, capture_output=True)
+            identity += version_output.stdout.decode()
+        except OSError:
+            identity += "{} not found\n".format(command[0])
+
+    return identity
+
+
+def hash_directory(hasher, directory: str):
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for file in sorted(files):
+            file_path = os.path.join(root, file)
+            hasher.update(os.path.relpath(file_path, directory).replace(os.sep, "/").encode())
+            with open(file_path, "rb") as f:
+                hasher.update(hashlib.sha256(f.read()).digest())
+
+
+def get_godot_api_files(extensions_dir: str, cmake_args: List[str]) -> List[str]:
+    # GODOT_GDEXTENSION_DIR is the extensions dir, so godot-cpp compiles against its gdextension_interface.h
+    # and generates the bindings from its extension_api.json, unless GODOT_CUSTOM_API_FILE replaces the json
+    api_file = os.path.join(extensions_dir, "extension_api.json")
+    for cmake_arg in cmake_args:
+        if cmake_arg.startswith("-DGODOT_CUSTOM_API_FILE="):
+            api_file = cmake_arg.split("=", 1)[1] or api_file
+
+    return [os.path.join(extensions_dir, "gdextension_interface.h"), api_file]
+
+
+def get_build_fingerprint(
+    project_dir: str,
+    target_arch: str,
+    build_mode: str,
+    cmake_command: List[str],
+    linker: str,
+    build_system: str,
+    extra_flags: List[str] | None = None,
+) -> str:
+    # Hashes everything that determines the openchamp.<os>.template_<mode>.<arch> binary
+    extensions_dir = os.path.join(project_dir, "extensions")
+    hasher = hashlib.sha256()
+
+    for directory in ["src", "include"]:
+        hasher.update(directory.encode())
+        hash_directory(hasher, os.path.join(extensions_dir, directory))
+
+    with open(os.path.join(extensions_dir, "CMakeLists.txt"), "rb") as f:
+        hasher.update(f.read())
+
+    # the godot api the bindings are built for
+    for api_file in get_godot_api_files(extensions_dir, extra_flags or []):
+        hasher.update(os.path.basename(api_file).encode())
+        if os.path.isfile(api_file):
+            with open(api_file, "rb") as f:
+                hasher.update(hashlib.sha256(f.read()).digest())
+        else:
+            hasher.update(b"missing")
+
+    # the godot-cpp revision, including uncommitted changes
+    godot_cpp_dir = os.path.join(extensions_dir, "godot-cpp")
+    if os.path.exists(os.path.join(godot_cpp_dir, ".git")):
+        godot_cpp_revision = subprocess.run(["git", "rev-parse", "HEAD"], cwd=godot_cpp_dir, capture_output=True)
+        godot_cpp_changes = subprocess.run(["git", "diff", "HEAD"], cwd=godot_cpp_dir, capture_output=True)
+        hasher.update(godot_cpp_revision.stdout)
+        hasher.update(godot_cpp_changes.stdout)
+    else:
+        hasher.update(b"godot-cpp not initialized")
+
+    hasher.update(get_compiler_identity(cmake_command, target_arch).encode())
+
+    flags = [
+        platform.system(),
+        target_arch,
+        build_mode,
+        linker,
+        build_system,
+        os.getenv("CFLAGS", ""),
+        os.getenv("CXXFLAGS", ""),
+        os.getenv("LDFLAGS", ""),
+        *(extra_flags or []),
+    ]
+    hasher.update("\0".join(flags).encode())
+
+    return hasher.hexdigest()
+
+
+def restore_prebuilt(store_dir: str, fingerprint: str, bin_dir: str) -> bool:
+    entry_dir = os.path.join(store_dir, fingerprint)
+    manifest_file = os.path.join(entry_dir, "manifest.json")
+    try:
+        with open(manifest_file, "r") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return False
+
+    os.makedirs(bin_dir, exist_ok=True)
+    for file_name in manifest["files"]:
+        # copy next to the target and rename, so godot never loads a half written library
+        target = os.path.join(bin_dir, file_name)
+        temp_file = "{}.{}.tmp".format(target, os.getpid())
+        shutil.copy2(os.path.join(entry_dir, file_name), temp_file)
+        os.replace(temp_file, target)
+
+    # mark the entry as recently used
+    os.utime(manifest_file)
+    return True
+
+
+def store_prebuilt(store_dir: str, fingerprint: str, build_dir: str, bin_dir: str, max_size: int):
+    # cmake lists everything it installed in the install manifest
+    install_manifest = os.path.join(build_dir, "install_manifest.txt")
+    try:
+        with open(install_manifest, "r") as f:
+            installed_files = [os.path.basename(line.strip()) for line in f if line.strip()]
+    except OSError:
+        print("No install manifest found, not storing the build output")
+        return
+
+    entry_dir = os.path.join(store_dir, fingerprint)
+    temp_dir = "{}.{}.tmp".format(entry_dir, os.getpid())
+    os.makedirs(temp_dir, exist_ok=True)
+
+    size = 0
+    for file_name in installed_files:
+        shutil.copy2(os.path.join(bin_dir, file_name), os.path.join(temp_dir, file_name))
+        size += os.path.getsize(os.path.join(temp_dir, file_name))
+
+    with open(os.path.join(temp_dir, "manifest.json"), "w") as f:
+        json.dump({"files": installed_files, "size": size}, f, indent=2)
+
+    try:
+        os.rename(temp_dir, entry_dir)
+    except OSError:
+        # another build stored the same fingerprint in the meantime
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    evict_prebuilt(store_dir, max_size, fingerprint)
+
+
+def evict_prebuilt(store_dir: str, max_size: int, keep: str = ""):
+    entries = []
+    for fingerprint in os.listdir(store_dir):
+        manifest_file = os.path.join(store_dir, fingerprint, "manifest.json")
+        try:
+            with open(manifest_file, "r") as f:
+                size = json.load(f)["size"]
+            entries.append((os.path.getmtime(manifest_file), fingerprint, size))
+        except (OSError, ValueError, KeyError):
+            continue
+
+    # remove the least recently used entries until the store fits
+    total_size = sum(size for _, _, size in entries)
+    for _, fingerprint, size in sorted(entries):
+        if total_size <= max_size:
+            break
+
+        if fingerprint == keep:
+            continue
+
+        print("Evicting prebuilt {}".format(fingerprint))
+        shutil.rmtree(os.path.join(store_dir, fingerprint), ignore_errors=True)
+        total_size -= size
+
+
+def get_cmake_args(args: dict) -> List[str]:
+    # always pass the unity option, so a previous unity configure of the build dir is reset
+    if args["unity"]:
+        return ["-DOPENCHAMP_UNITY_BUILD=ON", "-DOPENCHAMP_UNITY_BATCH_SIZE={}".format(args["unity_batch_size"])]
+
+    return ["-DOPENCHAMP_UNITY_BUILD=OFF"]
+
+
+def run_unity_benchmark(
+    cmake_command: List[str],
+    build_mode: str,
+    build_system: str,
+    project_dir: str,
+    jobs: int,
+    batch_sizes: List[str],
+) -> bool:
+    # Times clean builds for every batch size ("off" builds without unity).
+    # The compiler cache is disabled, otherwise only the first build would do any work.
+    benchmark_dir = os.path.join("extensions", "build_unity_benchmark")
+    results = []
+
+    for batch_size in batch_sizes:
+        build_dir = os.path.join(benchmark_dir, batch_size)
+        shutil.rmtree(build_dir, ignore_errors=True)
+
+        unity_args = ["-DOPENCHAMP_UNITY_BUILD=OFF"]
+        if batch_size != "off":
+            unity_args = ["-DOPENCHAMP_UNITY_BUILD=ON", "-DOPENCHAMP_UNITY_BATCH_SIZE={}".format(batch_size)]
+
+        setup_command = [
+            *cmake_command,
+            "-DCMAKE_BUILD_TYPE={}".format(build_mode.capitalize()),
+            "-DOPENCHAMP_USE_COMPILER_LAUNCHER=OFF",
+            *unity_args,
+            "-B", build_dir,
+            build_system,
+            "extensions"
+        ]
+        print("Configuring batch size {}".format(batch_size))
+        setup_output = subprocess.run(setup_command, cwd=project_dir, check=False, capture_output=True)
+        if setup_output.returncode != 0:
+            print("Failed to run the setup command")
+            print(setup_output.stderr.decode())
+            return False
+
+        compile_command = [*cmake_command, "--build", build_dir]
+        if jobs > 0:
+            compile_command += ["--parallel", str(jobs)]
+
+        print("Building batch size {}".format(batch_size))
+        start_time = time.perf_counter()
+        compile_output = subprocess.run(compile_command, cwd=project_dir, check=False, capture_output=True)
+        duration = time.perf_counter() - start_time
+
+        if compile_output.returncode != 0:
+            print("Failed to build with batch size {}".format(batch_size))
+            print(compile_output.stdout.decode())
+            return False
+
+        results.append((batch_size, duration))
+
+    print("")
+    print("{:<12} {:>10}".format("batch size", "time"))
+    for batch_size, duration in results:
+        print("{:<12} {:>9.1f}s".format(batch_size, duration))
+
+    fastest = min(results, key=lambda result: result[1])
+    fastest_option = "no unity build" if fastest[0] == "off" else "--unity --unity_batch_size={}".format(fastest[0])
+    print("Fastest: {} ({} jobs, {} cores)".format(fastest_option, jobs or "auto", os.cpu_count()))
+    return True
+
+
+def build_or_restore(
+    args: dict,
+    cmake_command: List[str],
+    linker: str,
+    target_arch: str,
+    build_mode: str,
+    build_dir: str,
+    project_dir: str,
+    jobs: int,
+    env: Dict[str, str] | None = None,
+    log_file=None,
+) -> bool:
+    # Copies a matching prebuilt binary into bin/ or runs the build and stores its output
+    bin_dir = os.path.join(project_dir, "bin")
+    fingerprint = ""
+    cmake_args = get_cmake_args(args)
+
+    if args["prebuilt_cache"]:
+        fingerprint = get_build_fingerprint(
+            project_dir, target_arch, build_mode, cmake_command, linker, args["build_system"], cmake_args
+        )
+
+        if restore_prebuilt(args["prebuilt_cache_dir"], fingerprint, bin_dir):
+            print("Restored the prebuilt {}:{} binary ({})".format(target_arch, build_mode, fingerprint[:16]))
+            return True
+
+    profile_state = None
+    if args["profile_build"]:
+        profile_state = build_profiler.start_profile(build_dir)
+
+    if not run_build(
+        cmake_command,
+        build_mode,
+        build_dir,
+        args["build_system"],
+        project_dir,
+        jobs,
+        args["skip_setup"],
+        env,
+        log_file,
+        cmake_args,
+    ):
+        return False
+
+    if profile_state is not None:
+        build_profiler.finish_profile(
+            build_dir, "{}:{}".format(target_arch, build_mode), profile_state, args["profile_threshold"]
+        )
+
+    if fingerprint:
+        os.makedirs(args["prebuilt_cache_dir"], exist_ok=True)
+        store_prebuilt(
+            args["prebuilt_cache_dir"],
+            fingerprint,
+            build_dir,
+            bin_dir,
+            args["prebuilt_cache_size"] * 1024 * 1024,
+        )
+
+    return True
+
+
+def install_atomically(build_dir: str, bin_dir: str) -> bool:
+    # Copies the libraries cmake installed before into bin/ and renames them into place,
+    # so godot's extension reload never sees a half written file
+    install_manifest = os.path.join(build_dir, "install_manifest.txt")
+    try:
+        with open(install_manifest, "r") as f:
+            installed_files = [os.path.basename(line.strip()) for line in f if line.strip()]
+    except OSError:
+        return False
+
+    for file_name in installed_files:
+        source = os.path.join(build_dir, file_name)
+        if not os.path.exists(source):
+            return False
+
+        target = os.path.join(bin_dir, file_name)
+        temp_file = "{}.{}.tmp".format(target, os.getpid())
+        shutil.copy2(source, temp_file)
+        try:
+            os.replace(temp_file, target)
+        except OSError as error:
+            os.remove(temp_file)
+            print("Failed to replace {}: {}".format(target, error))
+            return False
+
+    return True
+
+
+def run_watch_mode(
+    args: dict,
+    cmake_command: List[str],
+    linker: str,
+    target_arch: str,
+    build_mode: str,
+    build_dir: str,
+    project_dir: str,
+):
+    extensions_dir = os.path.join(project_dir, "extensions")
+    bin_dir = os.path.join(project_dir, "bin")
+
+    # the cmake commands of the cycles see the build dir the way the container does
+    cycle_command = cmake_command
+    cmake_build_dir = build_dir
+    if len(cmake_command) > 1:
+        cmake_build_dir = get_container_build_dir(build_dir, project_dir)
+        if cmake_build_dir is None:
+            print("Container builds need a build dir inside of {}, got {}".format(os.path.abspath(project_dir), build_dir))
+            return
+        cycle_command = get_container_command(cmake_command, dict(os.environ))
+
+    # Start from an up to date build, the following cycles only rebuild. A restored prebuilt binary
+    # would leave the build dir unconfigured, so the first build always runs for real.
+    initial_args = {
+        **args,
+        "prebuilt_cache": False,
+        "skip_setup": args["skip_setup"] and os.path.exists(os.path.join(build_dir, "CMakeCache.txt")),
+    }
+    if not build_or_restore(initial_args, cmake_command, linker, target_arch, build_mode, build_dir, project_dir, args["jobs"]):
+        print("The initial build failed, waiting for changes")
+
+    watcher = FileWatcher(
+        [os.path.join(extensions_dir, "src"), os.path.join(extensions_dir, "include")],
+        [os.path.join(extensions_dir, "CMakeLists.txt")],
+        [".cpp", ".hpp", ".h", ".inl"],
+    )
+
+    print("Watching for changes, press Ctrl+C to stop")
+    try:
+        while True:
+            changed = watcher.wait_for_changes(args["watch_debounce"] / 1000)
+            print("Changed: {}".format(", ".join(sorted(os.path.relpath(path, extensions_dir) for path in changed))))
+
+            start_time = time.perf_counter()
+
+            # ninja reruns the cmake configure by itself if CMakeLists.txt changed
+            compile_command = [*cycle_command, "--build", cmake_build_dir, "--target", "openchamp"]
+            if args["jobs"] > 0:
+                compile_command += ["--parallel", str(args["jobs"])]
+            compile_output = subprocess.run(compile_command, cwd=project_dir, check=False)
+
+            if compile_output.returncode != 0:
+                print("Build failed after {:.2f}s, waiting for changes".format(time.perf_counter() - start_time))
+                continue
+
+            # the first install has to go through cmake, afterwards the files are swapped atomically
+            if not install_atomically(build_dir, bin_dir):
+                install_output = subprocess.run([*cycle_command, "--install", cmake_build_dir], cwd=project_dir, check=False)
+                if install_output.returncode != 0:
+                    print("Failed to install the build output")
+                    continue
+
+            print("Rebuilt and installed in {:.2f}s".format(time.perf_counter() - start_time))
+    except KeyboardInterrupt:
+        print("Stopped watching")
+    finally:
+        watcher.close()
+
+
+@contextmanager
+def use_release_library(project_dir: str):
+    # The editor has the debug feature tag and loads the template_debug library. While the training
+    # workload runs, the debug entries of the .gdextension point at the release library instead,
+    # so the instrumented and the optimized release builds are the ones that get loaded.
+    gdextension_path = os.path.join(project_dir, "bin", "openchamp.gdextension")
+    with open(gdextension_path, "r") as f:
+        original = f.read()
+
+    lines = []
+    for line in original.splitlines(keepends=True):
+        key = line.split("=", 1)[0].strip()
+        if ".debug" in key:
+            line = line.replace("template_debug", "template_release")
+        lines.append(line)
+
+    with open(gdextension_path, "w") as f:
+        f.write("".join(lines))
+    try:
+        yield
+    finally:
+        with open(gdextension_path, "w") as f:
+            f.write(original)
+
+
+def find_profiles(profile_dir: str) -> List[str]:
+    # clang writes .profraw files, gcc writes .gcda files into a tree below the profile dir
+    profiles = []
+    for root, _, files in os.walk(profile_dir):
+        for file in files:
+            if file.endswith((".profraw", ".gcda")):
+                profiles.append(os.path.join(root, file))
+    return profiles
+
+
+def run_training_workload(godot_path: str, project_dir: str, iterations: int, runs: int = 1) -> float:
+    # Runs the pgo training script in a headless godot and returns the fastest workload time in seconds
+    training_script = os.path.join(os.path.abspath(os.path.dirname(os.path.realpath(__file__))), "pgo_training.gd")
+    training_command = [
+        godot_path,
+        "--headless",
+        "--path", os.path.abspath(project_dir),
+        "--script", training_script,
+        "--", str(iterations),
+    ]
+
+    fastest = -1.0
+    for _ in range(runs):
+        training_output = subprocess.run(training_command, cwd=project_dir, check=False, capture_output=True)
+        output = training_output.stdout.decode(errors="replace")
+
+        workload_time = -1.0
+        for line in output.splitlines():
+            if line.startswith("PGO_WORKLOAD_USEC="):
+                workload_time = int(line.split("=", 1)[1]) / 1000000
+
+        if training_output.returncode != 0 or workload_time < 0:
+            print("The training workload failed")
+            print(output)
+            print(training_output.stderr.decode(errors="replace"))
+            return -1.0
+
+        if fastest < 0 or workload_time < fastest:
+            fastest = workload_time
+
+    return fastest
+
+
+def merge_clang_profiles(profile_dir: str) -> bool:
+    # clang writes raw profiles, which have to be merged before they can be used
+    raw_profiles = [os.path.join(profile_dir, file) for file in os.listdir(profile_dir) if file.endswith(".profraw")]
+    if not raw_profiles:
+        return True
+
+    llvm_profdata = os.getenv("LLVM_PROFDATA") or shutil.which("llvm-profdata")
+    if llvm_profdata is None:
+        print("Found clang profiles, but llvm-profdata is not installed (set LLVM_PROFDATA to its path)")
+        return False
+
+    merge_output = subprocess.run(
+        [llvm_profdata, "merge", "-output={}".format(os.path.join(profile_dir, "merged.profdata")), *raw_profiles],
+        check=False,
+    )
+    return merge_output.returncode == 0
+
+
+def run_pgo_build(args: dict, cmake_command: List[str], target_arch: str, project_dir: str) -> bool:
+    # Builds a plain release binary, an instrumented one to collect profiles with the
+    # training workload, and finally the profile optimized binary with LTO.
+    godot_path = args["godot_path"]
+    iterations = args["pgo_iterations"]
+    runs = args["pgo_runs"]
+
+    plain_build_dir = get_build_dir(target_arch, "release", args["build_dir"])
+    pgo_build_dir = get_build_dir(target_arch, "release_pgo")
+    profile_dir = os.path.abspath(os.path.join(pgo_build_dir, "pgo_profiles"))
+    unity_args = get_cmake_args(args)
+
+    def build(build_dir: str, cmake_args: List[str]) -> bool:
+        os.makedirs(build_dir, exist_ok=True)
+        return run_build(
+            cmake_command, "release", build_dir, args["build_system"], project_dir, args["jobs"], False,
+            cmake_args=unity_args + cmake_args,
+        )
+
+    print("Building the plain release binary")
+    if not build(plain_build_dir, ["-DOPENCHAMP_PGO=OFF", "-DOPENCHAMP_LTO=OFF"]):
+        return False
+
+    with use_release_library(project_dir):
+        plain_time = run_training_workload(godot_path, project_dir, iterations, runs)
+    if plain_time < 0:
+        return False
+
+    # old profiles would be mixed into the new ones
+    shutil.rmtree(profile_dir, ignore_errors=True)
+    os.makedirs(profile_dir, exist_ok=True)
+
+    # the instrumented and the optimized build share the build dir, gcc finds the profiles by object path
+    print("Building the instrumented binary")
+    pgo_dir_arg = "-DOPENCHAMP_PGO_DIR={}".format(profile_dir)
+    if not build(pgo_build_dir, ["-DOPENCHAMP_PGO=GENERATE", pgo_dir_arg, "-DOPENCHAMP_LTO=OFF"]):
+        return False
+
+    print("Running the training workload")
+    with use_release_library(project_dir):
+        if run_training_workload(godot_path, project_dir, iterations) < 0:
+            return False
+
+    # without profiles the optimized build would silently be a plain LTO build
+    if not find_profiles(profile_dir):
+        print("The training workload didn't write any profiles to {}, the instrumented library wasn't loaded".format(profile_dir))
+        return False
+
+    if not merge_clang_profiles(profile_dir):
+        return False
+
+    print("Building the profile optimized binary with LTO")
+    if not build(pgo_build_dir, ["-DOPENCHAMP_PGO=USE", pgo_dir_arg, "-DOPENCHAMP_LTO=ON"]):
+        return False
+
+    with use_release_library(project_dir):
+        optimized_time = run_training_workload(godot_path, project_dir, iterations, runs)
+    if optimized_time < 0:
+        return False
+
+    print("")
+    print("{:<20} {:>10}".format("build", "workload"))
+    print("{:<20} {:>9.3f}s".format("release", plain_time))
+    print("{:<20} {:>9.3f}s".format("release pgo+lto", optimized_time))
+    if optimized_time > 0:
+        print("Speedup: {:.2f}x ({:+.1f}%)".format(plain_time / optimized_time, (plain_time - optimized_time) / plain_time * 100))
+
+    return True
+
+
+def parse_targets(targets: str, host_arch: str) -> List[Tuple[str, str]]:
+    # parses a list like x86_64:debug,aarch64:release into (target_arch, build_mode) pairs
+    parsed_targets = []
+    for target in targets.split(","):
+        target = target.strip()
+        if not target:
+            continue
+
+        target_arch, _, build_mode = target.partition(":")
+        if target_arch == "native":
+            target_arch = host_arch
+        if build_mode == "":
+            build_mode = "debug"
+
+        if build_mode not in ["debug", "release"]:
+            raise ValueError("Invalid build mode '{}' in target '{}'".format(build_mode, target))
+
+        if target_arch != host_arch and target_arch not in docker_image_map:
+            raise ValueError("Unsupported target architecture '{}'".format(target_arch))
+
+        if (target_arch, build_mode) not in parsed_targets:
+            parsed_targets.append((target_arch, build_mode))
+
+    return parsed_targets
+
+
+def get_available_memory() -> int:
+    # returns the available memory in bytes, or 0 if it can't be determined
+    try:
+        with open("/proc/meminfo", "r") as meminfo:
+            for line in meminfo:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (ValueError, OSError, AttributeError):
+        return 0
+
+
+def schedule_jobs(target_count: int, total_jobs: int) -> Tuple[int, int]:
+    # Splits the available compile jobs across the targets.
+    # Returns how many builds run at once and how many jobs each of them gets.
+    cpu_count = os.cpu_count() or 1
+    if total_jobs <= 0:
+        total_jobs = cpu_count
+
+    available_memory = get_available_memory()
+    if available_memory > 0:
+        total_jobs = min(total_jobs, max(1, available_memory // compile_job_memory))
+
+    concurrent_builds = max(1, min(target_count, total_jobs))
+    jobs_per_build = max(1, total_jobs // concurrent_builds)
+
+    return concurrent_builds, jobs_per_build
+
+
+def get_target_build_dir(args: dict, target_arch: str, build_mode: str) -> str:
+    # with several targets the build_dir option is the parent of the individual build dirs
+    if args["build_dir"]:
+        return os.path.join(args["build_dir"], "{}_{}".format(target_arch, build_mode))
+
+    return get_build_dir(target_arch, build_mode)
+
+
+def build_targets(args: dict, targets: List[Tuple[str, str]], host_arch: str, project_dir: str) -> bool:
+    concurrent_builds, jobs_per_build = schedule_jobs(len(targets), args["jobs"])
+    print("Building {} targets, {} at a time with {} jobs each".format(len(targets), concurrent_builds, jobs_per_build))
+
+    # prepare the toolchains up front, targets of the same arch share them
+    toolchains = {}
+    for target_arch, build_mode in targets:
+        if target_arch in toolchains:
+            continue
+
+        build_dir = get_target_build_dir(args, target_arch, build_mode)
+        os.makedirs(build_dir, exist_ok=True)
+        toolchains[target_arch] = get_cmake_command(
+            target_arch, host_arch, project_dir, build_dir, args["refresh_images"], args["build_container"]
+        )
+
+    def build_target(target: Tuple[str, str]) -> Tuple[bool, float, str]:
+        target_arch, build_mode = target
+        build_dir = get_target_build_dir(args, target_arch, build_mode)
+        os.makedirs(build_dir, exist_ok=True)
+
+        cmake_command, linker = toolchains[target_arch]
+        if args["set_linker"]:
+            linker = args["set_linker"]
+
+        env = os.environ.copy()
+        if linker:
+            env["CMAKE_LINKER_TYPE"] = linker
+
+        # keep the output of the parallel builds apart
+        log_path = os.path.join(build_dir, "build.log")
+        start_time = time.perf_counter()
+        with open(log_path, "w") as log_file:
+            print("Started {}:{} (log: {})".format(target_arch, build_mode, log_path))
+            success = build_or_restore(
+                args,
+                cmake_command,
+                linker,
+                target_arch,
+                build_mode,
+                build_dir,
+                project_dir,
+                jobs_per_build,
+                env,
+                log_file,
+            )
+        duration = time.perf_counter() - start_time
+
+        print("Finished {}:{} in {:.1f}s".format(target_arch, build_mode, duration))
+        return success, duration, log_path
+
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrent_builds) as executor:
+        results = list(executor.map(build_target, targets))
+    total_time = time.perf_counter() - start_time
+
+    # print a summary of all the builds
+    print("")
+    print("{:<12} {:<8} {:<8} {:>10}".format("arch", "mode", "status", "time"))
+    for (target_arch, build_mode), (success, duration, log_path) in zip(targets, results):
+        status = "ok" if success else "FAILED"
+        print("{:<12} {:<8} {:<8} {:>9.1f}s".format(target_arch, build_mode, status, duration))
+    print("{:<30} {:>9.1f}s".format("total wall time", total_time))
+
+    for (target_arch, build_mode), (success, _, log_path) in zip(targets, results):
+        if not success:
+            print("See {} for the output of {}:{}".format(log_path, target_arch, build_mode))
+
+    return all(success for success, _, _ in results)
+
+
 if __name__ == "__main__":
     script_dir = os.path.abspath(os.path.dirname(os.path.realpath(__file__)))
     extensions_dir = os.path.join(script_dir, "..", "extensions")
@@ -70,11 +1022,19 @@ if __name__ == "__main__":
         help="The target architecture (default: {})".format(host_arch)
     )
 
+    parser.add_argument(
+        "--targets",
+        type=str,
+        required=False,
+        default="",
+        help="Build several <target_arch>:<mode> pairs concurrently, e.g. x86_64:debug,x86_64:release,aarch64:release"
+    )
+
     parser.add_argument(
         "--build_dir",
         type=str,
         required=False,
-        help="The build directory (default: build_<target_arch>_<build_mode>)"
+        help="The build directory, or the parent of the build directories with --targets (default: build_<target_arch>_<build_mode>)"
     )
 
     parser.add_argument(
@@ -111,21 +1071,241 @@ if __name__ == "__main__":
         help="The number of threads to use for compilation (default: 0, auto)"
     )
 
+    parser.add_argument(
+        "--refresh_images", "--refresh-images",
+        action='store_true',
+        required=False,
+        default=False,
+        dest='refresh_images',
+        help="Pull the dockcross images even if they are already present"
+    )
+
+    parser.add_argument(
+        "--no_build_container",
+        action='store_false',
+        required=False,
+        default=True,
+        dest='build_container',
+        help="Use the dockcross wrapper script instead of a long-lived build container for cross compiles"
+    )
+
+    parser.add_argument(
+        "--stop_build_containers",
+        action='store_true',
+        required=False,
+        default=False,
+        dest='stop_build_containers',
+        help="Stop all the build containers and exit"
+    )
+
+    parser.add_argument(
+        "--compiler_cache",
+        type=str,
+        required=False,
+        default="",
+        choices=["", "stats", "trim", "export", "import"],
+        help="Manage the ccache/sccache of the build dir instead of building: show stats, trim it to --compiler_cache_size, "
+             "export the recently used entries to --compiler_cache_bundle or import such a bundle"
+    )
+
+    parser.add_argument(
+        "--compiler_cache_size",
+        type=int,
+        required=False,
+        default=default_compiler_cache_size_mb,
+        help="The size cap in MB for trimming and exporting the compiler cache (default: {})".format(default_compiler_cache_size_mb)
+    )
+
+    parser.add_argument(
+        "--compiler_cache_bundle",
+        type=str,
+        required=False,
+        default="",
+        help="The compiler cache bundle to export or import (default: extensions/compiler_cache_<target_arch>_<build_mode>.tar.gz)"
+    )
+
+    parser.add_argument(
+        "--unity",
+        action='store_true',
+        required=False,
+        default=False,
+        dest='unity',
+        help="Compile the extension and godot-cpp as unity (jumbo) builds"
+    )
+
+    parser.add_argument(
+        "--unity_batch_size",
+        type=int,
+        required=False,
+        default=16,
+        help="The number of sources combined into one unity translation unit, 0 combines all (default: 16)"
+    )
+
+    parser.add_argument(
+        "--unity_benchmark",
+        type=str,
+        required=False,
+        default="",
+        help="Time clean builds for a list of unity batch sizes, e.g. off,8,16,32,0"
+    )
+
+    parser.add_argument(
+        "--no_prebuilt_cache",
+        action='store_false',
+        required=False,
+        default=True,
+        dest='prebuilt_cache',
+        help="Always build instead of reusing a cached binary with the same inputs"
+    )
+
+    parser.add_argument(
+        "--prebuilt_cache_dir",
+        type=str,
+        required=False,
+        default=get_default_cache_dir(),
+        help="The store for prebuilt binaries (default: {})".format(get_default_cache_dir())
+    )
+
+    parser.add_argument(
+        "--prebuilt_cache_size",
+        type=int,
+        required=False,
+        default=default_prebuilt_cache_size_mb,
+        help="The maximum size of the prebuilt store in MB (default: {})".format(default_prebuilt_cache_size_mb)
+    )
+
+    parser.add_argument(
+        "--pgo",
+        action='store_true',
+        required=False,
+        default=False,
+        dest='pgo',
+        help="Build a profile guided and link time optimized release binary using a headless godot training workload"
+    )
+
+    parser.add_argument(
+        "--godot_path",
+        type=str,
+        required=False,
+        default="",
+        help="The godot editor console executable used for the PGO training workload"
+    )
+
+    parser.add_argument(
+        "--pgo_iterations",
+        type=int,
+        required=False,
+        default=10,
+        help="How often the PGO training workload indexes and resolves all the assets (default: 10)"
+    )
+
+    parser.add_argument(
+        "--pgo_runs",
+        type=int,
+        required=False,
+        default=3,
+        help="How often the workload is timed when comparing the builds, the fastest run counts (default: 3)"
+    )
+
+    parser.add_argument(
+        "--watch",
+        action='store_true',
+        required=False,
+        default=False,
+        dest='watch',
+        help="Rebuild and install the extension whenever the sources or CMakeLists.txt change"
+    )
+
+    parser.add_argument(
+        "--watch_debounce",
+        type=int,
+        required=False,
+        default=300,
+        help="How long to wait for more changes before rebuilding in watch mode, in ms (default: 300)"
+    )
+
+    parser.add_argument(
+        "--profile_build", "--profile-build",
+        action='store_true',
+        required=False,
+        default=False,
+        dest='profile_build',
+        help="Write a build time report and a chrome trace to <build_dir>/build_profile"
+    )
+
+    parser.add_argument(
+        "--profile_threshold",
+        type=float,
+        required=False,
+        default=20.0,
+        help="Slowdown in percent compared to the last profiled build that is reported as a regression (default: 20)"
+    )
+
     args = vars(parser.parse_args())
     print(args)
 
-    cmake_command: List[str] = []
+    if args["compiler_cache"]:
+        cache_target_arch = host_arch if args["target_arch"] == "native" else args["target_arch"]
+        cache_build_dir = get_build_dir(cache_target_arch, args["build_mode"], args["build_dir"])
+        cache_size = args["compiler_cache_size"] * 1024 * 1024
+        bundle_path = args["compiler_cache_bundle"] or os.path.join(
+            "extensions", "compiler_cache_{}_{}.tar.gz".format(cache_target_arch, args["build_mode"])
+        )
+
+        match args["compiler_cache"]:
+            case "stats":
+                compiler_cache.show_stats(cache_build_dir)
+            case "trim":
+                compiler_cache.trim_cache(cache_build_dir, cache_size)
+            case "export":
+                compiler_cache.export_cache(cache_build_dir, bundle_path, cache_size)
+            case "import":
+                if not compiler_cache.import_cache(cache_build_dir, bundle_path):
+                    exit(1)
+        exit(0)
+
+    if args["stop_build_containers"]:
+        stop_build_containers()
+        exit(0)
+
+    if args["unity_benchmark"]:
+        cmake_command, linker = get_cmake_command(
+            args["target_arch"], host_arch, project_dir, "extensions", args["refresh_images"], args["build_container"]
+        )
+        if args["set_linker"]:
+            linker = args["set_linker"]
+        if linker:
+            os.environ["CMAKE_LINKER_TYPE"] = linker
+
+        batch_sizes = [batch_size.strip() for batch_size in args["unity_benchmark"].split(",") if batch_size.strip()]
+        if not run_unity_benchmark(
+            cmake_command,
+            args["build_mode"],
+            args["build_system"],
+            project_dir,
+            args["jobs"],
+            batch_sizes,
+        ):
+            exit(1)
+        exit(0)
+
+    if args["targets"]:
+        try:
+            targets = parse_targets(args["targets"], host_arch)
+        except ValueError as error:
+            print(error)
+            exit(1)
 
-    linker = args["set_linker"]
+        if not build_targets(args, targets, host_arch, project_dir):
+            exit(1)
+        exit(0)
 
     native_build = args["target_arch"] == "native"
     if native_build:
         args["target_arch"] = host_arch
 
     # Set the build directory
-    build_dir = os.path.join("extensions", "build_{}_{}".format(args["target_arch"], args["build_mode"]))
-    if args["build_dir"]:
-        build_dir = args["build_dir"]
+    build_dir = get_build_dir(args["target_arch"], args["build_mode"], args["build_dir"])
 
     if native_build:
         build_dir = os.path.abspath(build_dir)
@@ -135,55 +1315,42 @@ if __name__ == "__main__":
 
     os.makedirs(build_dir, exist_ok=True)
 
-    if host_arch == args["target_arch"]:
-        print("Building natively for the host architecture ({})".format(host_arch))
-
-        cmake_command = ["cmake"]
-
-        if linker == "":
-            if shutil.which("mold"):
-                linker = "MOLD"
-    else:
-        print("Building with docker for the target architecture: {}".format(args["target_arch"]))
-        
-        cmake_command = setup_docker_image(args["target_arch"], project_dir, build_dir)
+    cmake_command, linker = get_cmake_command(
+        args["target_arch"], host_arch, project_dir, build_dir, args["refresh_images"], args["build_container"]
+    )
+    if args["set_linker"]:
+        linker = args["set_linker"]
 
     # prepare the environment
     if linker:
         print("Using linker: {}".format(linker))
         os.environ["CMAKE_LINKER_TYPE"] = linker
 
-    # Run the setup command
-    if not args['skip_setup']:
-        setup_command = [
-            *cmake_command,
-            "-DCMAKE_BUILD_TYPE={}".format(args["build_mode"].capitalize()),
-            "-B", build_dir,
-            args["build_system"],
-            "extensions"
-        ]
-        setup_output = subprocess.run(setup_command, cwd=project_dir, check=False)
-        if setup_output.returncode != 0:
-            print("Failed to run the setup command")
-            print(setup_output)
+    if args["pgo"]:
+        if args["target_arch"] != host_arch:
+            print("PGO builds have to run the training workload and only work for the host architecture")
             exit(1)
 
-    # Compile the source file
-    compile_command = [*cmake_command, "--build", build_dir]
-    if args["jobs"] > 0:
-        compile_command.append("--parallel")
-        compile_command.append(str(args["jobs"]))
-    compile_output = subprocess.run(compile_command, cwd=project_dir, check=False)
-    if compile_output.returncode != 0:
-        print("Failed to run the compile command")
-        print(compile_output)
-        exit(1)
+        if not args["godot_path"]:
+            print("PGO builds need a godot executable for the training workload (--godot_path)")
+            exit(1)
 
-    # install the build output
-    install_command = [*cmake_command, "--install", build_dir]
-    install_output = subprocess.run(install_command, cwd=project_dir, check=False)
-    if install_output.returncode != 0:
-        print("Failed to install the build output")
-        print(install_output)
+        if not run_pgo_build(args, cmake_command, args["target_arch"], project_dir):
+            exit(1)
+        exit(0)
+
+    if args["watch"]:
+        run_watch_mode(args, cmake_command, linker, args["target_arch"], args["build_mode"], build_dir, project_dir)
+        exit(0)
+
+    if not build_or_restore(
+        args,
+        cmake_command,
+        linker,
+        args["target_arch"],
+        args["build_mode"],
+        build_dir,
+        project_dir,
+        args["jobs"],
+    ):
         exit(1)
-    
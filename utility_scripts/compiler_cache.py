@@ -0,0 +1,147 @@
+import os
+import shutil
+import subprocess
+import tarfile
+import time
+
+from typing import List, Tuple
+
+
+# The compiler launcher runs in the build dir, so every build dir has its own caches
+cache_dir_names = [".ccache", ".sccache"]
+
+
+def get_cache_dirs(build_dir: str) -> List[str]:
+    return [os.path.join(build_dir, cache_dir_name) for cache_dir_name in cache_dir_names]
+
+
+def get_cache_files(cache_dir: str) -> List[Tuple[float, int, str]]:
+    # returns (mtime, size, path) of every file in the cache, newest first
+    cache_files = []
+    for root, _, files in os.walk(cache_dir):
+        for file in files:
+            file_path = os.path.join(root, file)
+            try:
+                file_stat = os.stat(file_path)
+            except OSError:
+                continue
+            cache_files.append((file_stat.st_mtime, file_stat.st_size, file_path))
+
+    cache_files.sort(reverse=True)
+    return cache_files
+
+
+def get_ccache_env(cache_dir: str) -> dict:
+    env = os.environ.copy()
+    env["CCACHE_DIR"] = os.path.abspath(cache_dir)
+    return env
+
+
+def format_size(size: int) -> str:
+    for unit in ["B", "KB", "MB", "GB"]:
+        if size < 1024 or unit == "GB":
+            return "{:.1f} {}".format(size, unit)
+        size /= 1024
+
+
+def show_stats(build_dir: str):
+    for cache_dir in get_cache_dirs(build_dir):
+        if not os.path.isdir(cache_dir):
+            print("{}: no cache".format(cache_dir))
+            continue
+
+        cache_files = get_cache_files(cache_dir)
+        total_size = sum(size for _, size, _ in cache_files)
+        print("{}: {} files, {}".format(cache_dir, len(cache_files), format_size(total_size)))
+
+        if cache_files:
+            oldest = time.time() - cache_files[-1][0]
+            print("  least recently used entry: {:.1f} days ago".format(oldest / 86400))
+
+        if cache_dir.endswith(".ccache") and shutil.which("ccache"):
+            subprocess.run(["ccache", "--show-stats"], env=get_ccache_env(cache_dir))
+
+
+def trim_cache(build_dir: str, max_size: int):
+    # Removes the least recently used entries until every cache fits into max_size.
+    # Both ccache and sccache update the mtime of an entry when it is used.
+    for cache_dir in get_cache_dirs(build_dir):
+        if not os.path.isdir(cache_dir):
+            continue
+
+        if cache_dir.endswith(".ccache") and shutil.which("ccache"):
+            # let ccache do it, so its statistics stay correct. --max-size would store the limit
+            # in the ccache.conf of the cache, the environment only applies it to this cleanup
+            env = get_ccache_env(cache_dir)
+            env["CCACHE_MAXSIZE"] = "{}k".format(max_size // 1024)
+            subprocess.run(["ccache", "--cleanup"], env=env, check=False)
+            continue
+
+        total_size = 0
+        removed_size = 0
+        for _, size, file_path in get_cache_files(cache_dir):
+            total_size += size
+            if total_size <= max_size:
+                continue
+
+            os.remove(file_path)
+            removed_size += size
+
+        print("{}: removed {}".format(cache_dir, format_size(removed_size)))
+
+
+def export_cache(build_dir: str, bundle_path: str, max_size: int):
+    # Writes the most recently used entries of the build dir's caches into a compressed bundle.
+    # Entries that weren't used lately would only slow down the transfer of the bundle.
+    bundle_dir = os.path.dirname(bundle_path)
+    if bundle_dir:
+        os.makedirs(bundle_dir, exist_ok=True)
+
+    temp_bundle = "{}.{}.tmp".format(bundle_path, os.getpid())
+    exported_files = 0
+    exported_size = 0
+
+    # the newest entries of all caches together, so one cache can't use up the whole budget
+    cache_files = []
+    for cache_dir in get_cache_dirs(build_dir):
+        cache_files += get_cache_files(cache_dir)
+    cache_files.sort(reverse=True)
+
+    with tarfile.open(temp_bundle, "w:gz", compresslevel=3) as bundle:
+        for _, size, file_path in cache_files:
+            if exported_size + size > max_size:
+                continue
+
+            bundle.add(file_path, arcname=os.path.relpath(file_path, build_dir))
+            exported_files += 1
+            exported_size += size
+
+    os.replace(temp_bundle, bundle_path)
+    print("Exported {} cache files ({}) to {} ({} compressed)".format(
+        exported_files, format_size(exported_size), bundle_path, format_size(os.path.getsize(bundle_path))
+    ))
+
+
+def import_cache(build_dir: str, bundle_path: str) -> bool:
+    if not os.path.isfile(bundle_path):
+        print("No cache bundle found at {}".format(bundle_path))
+        return False
+
+    os.makedirs(build_dir, exist_ok=True)
+    build_dir = os.path.abspath(build_dir)
+    imported_files = 0
+
+    with tarfile.open(bundle_path, "r:*") as bundle:
+        for member in bundle.getmembers():
+            # only accept files that belong into one of the cache dirs
+            target = os.path.abspath(os.path.join(build_dir, member.name))
+            if not member.isfile() or not any(
+                os.path.commonpath([cache_dir, target]) == cache_dir for cache_dir in get_cache_dirs(build_dir)
+            ):
+                continue
+
+            bundle.extract(member, build_dir, filter="data")
+            imported_files += 1
+
+    print("Imported {} cache files from {} into {}".format(imported_files, bundle_path, build_dir))
+    return True
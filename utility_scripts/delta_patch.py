@@ -0,0 +1,472 @@
+import argparse
+import hashlib
+import json
+import lzma
+import os
+import random
+import shutil
+import stat
+import sys
+import tempfile
+import time
+import zipfile
+
+from contextlib import contextmanager
+from typing import Dict, Iterator, Tuple
+
+
+# Delta patches between two exports of the game.
+# The patch is a zip with a manifest.json and content addressed blobs. Every file of the new export
+# is either copied from the old export, rebuilt from a binary diff against the old file with the same path,
+# or stored completely.
+
+patch_format = 1
+
+# content defined chunking, the chunk borders only depend on the bytes around them,
+# so inserting data only changes the chunks around the insertion and not everything after it.
+# Every byte is mapped to one bit and a chunk ends after a run of 11 set bits (about every 6 KB).
+# Searching the run with bytes.find is a lot faster than a rolling hash in python.
+min_chunk_size = 2 * 1024
+max_chunk_size = 64 * 1024
+
+boundary_table = bytes(ord("1") if random.Random(index).getrandbits(1) else ord("0") for index in range(256))
+boundary_marker = b"1" * 11
+
+# the files are read in blocks of this size, so the size of an export doesn't matter
+read_size = 1024 * 1024
+
+
+def hash_file(f) -> Tuple[str, int]:
+    file_hash = hashlib.sha256()
+    size = 0
+    for data in iter(lambda: f.read(read_size), b""):
+        file_hash.update(data)
+        size += len(data)
+
+    return file_hash.hexdigest(), size
+
+
+def read_tree(path: str) -> Dict[str, Tuple[str, int, int]]:
+    # Reads an export (a zip archive or a directory) as path -> (sha256, size, mode).
+    # The files are streamed, open_tree_file opens them again when their content is needed.
+    tree = {}
+    if os.path.isdir(path):
+        for root, _, files in os.walk(path):
+            for file in files:
+                file_path = os.path.join(root, file)
+                with open(file_path, "rb") as f:
+                    sha256, size = hash_file(f)
+                tree[os.path.relpath(file_path, path).replace("\\", "/")] = (sha256, size, stat.S_IMODE(os.stat(file_path).st_mode))
+        return tree
+
+    with zipfile.ZipFile(path, "r") as archive:
+        for info in archive.infolist():
+            if info.is_dir():
+                continue
+            mode = (info.external_attr >> 16) & 0o777
+            with archive.open(info) as f:
+                sha256, size = hash_file(f)
+            tree[info.filename] = (sha256, size, mode or 0o644)
+
+    return tree
+
+
+@contextmanager
+def open_tree_file(path: str, file: str, seekable: bool = False):
+    # opens a file of an export, zip members that need to be seekable are extracted into a temporary file
+    if os.path.isdir(path):
+        with open(os.path.join(path, file), "rb") as f:
+            yield f
+        return
+
+    with zipfile.ZipFile(path, "r") as archive, archive.open(file) as member:
+        if not seekable:
+            yield member
+            return
+
+        with tempfile.TemporaryFile() as f:
+            shutil.copyfileobj(member, f, read_size)
+            f.seek(0)
+            yield f
+
+
+def get_tree_hash(tree: Dict[str, Tuple[str, int, int]]) -> str:
+    tree_hash = hashlib.sha256()
+    for path in sorted(tree.keys()):
+        sha256, _, mode = tree[path]
+        tree_hash.update("{}\0{:o}\0{}\n".format(path, mode, sha256).encode())
+
+    return tree_hash.hexdigest()
+
+
+def iter_chunks(f) -> Iterator[Tuple[int, bytes]]:
+    # Streams the (offset, data) of the content defined chunks of a file.
+    # A chunk border only depends on the max_chunk_size bytes after the start of the chunk,
+    # so the buffer is refilled before fewer bytes than that are left.
+    buffer = b""
+    buffer_offset = 0
+    end_of_file = False
+    while not end_of_file or buffer:
+        data = f.read(read_size) if not end_of_file else b""
+        end_of_file = not data
+        buffer += data
+        bits = buffer.translate(boundary_table)
+
+        start = 0
+        while start < len(buffer) and (end_of_file or len(buffer) - start >= max_chunk_size):
+            end = min(start + max_chunk_size, len(buffer))
+            boundary = bits.find(boundary_marker, min(start + min_chunk_size, end), end)
+            position = end if boundary < 0 else boundary + len(boundary_marker)
+            yield buffer_offset + start, buffer[start:position]
+            start = position
+
+        buffer = buffer[start:]
+        buffer_offset += start
+
+
+def index_chunks(f) -> Dict[bytes, int]:
+    # the offset of every chunk of the old file by its hash, the data itself isn't kept
+    chunks = {}
+    for offset, chunk in iter_chunks(f):
+        chunks.setdefault(hashlib.sha1(chunk).digest(), offset)
+
+    return chunks
+
+
+def write_varint(output: bytearray, value: int):
+    while value >= 0x80:
+        output.append((value & 0x7F) | 0x80)
+        value >>= 7
+    output.append(value)
+
+
+def read_varint(f) -> int:
+    value = 0
+    shift = 0
+    while True:
+        byte = f.read(1)
+        if not byte:
+            raise ValueError("Truncated diff")
+        value |= (byte[0] & 0x7F) << shift
+        if byte[0] < 0x80:
+            return value
+        shift += 7
+
+
+def copy_stream(source, write, length: int | None = None):
+    # copies length bytes, or everything if length is None, from source to write
+    while length is None or length > 0:
+        data = source.read(read_size if length is None else min(read_size, length))
+        if not data:
+            if length is not None:
+                raise ValueError("Unexpected end of data")
+            return
+        write(data)
+        if length is not None:
+            length -= len(data)
+
+
+def create_diff(old_chunks: Dict[bytes, int], new_file, output):
+    # Encodes new_file as copies of chunks of the old file and literal data and writes it lzma compressed to output.
+    # Ops: b"C" offset length copies from the old file, b"D" length data inserts new bytes
+    compressor = lzma.LZMACompressor(preset=6)
+    copy = None
+    literal = bytearray()
+
+    def flush():
+        nonlocal copy
+        op = bytearray()
+        if copy is not None:
+            op += b"C"
+            write_varint(op, copy[0])
+            write_varint(op, copy[1])
+            copy = None
+        if literal:
+            op += b"D"
+            write_varint(op, len(literal))
+            op += literal
+            literal.clear()
+        output.write(compressor.compress(bytes(op)))
+
+    for _, chunk in iter_chunks(new_file):
+        old_offset = old_chunks.get(hashlib.sha1(chunk).digest())
+        if old_offset is None:
+            if copy is not None:
+                flush()
+            literal += chunk
+            if len(literal) >= read_size:
+                flush()
+            continue
+
+        # extend the last copy if the chunks are next to each other in the old file as well
+        if copy is not None and copy[0] + copy[1] == old_offset:
+            copy[1] += len(chunk)
+            continue
+
+        flush()
+        copy = [old_offset, len(chunk)]
+
+    flush()
+    output.write(compressor.flush())
+
+
+def apply_diff(old_file, diff_file, write):
+    # old_file has to be seekable, the copies can point anywhere in it
+    with lzma.open(diff_file, "rb") as diff:
+        while True:
+            op = diff.read(1)
+            if not op:
+                return
+
+            if op == b"C":
+                offset = read_varint(diff)
+                length = read_varint(diff)
+                old_file.seek(offset)
+                copy_stream(old_file, write, length)
+            elif op == b"D":
+                copy_stream(diff, write, read_varint(diff))
+            else:
+                raise ValueError("Invalid diff op {!r}".format(op))
+
+
+def compress_file(source, output):
+    compressor = lzma.LZMACompressor(preset=6)
+    copy_stream(source, lambda data: output.write(compressor.compress(data)))
+    output.write(compressor.flush())
+
+
+def create_patch(old_path: str, new_path: str, patch_path: str) -> Dict:
+    # Only one file is read at a time and the blobs go through temporary files into the patch,
+    # so big exports don't have to fit into memory.
+    start_time = time.monotonic()
+    old_tree = read_tree(old_path)
+    new_tree = read_tree(new_path)
+
+    old_by_hash = {}
+    for path, (sha256, _, _) in old_tree.items():
+        old_by_hash.setdefault(sha256, path)
+
+    files = []
+    stats = {"unchanged": 0, "diffed": 0, "added": 0, "removed": 0, "diffed_bytes": 0, "added_bytes": 0}
+
+    patch_dir = os.path.dirname(patch_path)
+    if patch_dir:
+        os.makedirs(patch_dir, exist_ok=True)
+
+    # the blobs are compressed already
+    temp_path = "{}.{}.tmp".format(patch_path, os.getpid())
+    with zipfile.ZipFile(temp_path, "w", zipfile.ZIP_STORED) as patch, tempfile.TemporaryDirectory(dir=patch_dir or None) as work_dir:
+        blob_hashes = set()
+        for path in sorted(new_tree.keys()):
+            sha256, size, mode = new_tree[path]
+            entry = {"path": path, "sha256": sha256, "size": size, "mode": mode}
+
+            if sha256 in old_by_hash:
+                # unchanged or moved, the old export has it already
+                entry["source"] = "old"
+                entry["base"] = old_by_hash[sha256]
+                stats["unchanged"] += 1
+                files.append(entry)
+                continue
+
+            blob_file = None
+            if path in old_tree:
+                with open_tree_file(old_path, path) as old_file:
+                    old_chunks = index_chunks(old_file)
+                blob_file = os.path.join(work_dir, "diff")
+                with open_tree_file(new_path, path) as new_file, open(blob_file, "wb") as output:
+                    create_diff(old_chunks, new_file, output)
+                entry["source"] = "diff"
+                entry["base"] = path
+                entry["base_sha256"] = old_tree[path][0]
+
+            # compressing big files is slow, so that is skipped when the diff is small anyway
+            if blob_file is None or os.path.getsize(blob_file) > size // 8:
+                full_blob_file = os.path.join(work_dir, "full")
+                with open_tree_file(new_path, path) as new_file, open(full_blob_file, "wb") as output:
+                    compress_file(new_file, output)
+                if blob_file is None or os.path.getsize(full_blob_file) < os.path.getsize(blob_file):
+                    blob_file = full_blob_file
+                    entry["source"] = "blob"
+                    entry.pop("base", None)
+                    entry.pop("base_sha256", None)
+
+            with open(blob_file, "rb") as f:
+                blob_hash, blob_size = hash_file(f)
+            if blob_hash not in blob_hashes:
+                patch.write(blob_file, "blobs/" + blob_hash)
+                blob_hashes.add(blob_hash)
+            entry["blob"] = blob_hash
+            files.append(entry)
+
+            if entry["source"] == "diff":
+                stats["diffed"] += 1
+                stats["diffed_bytes"] += blob_size
+            else:
+                stats["added"] += 1
+                stats["added_bytes"] += blob_size
+
+        stats["removed"] = len([path for path in old_tree.keys() if path not in new_tree])
+
+        manifest = {
+            "format": patch_format,
+            "old_tree": get_tree_hash(old_tree),
+            "new_tree": get_tree_hash(new_tree),
+            "files": files,
+            "stats": stats,
+        }
+        patch.writestr("manifest.json", json.dumps(manifest, indent=1))
+
+    os.replace(temp_path, patch_path)
+
+    stats["patch_size"] = os.path.getsize(patch_path)
+    stats["full_size"] = os.path.getsize(new_path) if os.path.isfile(new_path) else sum(size for _, size, _ in new_tree.values())
+    stats["duration"] = time.monotonic() - start_time
+    return stats
+
+
+def is_safe_path(path: str) -> bool:
+    # patches are downloaded by players, their paths must not point outside of the output
+    parts = path.replace("\\", "/").split("/")
+    if path == "" or os.path.isabs(path) or path.startswith(("/", "\\")) or ":" in parts[0]:
+        return False
+    return ".." not in parts
+
+
+def patch_file(old_path: str, old_tree: Dict[str, Tuple[str, int, int]], patch: zipfile.ZipFile, entry: Dict, output):
+    # streams one file of the new export into output and verifies it
+    file_hash = hashlib.sha256()
+
+    def write(data: bytes):
+        file_hash.update(data)
+        output.write(data)
+
+    if entry["source"] == "old":
+        with open_tree_file(old_path, entry["base"]) as old_file:
+            copy_stream(old_file, write)
+    elif entry["source"] == "diff":
+        if old_tree[entry["base"]][0] != entry["base_sha256"]:
+            raise ValueError("{} in the old export doesn't match the patch".format(entry["base"]))
+        with open_tree_file(old_path, entry["base"], seekable=True) as old_file, patch.open("blobs/" + entry["blob"]) as diff:
+            apply_diff(old_file, diff, write)
+    else:
+        with patch.open("blobs/" + entry["blob"]) as blob, lzma.open(blob, "rb") as data:
+            copy_stream(data, write)
+
+    if file_hash.hexdigest() != entry["sha256"]:
+        raise ValueError("Verification of {} failed".format(entry["path"]))
+
+
+def apply_patch(old_path: str, patch_path: str, output_path: str):
+    # Rebuilds the new export from the old one and verifies every file and the whole tree.
+    # The output is a directory, or a zip archive if output_path ends with .zip.
+    # It is written next to the output first and only moved into place once everything is verified.
+    old_tree = read_tree(old_path)
+    output_dir = os.path.abspath(output_path)
+    temp_output = "{}.{}.tmp".format(output_dir, os.getpid())
+
+    with zipfile.ZipFile(patch_path, "r") as patch:
+        manifest = json.loads(patch.read("manifest.json"))
+        if manifest["format"] != patch_format:
+            raise ValueError("Unsupported patch format {}".format(manifest["format"]))
+
+        if get_tree_hash(old_tree) != manifest["old_tree"]:
+            # only the files the patch uses are checked below, so a modified old export can still work
+            print("Warning: the old export differs from the one the patch was made for")
+
+        unsafe_paths = [entry["path"] for entry in manifest["files"] if not is_safe_path(entry["path"])]
+        if unsafe_paths:
+            raise ValueError("The patch contains unsafe paths: {}".format(", ".join(unsafe_paths)))
+
+        new_tree = {}
+        try:
+            if output_path.endswith(".zip"):
+                with zipfile.ZipFile(temp_output, "w", zipfile.ZIP_DEFLATED) as archive:
+                    for entry in sorted(manifest["files"], key=lambda entry: entry["path"]):
+                        info = zipfile.ZipInfo(entry["path"], date_time=(1980, 1, 1, 0, 0, 0))
+                        info.external_attr = (stat.S_IFREG | entry["mode"]) << 16
+                        info.compress_type = zipfile.ZIP_DEFLATED
+                        with archive.open(info, "w", force_zip64=True) as output:
+                            patch_file(old_path, old_tree, patch, entry, output)
+                        new_tree[entry["path"]] = (entry["sha256"], entry["size"], entry["mode"])
+            else:
+                for entry in manifest["files"]:
+                    file_path = os.path.abspath(os.path.join(temp_output, entry["path"]))
+                    if os.path.commonpath([temp_output, file_path]) != temp_output:
+                        raise ValueError("Refusing to write {} outside of {}".format(entry["path"], output_path))
+
+                    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+                    with open(file_path, "wb") as output:
+                        patch_file(old_path, old_tree, patch, entry, output)
+                    os.chmod(file_path, entry["mode"])
+                    new_tree[entry["path"]] = (entry["sha256"], entry["size"], entry["mode"])
+
+            if get_tree_hash(new_tree) != manifest["new_tree"]:
+                raise ValueError("Verification of the patched export failed")
+        except BaseException:
+            if os.path.isdir(temp_output):
+                shutil.rmtree(temp_output, ignore_errors=True)
+            elif os.path.exists(temp_output):
+                os.remove(temp_output)
+            raise
+
+    if output_path.endswith(".zip"):
+        os.replace(temp_output, output_dir)
+    else:
+        for path in new_tree.keys():
+            file_path = os.path.join(output_dir, path)
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            os.replace(os.path.join(temp_output, path), file_path)
+        shutil.rmtree(temp_output, ignore_errors=True)
+
+    print("Patched {} files into {}, verified {}".format(len(new_tree), output_path, manifest["new_tree"][:16]))
+
+
+def print_report(stats: Dict, patch_path: str):
+    print("Patch {}".format(patch_path))
+    print("  unchanged files: {}".format(stats["unchanged"]))
+    print("  diffed files:    {} ({:.1f} KB)".format(stats["diffed"], stats["diffed_bytes"] / 1024))
+    print("  added files:     {} ({:.1f} KB)".format(stats["added"], stats["added_bytes"] / 1024))
+    print("  removed files:   {}".format(stats["removed"]))
+    print("  patch size: {:.1f} KB, full export: {:.1f} KB ({:.1%}) in {:.1f}s".format(
+        stats["patch_size"] / 1024, stats["full_size"] / 1024, stats["patch_size"] / max(1, stats["full_size"]), stats["duration"]
+    ))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="create and apply delta patches between two exports"
+    )
+
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    create_parser = subparsers.add_parser("create", help="create a patch from the old to the new export")
+    create_parser.add_argument("old", type=str, help="The previous export (zip archive or directory)")
+    create_parser.add_argument("new", type=str, help="The new export (zip archive or directory)")
+    create_parser.add_argument("patch", type=str, help="The patch file to write")
+    create_parser.add_argument(
+        "--report",
+        type=str,
+        default="",
+        help="Also write the report as json to this file",
+    )
+
+    apply_parser = subparsers.add_parser("apply", help="rebuild the new export from the old one and a patch")
+    apply_parser.add_argument("old", type=str, help="The previous export (zip archive or directory)")
+    apply_parser.add_argument("patch", type=str, help="The patch file")
+    apply_parser.add_argument("output", type=str, help="The output directory, or zip archive if it ends with .zip")
+
+    args = vars(parser.parse_args())
+
+    if args["command"] == "create":
+        stats = create_patch(args["old"], args["new"], args["patch"])
+        print_report(stats, args["patch"])
+        if args["report"] != "":
+            with open(args["report"], "w") as f:
+                json.dump(stats, f, indent=2)
+    else:
+        try:
+            apply_patch(args["old"], args["patch"], args["output"])
+        except (ValueError, KeyError) as e:
+            print("Failed to apply the patch: {}".format(e))
+            sys.exit(1)
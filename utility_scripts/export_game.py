@@ -1,10 +1,253 @@
 import argparse
+import hashlib
+import json
 import os
 import subprocess
 import sys
 import platform
+import time
 import zipfile
 
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Tuple
+
+import delta_patch
+
+
+# the part of the preset name and the archive name for every export platform
+export_platforms = {
+    "windows_amd64": ("Windows (amd64)", "_windows_amd64.zip"),
+    "windows_arm64": ("Windows (arm64)", "_windows_arm64.zip"),
+    "linux_amd64": ("Linux (amd64)", "_linux_amd64.zip"),
+    "linux_arm64": ("Linux (arm64)", "_linux_arm64.zip"),
+    "macos": ("macOS", "_macos.zip"),
+}
+
+
+def get_export_profile(export_type: str, export_platform: str) -> Tuple[str, str]:
+    export_profile = ""
+    export_archive = "openchamp"
+    if export_type == "client":
+        export_profile = "Client "
+        export_archive += "_client"
+    else:
+        export_profile = "Server "
+        export_archive += "_server"
+
+    profile_suffix, archive_suffix = export_platforms[export_platform]
+    return export_profile + profile_suffix, export_archive + archive_suffix
+
+
+def get_export_platform(export_profile: str) -> str | None:
+    for export_type in ["client", "server"]:
+        for export_platform in export_platforms.keys():
+            if get_export_profile(export_type, export_platform)[0] == export_profile:
+                return export_platform
+    return None
+
+
+def get_godot_release(godot_command: str) -> Tuple[str, bool]:
+    # Turns the version of the executable (4.3.stable.official.77dcf97d8 or 4.3.1.rc2.mono.official.77dcf97d8)
+    # into the release tag (4.3-stable) and whether it is a mono build.
+    # The version numbers come first, then the status and mono, the rest is the build name and the commit.
+    version = subprocess.run([godot_command, "--version"], capture_output=True).stdout.decode().strip()
+    parts = version.split(".")
+    number_count = 0
+    while number_count < len(parts) and parts[number_count].isdigit():
+        number_count += 1
+
+    numbers = parts[:number_count]
+    status = parts[number_count] if number_count < len(parts) else "stable"
+    mono = number_count + 1 < len(parts) and parts[number_count + 1] == "mono"
+    return ".".join(numbers) + "-" + status, mono
+
+
+def install_export_templates(godot_command: str, platforms: List[str]):
+    # Extracts the templates the exports need from the templates archive setup_godot.py cached,
+    # if they aren't installed yet. Nothing is downloaded, godot reports the templates that are really missing.
+    setup_godot = os.path.join(".github", "actions", "setup_godot", "setup_godot.py")
+    if not platforms or not os.path.exists(setup_godot):
+        return
+
+    godot_release, mono = get_godot_release(godot_command)
+    if mono:
+        print("setup_godot.py only installs the templates of non-mono builds, not checking the mono templates")
+        return
+
+    setup_output = subprocess.run([
+        sys.executable,
+        setup_godot,
+        f"--godot_version={godot_release}",
+        f"--export_platforms={','.join(platforms)}",
+        "--offline",
+        "templates"
+    ])
+    if setup_output.returncode != 0:
+        print("Warning: could not install the export templates for {} from the cache of setup_godot.py".format(
+            ", ".join(platforms)
+        ))
+
+
+def get_archive_name(export_profile: str) -> str:
+    # the reverse of get_export_profile, presets that don't follow the naming get a generic name
+    for export_type in ["client", "server"]:
+        for export_platform in export_platforms.keys():
+            profile, archive = get_export_profile(export_type, export_platform)
+            if profile == export_profile:
+                return archive
+
+    name = "".join(char if char.isalnum() else "_" for char in export_profile.lower())
+    return "openchamp_" + "_".join(part for part in name.split("_") if part) + ".zip"
+
+
+def read_export_presets(presets_file: str) -> List[str]:
+    # returns the names of all presets in export_presets.cfg in their order
+    presets = []
+    in_preset = False
+    with open(presets_file, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("["):
+                in_preset = line.startswith("[preset.") and not line.endswith(".options]")
+                continue
+
+            if in_preset and line.startswith("name="):
+                presets.append(line[len("name="):].strip('"'))
+
+    return presets
+
+
+def get_file_sha256(path: str) -> str:
+    file_hash = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            file_hash.update(chunk)
+
+    return file_hash.hexdigest()
+
+
+def run_export(godot_command: str, export_arg: str, export_profile: str, export_archive: str) -> Dict:
+    # The output is collected and printed at once, so concurrent exports don't interleave
+    start_time = time.monotonic()
+    export_output = subprocess.run([
+        godot_command,
+        "--headless",
+        export_arg,
+        export_profile,
+        f"build/{export_archive}"
+    ], capture_output=True)
+    duration = time.monotonic() - start_time
+
+    result = {
+        "profile": export_profile,
+        "archive": export_archive,
+        "returncode": export_output.returncode,
+        "duration": round(duration, 2),
+        "output": export_output.stdout.decode(errors="replace") + export_output.stderr.decode(errors="replace"),
+    }
+
+    archive_path = os.path.join("build", export_archive)
+    if export_output.returncode == 0 and os.path.exists(archive_path):
+        result["size"] = os.path.getsize(archive_path)
+        result["sha256"] = get_file_sha256(archive_path)
+
+    return result
+
+
+def create_release_patches(previous_release: str, archives: List[str]) -> Dict[str, Dict]:
+    # Creates build/patches/<archive>.patch for every client archive that the previous release has as well.
+    # Players update with delta_patch.py apply instead of downloading the whole archive again.
+    patches = {}
+    for archive in archives:
+        previous_archive = os.path.join(previous_release, archive)
+        if not archive.startswith("openchamp_client") or not os.path.exists(previous_archive):
+            continue
+
+        patch_path = os.path.join("build", "patches", archive[:-len(".zip")] + ".patch")
+        stats = delta_patch.create_patch(previous_archive, os.path.join("build", archive), patch_path)
+        delta_patch.print_report(stats, patch_path)
+        patches[archive] = {
+            "patch": os.path.relpath(patch_path, "build").replace("\\", "/"),
+            "patch_size": stats["patch_size"],
+            "full_size": stats["full_size"],
+        }
+
+    return patches
+
+
+def export_profiles(
+    godot_command: str,
+    export_arg: str,
+    profiles: List[str],
+    jobs: int,
+    import_assets: bool,
+    previous_release: str = "",
+) -> bool:
+    # Imports the project once and then runs the exports concurrently.
+    # Every export still boots godot, but there is nothing left to import for it.
+    start_time = time.monotonic()
+
+    if import_assets:
+        import_output = subprocess.run([
+            sys.executable,
+            os.path.join("utility_scripts", "import_project.py"),
+            f"--godot_path={godot_command}"
+        ])
+        if import_output.returncode != 0:
+            print("Failed to import the project")
+            return False
+
+    install_export_templates(godot_command, sorted({
+        export_platform for export_platform in map(get_export_platform, profiles) if export_platform is not None
+    }))
+
+    import_time = time.monotonic() - start_time
+    results = []
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        futures = [
+            executor.submit(run_export, godot_command, export_arg, profile, get_archive_name(profile))
+            for profile in profiles
+        ]
+
+        for future in as_completed(futures):
+            result = future.result()
+            status = "done" if result["returncode"] == 0 else "FAILED"
+            print(f"Export of \"{result['profile']}\" {status} in {result['duration']:.1f}s")
+            if result["returncode"] != 0:
+                print(result["output"])
+            results.append(result)
+
+    results.sort(key=lambda result: profiles.index(result["profile"]))
+    for result in results:
+        del result["output"]
+
+    patches = {}
+    if previous_release != "":
+        patches = create_release_patches(previous_release, [result["archive"] for result in results if "size" in result])
+
+    godot_version = subprocess.run([godot_command, "--version"], capture_output=True).stdout.decode().strip()
+    manifest = {
+        "godot_version": godot_version,
+        "export_arg": export_arg,
+        "jobs": jobs,
+        "import_time": round(import_time, 2),
+        "total_time": round(time.monotonic() - start_time, 2),
+        "exports": results,
+        "patches": patches,
+    }
+
+    with open(os.path.join("build", "export_manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    print("{:<28} {:>10} {:>9}".format("profile", "size (MB)", "time (s)"))
+    for result in results:
+        size = "{:.1f}".format(result["size"] / 1024 / 1024) if "size" in result else "-"
+        print("{:<28} {:>10} {:>9.1f}".format(result["profile"], size, result["duration"]))
+    print(f"Exported {len(results)} profiles in {manifest['total_time']:.1f}s (import {import_time:.1f}s)")
+
+    return all(result["returncode"] == 0 for result in results)
+
+
 if __name__ == "__main__":
     # change to the project root, which is the dir of this file
     script_dir = os.path.abspath(os.path.dirname(os.path.realpath(__file__)))
@@ -38,14 +281,7 @@ if __name__ == "__main__":
         "--export_platform", "-ep",
         type=str,
         default="native",
-        choices=[
-            "native",
-            "windows_amd64",
-            "windows_arm64",
-            "linux_amd64",
-            "linux_arm64",
-            "macos"
-        ],
+        choices=["native"] + list(export_platforms.keys()),
         help="The export platform (default: native)",
         dest="export_platform"
     )
@@ -59,8 +295,76 @@ if __name__ == "__main__":
         dest="release_type"
     )
 
+    parser.add_argument(
+        "--all",
+        action="store_true",
+        help="Export every preset in export_presets.cfg",
+    )
+
+    parser.add_argument(
+        "--profiles",
+        type=str,
+        default="",
+        help="A comma separated list of the export presets to export",
+    )
+
+    parser.add_argument(
+        "--jobs", "-j",
+        type=int,
+        default=2,
+        help="How many exports run at the same time with --all or --profiles (default: 2)",
+    )
+
+    parser.add_argument(
+        "--previous_release",
+        type=str,
+        default="",
+        help="A directory with the archives of the previous release, delta patches for the client archives are created against them",
+    )
+
+    parser.add_argument(
+        "--skip_import",
+        action="store_true",
+        help="Don't run the import before the exports of --all or --profiles",
+    )
+
     args = vars(parser.parse_args())
 
+    # Run the export command
+    godot_command = args["godot_cmd"]
+    if godot_command == "":
+        print("No godot exe given. Exiting!")
+        sys.exit(1)
+
+    # check if godot command is executable
+    subprocess.run([godot_command, "--version"], check=True)
+
+    # create the export directory
+    os.makedirs("build", exist_ok=True)
+
+    # set up the export command
+    if args["release_type"] == "debug":
+        export_arg = "--export-debug"
+    else:
+        export_arg = "--export-release"
+
+    if args["all"] or args["profiles"] != "":
+        presets = read_export_presets("export_presets.cfg")
+        if args["all"]:
+            profiles = presets
+        else:
+            profiles = [profile.strip() for profile in args["profiles"].split(",") if profile.strip()]
+
+        unknown_profiles = [profile for profile in profiles if profile not in presets]
+        if unknown_profiles:
+            print("Unknown export presets: " + ", ".join(unknown_profiles))
+            print("Available presets: " + ", ".join(presets))
+            sys.exit(1)
+
+        if not export_profiles(godot_command, export_arg, profiles, args["jobs"], not args["skip_import"], args["previous_release"]):
+            sys.exit(1)
+        sys.exit(0)
+
     export_platform = args["export_platform"]
     if export_platform == "native":
         match host_os:
@@ -79,52 +383,12 @@ if __name__ == "__main__":
 
     print(f"Exporting {args['export_type']} for {export_platform} on {host_os} ({host_arch})")
 
-    export_profile = ""
-    export_archive = "openchamp"
-    if args["export_type"] == "client":
-        export_profile = "Client "
-        export_archive += "_client"
-    else:
-        export_profile = "Server "
-        export_archive += "_server"
-
-    match export_platform:
-        case "windows_amd64":
-            export_profile += "Windows (amd64)"
-            export_archive += "_windows_amd64.zip"
-        case "windows_arm64":
-            export_profile += "Windows (arm64)"
-            export_archive += "_windows_arm64.zip"
-        case "linux_amd64":
-            export_profile += "Linux (amd64)"
-            export_archive += "_linux_amd64.zip"
-        case "linux_arm64":
-            export_profile += "Linux (arm64)"
-            export_archive += "_linux_arm64.zip"
-        case "macos":
-            export_profile += "macOS"
-            export_archive += "_macos.zip"
+    export_profile, export_archive = get_export_profile(args["export_type"], export_platform)
 
     print(f"Exporting \"{export_profile}\" as \"{export_archive}\"")
 
-    # Run the export command
-    godot_command = args["godot_cmd"]
-    if godot_command == "":
-        print("No godot exe given. Exiting!")
-        sys.exit(1)
-
-    # check if godot command is executable
-    subprocess.run([godot_command, "--version"], check=True)
+    install_export_templates(godot_command, [export_platform])
 
-    # create the export directory
-    os.makedirs("build", exist_ok=True)
-
-    # set up the export command
-    if args["release_type"] == "debug":
-        export_arg = "--export-debug"
-    else:
-        export_arg = "--export-release"
-    
     export_command = [
         godot_command,
         "--headless",
@@ -135,3 +399,6 @@ if __name__ == "__main__":
 
     # run the export command
     export_output = subprocess.run(export_command, check=True)
+
+    if args["previous_release"] != "":
+        create_release_patches(args["previous_release"], [export_archive])
@@ -0,0 +1,311 @@
+import argparse
+import io
+import json
+import os
+import struct
+import sys
+import zipfile
+
+from typing import BinaryIO, Dict, List, Tuple
+
+
+# Breaks down the size of an export by asset group, file type and single resources
+# and compares it with the report of a previous export.
+
+pck_magic = b"GDPC"
+pack_dir_encrypted = 1 << 0
+pack_rel_filebase = 1 << 1
+
+# the asset packs are laid out as <pack>/<asset group>/<asset type>/..., like _index_asset_pack expects them
+asset_pack_dir = "default_assets"
+
+
+def find_pck_start(f: BinaryIO, size: int) -> int | None:
+    # a pck is either a file of its own or embedded at the end of the executable,
+    # followed by its size and the magic
+    f.seek(0)
+    if f.read(4) == pck_magic:
+        return 0
+
+    if size < 16:
+        return None
+
+    f.seek(size - 4)
+    if f.read(4) != pck_magic:
+        return None
+
+    f.seek(size - 12)
+    pck_size = struct.unpack("<Q", f.read(8))[0]
+    pck_start = size - pck_size - 12
+    if pck_start < 0:
+        return None
+
+    f.seek(pck_start)
+    if f.read(4) != pck_magic:
+        return None
+    return pck_start
+
+
+def read_pck(f: BinaryIO, size: int) -> Tuple[int, List[Tuple[str, int, int]]] | None:
+    # Returns the start of the pck and the (path, offset, size) of every file in it.
+    # Supports the pck format 2 (godot 4.0 - 4.3) and 3 (godot 4.4+).
+    pck_start = find_pck_start(f, size)
+    if pck_start is None:
+        return None
+
+    f.seek(pck_start + 4)
+    version, _, _, _, pack_flags = struct.unpack("<5I", f.read(20))
+    if version not in [2, 3]:
+        print("Unsupported pck format {}".format(version))
+        return None
+
+    file_base = struct.unpack("<Q", f.read(8))[0]
+    if pack_flags & pack_rel_filebase:
+        file_base += pck_start
+
+    if version == 3:
+        dir_offset = struct.unpack("<Q", f.read(8))[0]
+        f.seek(dir_offset + (pck_start if pack_flags & pack_rel_filebase else 0))
+    else:
+        f.seek(16 * 4, os.SEEK_CUR)
+
+    if pack_flags & pack_dir_encrypted:
+        print("The pck directory is encrypted, it can't be analyzed")
+        return None
+
+    files = []
+    file_count = struct.unpack("<I", f.read(4))[0]
+    for _ in range(file_count):
+        path_length = struct.unpack("<I", f.read(4))[0]
+        path = f.read(path_length).rstrip(b"\0").decode("utf-8", errors="replace")
+        offset, file_size = struct.unpack("<QQ", f.read(16))
+        f.seek(16 + 4, os.SEEK_CUR)  # md5 and flags
+        files.append((path.removeprefix("res://"), file_base + offset, file_size))
+
+    return pck_start, files
+
+
+def read_remaps(f: BinaryIO, files: List[Tuple[str, int, int]]) -> Dict[str, str]:
+    # The exported .import files point from the source asset to its imported resources.
+    # Returns imported path -> source path, so the imported data counts for the asset group of the source.
+    remaps = {}
+    for path, offset, file_size in files:
+        if not path.endswith((".import", ".remap")):
+            continue
+
+        f.seek(offset)
+        for line in f.read(file_size).decode("utf-8", errors="replace").splitlines():
+            key, separator, value = line.partition("=")
+            if separator and key.strip().startswith("path"):
+                remaps[value.strip().strip('"').removeprefix("res://")] = path.rsplit(".", 1)[0]
+
+    return remaps
+
+
+def get_asset_group(path: str) -> str:
+    parts = path.split("/")
+    if parts[0] == asset_pack_dir and len(parts) > 2:
+        return "/".join(parts[:2])
+    if len(parts) > 1:
+        return parts[0]
+    return "(root)"
+
+
+def get_file_type(path: str) -> str:
+    file_name = os.path.basename(path)
+    if "." not in file_name:
+        return "(none)"
+    return file_name.rsplit(".", 1)[1].lower()
+
+
+def analyze_pck(f: BinaryIO, size: int, archive_member: str, entries: List[Dict]) -> int:
+    # adds the files of the pck to entries and returns how much of the file is the pck
+    pck = read_pck(f, size)
+    if pck is None:
+        return 0
+
+    pck_start, files = pck
+    remaps = read_remaps(f, files)
+    for path, _, file_size in files:
+        source = remaps.get(path, path)
+        entries.append({
+            "path": path,
+            "size": file_size,
+            "group": get_asset_group(source),
+            "type": get_file_type(source),
+            "container": archive_member,
+        })
+
+    return size - pck_start
+
+
+def analyze_export(export_path: str) -> Dict:
+    # Every file of the archive (or directory) is searched for a pck.
+    # What isn't part of a pck is counted as binaries (the engine, the extension and so on).
+    entries: List[Dict] = []
+    archive_size = os.path.getsize(export_path) if os.path.isfile(export_path) else 0
+
+    def analyze_file(f: BinaryIO, name: str, size: int):
+        pck_size = analyze_pck(f, size, name, entries)
+        if size - pck_size > 0:
+            entries.append({
+                "path": name if pck_size == 0 else name + " (without pck)",
+                "size": size - pck_size,
+                "group": "(binaries)",
+                "type": get_file_type(name) if pck_size == 0 else "executable",
+                "container": name,
+            })
+
+    if os.path.isdir(export_path):
+        for root, _, files in os.walk(export_path):
+            for file in files:
+                file_path = os.path.join(root, file)
+                with open(file_path, "rb") as f:
+                    analyze_file(f, os.path.relpath(file_path, export_path).replace("\\", "/"), os.path.getsize(file_path))
+    elif zipfile.is_zipfile(export_path):
+        with zipfile.ZipFile(export_path, "r") as archive:
+            for info in archive.infolist():
+                if info.is_dir():
+                    continue
+                # zip members can't be seeked when they are compressed, so they are read into memory
+                with archive.open(info) as member:
+                    if info.compress_type == zipfile.ZIP_STORED:
+                        analyze_file(member, info.filename, info.file_size)
+                    else:
+                        analyze_file(io.BytesIO(member.read()), info.filename, info.file_size)
+    else:
+        with open(export_path, "rb") as f:
+            analyze_file(f, os.path.basename(export_path), archive_size)
+
+    def sum_by(key: str) -> Dict[str, int]:
+        sizes: Dict[str, int] = {}
+        for entry in entries:
+            sizes[entry[key]] = sizes.get(entry[key], 0) + entry["size"]
+        return dict(sorted(sizes.items(), key=lambda item: item[1], reverse=True))
+
+    return {
+        "export": os.path.basename(os.path.normpath(export_path)),
+        "archive_size": archive_size,
+        "total_size": sum(entry["size"] for entry in entries),
+        "files": len(entries),
+        "groups": sum_by("group"),
+        "types": sum_by("type"),
+        "largest": sorted(entries, key=lambda entry: entry["size"], reverse=True),
+    }
+
+
+def compare_reports(baseline: Dict, report: Dict, max_growth: float, min_growth: int) -> List[Tuple[str, int, int]]:
+    # returns everything that grew by more than max_growth percent and min_growth bytes
+    regressions = []
+
+    def check(name: str, old: int, new: int):
+        if new - old > min_growth and (old == 0 or (new - old) / old * 100 > max_growth):
+            regressions.append((name, old, new))
+
+    if baseline["archive_size"] and report["archive_size"]:
+        check("archive", baseline["archive_size"], report["archive_size"])
+    check("total", baseline["total_size"], report["total_size"])
+
+    for group, size in report["groups"].items():
+        check("group " + group, baseline["groups"].get(group, 0), size)
+
+    return regressions
+
+
+def format_size(size: int) -> str:
+    return "{:.2f} MB".format(size / 1024 / 1024)
+
+
+def format_delta(old: int | None, new: int) -> str:
+    if old is None:
+        return ""
+    return "{:+.2f} MB".format((new - old) / 1024 / 1024)
+
+
+def print_report(report: Dict, baseline: Dict | None, top: int):
+    print("Size of {}: {} in the archive, {} uncompressed, {} files".format(
+        report["export"], format_size(report["archive_size"]), format_size(report["total_size"]), report["files"]
+    ))
+
+    for title, key in [("asset group", "groups"), ("file type", "types")]:
+        print("\n  {:<40} {:>12} {:>12}".format("by " + title, "size", "change"))
+        for name, size in report[key].items():
+            old = baseline[key].get(name, 0) if baseline else None
+            print("  {:<40} {:>12} {:>12}".format(name, format_size(size), format_delta(old, size)))
+
+    print("\n  {:<60} {:>12}".format("largest files", "size"))
+    for entry in report["largest"][:top]:
+        print("  {:<60} {:>12}".format(entry["path"][-60:], format_size(entry["size"])))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="analyze the size of an exported archive and its pck"
+    )
+
+    parser.add_argument(
+        "export",
+        type=str,
+        help="The exported zip archive, directory, executable or pck",
+    )
+
+    parser.add_argument(
+        "--baseline",
+        type=str,
+        default="",
+        help="The report of the previous export to compare with",
+    )
+
+    parser.add_argument(
+        "--report",
+        type=str,
+        default="",
+        help="Where to write the report (default: <export>.size.json)",
+    )
+
+    parser.add_argument(
+        "--max_growth",
+        type=float,
+        default=5.0,
+        help="The growth in percent that is allowed before failing (default: 5)",
+    )
+
+    parser.add_argument(
+        "--min_growth",
+        type=int,
+        default=256,
+        help="Changes smaller than this many KB never fail (default: 256)",
+    )
+
+    parser.add_argument(
+        "--top",
+        type=int,
+        default=20,
+        help="How many of the largest files are shown (default: 20)",
+    )
+
+    args = vars(parser.parse_args())
+
+    report = analyze_export(args["export"])
+
+    baseline = None
+    if args["baseline"] != "":
+        try:
+            with open(args["baseline"], "r") as f:
+                baseline = json.load(f)
+        except (OSError, ValueError) as e:
+            print("Could not read the baseline {}: {}".format(args["baseline"], e))
+
+    print_report(report, baseline, args["top"])
+
+    report_path = args["report"] or os.path.normpath(args["export"]) + ".size.json"
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=1)
+    print("\nReport written to {}".format(report_path))
+
+    if baseline is not None:
+        regressions = compare_reports(baseline, report, args["max_growth"], args["min_growth"] * 1024)
+        for name, old, new in regressions:
+            print("SIZE REGRESSION {}: {} -> {} ({})".format(name, format_size(old), format_size(new), format_delta(old, new)))
+        if regressions:
+            sys.exit(1)
@@ -0,0 +1,165 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+
+from typing import Dict, List, Set
+
+
+# the inotify flags from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_ISDIR = 0x40000000
+
+watch_mask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+event_header = struct.Struct("iIII")
+
+poll_interval = 0.5
+
+
+class FileWatcher:
+    # Watches directories (recursively) and single files for changes.
+    # Uses inotify on linux and falls back to polling the mtimes everywhere else.
+
+    def __init__(self, directories: List[str], files: List[str], extensions: List[str]):
+        self.directories = [os.path.abspath(directory) for directory in directories]
+        self.files = [os.path.abspath(file) for file in files]
+        self.extensions = tuple(extensions)
+
+        self.inotify_fd = -1
+        self.watches: Dict[int, str] = {}
+        self.snapshot: Dict[str, float] = {}
+
+        if sys.platform.startswith("linux"):
+            self._setup_inotify()
+
+        if self.inotify_fd < 0:
+            print("inotify is not available, polling for changes")
+            self.snapshot = self._take_snapshot()
+
+    def _setup_inotify(self):
+        libc_name = ctypes.util.find_library("c")
+        if libc_name is None:
+            return
+
+        self.libc = ctypes.CDLL(libc_name, use_errno=True)
+        self.inotify_fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.inotify_fd < 0:
+            return
+
+        for directory in self.directories:
+            for root, _, _ in os.walk(directory):
+                self._add_watch(root)
+
+        # single files are watched through their directory, so editors that save by renaming work
+        for file in self.files:
+            self._add_watch(os.path.dirname(file))
+
+    def _add_watch(self, directory: str):
+        if directory in self.watches.values():
+            return
+
+        watch_descriptor = self.libc.inotify_add_watch(self.inotify_fd, directory.encode(), watch_mask)
+        if watch_descriptor >= 0:
+            self.watches[watch_descriptor] = directory
+
+    def _is_relevant(self, path: str) -> bool:
+        if path in self.files:
+            return True
+
+        if not path.endswith(self.extensions):
+            return False
+
+        return any(path.startswith(directory + os.sep) for directory in self.directories)
+
+    def _take_snapshot(self) -> Dict[str, float]:
+        snapshot = {}
+        paths = list(self.files)
+        for directory in self.directories:
+            for root, _, files in os.walk(directory):
+                paths += [os.path.join(root, file) for file in files]
+
+        for path in paths:
+            if not self._is_relevant(path):
+                continue
+            try:
+                snapshot[path] = os.path.getmtime(path)
+            except OSError:
+                pass
+
+        return snapshot
+
+    def _read_inotify_events(self, timeout: float | None) -> Set[str]:
+        readable, _, _ = select.select([self.inotify_fd], [], [], timeout)
+        if not readable:
+            return set()
+
+        changed = set()
+        data = os.read(self.inotify_fd, 64 * 1024)
+        offset = 0
+        while offset + event_header.size <= len(data):
+            watch_descriptor, mask, _, name_length = event_header.unpack_from(data, offset)
+            offset += event_header.size
+            name = data[offset:offset + name_length].rstrip(b"\0").decode(errors="replace")
+            offset += name_length
+
+            directory = self.watches.get(watch_descriptor)
+            if directory is None:
+                continue
+
+            path = os.path.join(directory, name)
+            if mask & IN_ISDIR:
+                # start watching directories that were created after the start
+                if mask & (IN_CREATE | IN_MOVED_TO) and any(path.startswith(d) for d in self.directories):
+                    for root, _, _ in os.walk(path):
+                        self._add_watch(root)
+                continue
+
+            if self._is_relevant(path):
+                changed.add(path)
+
+        return changed
+
+    def _poll_changes(self, timeout: float | None) -> Set[str]:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            snapshot = self._take_snapshot()
+            changed = {path for path in snapshot.keys() | self.snapshot.keys() if snapshot.get(path) != self.snapshot.get(path)}
+            self.snapshot = snapshot
+            if changed:
+                return changed
+
+            if deadline is not None and time.monotonic() >= deadline:
+                return set()
+            time.sleep(poll_interval)
+
+    def _get_changes(self, timeout: float | None) -> Set[str]:
+        if self.inotify_fd >= 0:
+            return self._read_inotify_events(timeout)
+
+        return self._poll_changes(timeout)
+
+    def wait_for_changes(self, debounce: float) -> Set[str]:
+        # Blocks until something changed and no more changes came in for debounce seconds,
+        # so a burst of saves results in a single rebuild.
+        changed = set()
+        while not changed:
+            changed = self._get_changes(None)
+
+        while True:
+            more_changes = self._get_changes(debounce)
+            if not more_changes:
+                return changed
+            changed |= more_changes
+
+    def close(self):
+        if self.inotify_fd >= 0:
+            os.close(self.inotify_fd)
+            self.inotify_fd = -1
@@ -1,10 +1,13 @@
 import argparse
+import hashlib
+import json
 import os
 import platform
 import subprocess
 import stat
 import shutil
 
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import List
 
@@ -15,6 +18,9 @@ project_dirs = [
 ]
 
 
+# Files that were verified as formatted are remembered here, together with the gdformat version
+format_cache_file = '.format_cache.json'
+
 # Files that should not be formatted
 # These are files that are generated by the engine, or cause issues when formatted
 ignored_files = [
@@ -34,6 +40,99 @@ def get_all_gdscript_files(project_dir: str) -> List[Path]:
 
     return all_gdscript_files
 
+def get_gdformat_version() -> str:
+    version_result = subprocess.run(["gdformat", "--version"], check=False, capture_output=True, text=True)
+    return version_result.stdout.strip()
+
+
+def get_file_hash(file: Path) -> str:
+    with open(file, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def load_format_cache(project_dir: str, gdformat_version: str) -> dict:
+    try:
+        with open(os.path.join(project_dir, format_cache_file), 'r') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+    # a different gdformat version might format differently, so start over
+    if cache.get('gdformat') != gdformat_version:
+        return {}
+
+    return cache.get('files', {})
+
+
+def save_format_cache(project_dir: str, gdformat_version: str, cache: dict):
+    cache_path = os.path.join(project_dir, format_cache_file)
+    temp_path = f"{cache_path}.{os.getpid()}.tmp"
+    with open(temp_path, 'w') as f:
+        json.dump({'gdformat': gdformat_version, 'files': cache}, f, indent=1, sort_keys=True)
+    os.replace(temp_path, cache_path)
+
+
+def get_changed_gdscript_files(project_dir: str, ref: str) -> List[Path] | None:
+    # all files that differ between the merge base with ref and the working tree, plus untracked ones
+    merge_base = subprocess.run(["git", "merge-base", ref, "HEAD"], cwd=project_dir, capture_output=True, text=True)
+    if merge_base.returncode != 0:
+        print(f"Failed to find the merge base with {ref}")
+        print(merge_base.stderr)
+        return None
+
+    changed = subprocess.run(
+        ["git", "diff", "--name-only", "--diff-filter=ACMR", merge_base.stdout.strip(), "--"],
+        cwd=project_dir, capture_output=True, text=True,
+    )
+    untracked = subprocess.run(
+        ["git", "ls-files", "--others", "--exclude-standard"],
+        cwd=project_dir, capture_output=True, text=True,
+    )
+
+    changed_files = set()
+    for line in changed.stdout.splitlines() + untracked.stdout.splitlines():
+        file = Path(os.path.join(project_dir, line))
+        if file.suffix != '.gd' or file.name in ignored_files or not file.is_file():
+            continue
+
+        if line.split('/', 1)[0] in project_dirs:
+            changed_files.add(file)
+
+    return sorted(changed_files)
+
+
+def make_batches(files: List[Path], batch_size: int, workers: int) -> List[List[Path]]:
+    # by default every worker gets a few batches, so a slow batch doesn't hold up the others
+    if batch_size <= 0:
+        batch_size = max(1, -(-len(files) // (workers * 4)))
+
+    return [files[i:i + batch_size] for i in range(0, len(files), batch_size)]
+
+
+def run_gdformat(files: List[Path], check_only: bool, project_dir: str) -> List[Path]:
+    # Runs gdformat on a batch and returns the files that are not (or could not be) formatted
+    format_command = ["gdformat"]
+    if check_only:
+        format_command.append("--check")
+
+    format_command += [str(file) for file in files]
+
+    format_result = subprocess.run(format_command, cwd=project_dir, check=False, capture_output=True, text=True)
+    if format_result.returncode == 0:
+        return []
+
+    if len(files) == 1:
+        print(format_result.stdout + format_result.stderr, end="")
+        return files
+
+    # gdformat only reports the failure of the whole batch, so find the culprits one by one
+    invalid_files = []
+    for file in files:
+        invalid_files += run_gdformat([file], check_only, project_dir)
+
+    return invalid_files
+
+
 if __name__ == "__main__":
     script_dir = os.path.abspath(os.path.dirname(os.path.realpath(__file__)))
     project_dir = os.path.abspath(os.path.join(script_dir, '..'))
@@ -49,6 +148,41 @@ if __name__ == "__main__":
         help="A script to format all the gdscript files in the project, or to check if they are formatted",
     )
 
+    parser.add_argument(
+        "-j", "--jobs",
+        type=int,
+        required=False,
+        default=0,
+        dest="jobs",
+        help="The number of gdformat processes to run in parallel (default: 0, one per cpu)",
+    )
+
+    parser.add_argument(
+        "--batch_size",
+        type=int,
+        required=False,
+        default=0,
+        help="The number of files passed to one gdformat process (default: 0, auto)",
+    )
+
+    parser.add_argument(
+        "--changed_since", "--changed-since",
+        type=str,
+        required=False,
+        default="",
+        dest="changed_since",
+        help="Only look at the files git reports as changed since the merge base with this ref",
+    )
+
+    parser.add_argument(
+        "--no_cache",
+        action="store_false",
+        required=False,
+        default=True,
+        dest="use_cache",
+        help=f"Don't skip files that {format_cache_file} lists as already formatted",
+    )
+
     args = vars(parser.parse_args())
 
     if shutil.which("gdformat") is None:
@@ -56,28 +190,46 @@ if __name__ == "__main__":
         exit(1)
 
     check_only = args["mode"] == "CHECK"
-    invalid_files = []
+    workers = args["jobs"] if args["jobs"] > 0 else (os.cpu_count() or 1)
 
-    for file in get_all_gdscript_files(project_dir):
-        format_command = ["gdformat"]
-        if check_only:
-            format_command.append("--check")
-        
-        format_command.append(str(file))
-        print(format_command)
+    if args["changed_since"]:
+        all_files = get_changed_gdscript_files(project_dir, args["changed_since"])
+        if all_files is None:
+            exit(1)
+    else:
+        all_files = sorted(get_all_gdscript_files(project_dir))
 
-        format_result = subprocess.run(format_command, cwd=project_dir, check=False)
+    # skip the files that were already verified with the same content and gdformat version
+    gdformat_version = get_gdformat_version()
+    format_cache = load_format_cache(project_dir, gdformat_version) if args["use_cache"] else {}
+    file_hashes = {file: get_file_hash(file) for file in all_files}
+    cache_key = lambda file: os.path.relpath(file, project_dir).replace(os.sep, '/')
 
-        if format_result.returncode != 0:
-            invalid_files.append(file)
+    unverified_files = [file for file in all_files if format_cache.get(cache_key(file)) != file_hashes[file]]
+    skipped_files = len(all_files) - len(unverified_files)
 
+    batches = make_batches(unverified_files, args["batch_size"], workers)
+    print(f"Running gdformat on {len(unverified_files)} files in {len(batches)} batches with {workers} workers ({skipped_files} unchanged files skipped)")
+
+    # every batch is a separate gdformat process, the threads only wait for them
+    invalid_files = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for batch_invalid_files in executor.map(lambda batch: run_gdformat(batch, check_only, project_dir), batches):
+            invalid_files += batch_invalid_files
+
+    # remember everything that is formatted now, formatting changes the content
+    if args["use_cache"]:
+        for file in unverified_files:
+            if file in invalid_files:
+                continue
+            format_cache[cache_key(file)] = file_hashes[file] if check_only else get_file_hash(file)
+        save_format_cache(project_dir, gdformat_version, format_cache)
 
     if len(invalid_files) > 0:
         print("The following files are not formatted:")
-        for file in invalid_files:
+        for file in sorted(invalid_files):
             print(file)
         
         exit(1)
     else:
         print("All files are formatted!")
-
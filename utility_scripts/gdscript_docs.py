@@ -0,0 +1,558 @@
+import os
+import re
+
+from typing import Dict, Iterator, List, Tuple
+from xml.sax.saxutils import escape, quoteattr
+
+
+# Extracts the documentation of GDScript files without starting godot.
+# The output follows the xml godot writes with --doctool --gdscript-docs, with two differences:
+# constant values and defaults are written as they are in the source instead of being evaluated,
+# and inner classes are not documented. Enum types are recognized from the scripts of the project,
+# the global enums and the Class.Enum form of the built-in classes.
+
+schema_location = "https://raw.githubusercontent.com/godotengine/godot/master/doc/class.xsd"
+
+declaration_pattern = re.compile(r"^(?:@[\w.]+(?:\([^)]*\))?\s+)*(static\s+)?(var|const|func|signal|enum|class_name|extends|class)\b\s*(.*)$", re.S)
+tutorial_pattern = re.compile(r"^@tutorial(?:\((.*)\))?:\s*(.*)$")
+typed_array_pattern = re.compile(r"^Array\[(.+)\]$")
+setter_pattern = re.compile(r"\bset\s*=\s*(\w+)")
+getter_pattern = re.compile(r"\bget\s*=\s*(\w+)")
+
+# the enums of @GlobalScope, doctool writes them without a class
+global_enums = {
+    "Side", "Corner", "Orientation", "ClockDirection", "HorizontalAlignment", "VerticalAlignment",
+    "InlineAlignment", "EulerOrder", "Key", "KeyModifierMask", "KeyLocation", "MouseButton",
+    "MouseButtonMask", "JoyButton", "JoyAxis", "MIDIMessage", "Error", "PropertyHint",
+    "PropertyUsageFlags", "MethodFlags",
+}
+
+
+def find_string_end(text: str, start: int) -> int:
+    # returns the index after the string literal that starts at start
+    quote = text[start:start + 3] if text.startswith(('"""', "'''"), start) else text[start]
+    i = start + len(quote)
+    while i < len(text):
+        if text[i] == "\\":
+            i += 2
+            continue
+        if text.startswith(quote, i):
+            return i + len(quote)
+        i += 1
+    return len(text)
+
+
+def scan_line(line: str, open_string: str | None) -> Tuple[str, int, str | None]:
+    # Returns the line without its comment, how much it changes the bracket depth
+    # and the triple quoted string that is still open at its end.
+    code = []
+    depth = 0
+    i = 0
+    while i < len(line):
+        if open_string is not None:
+            end = line.find(open_string, i)
+            if end < 0:
+                code.append(line[i:])
+                return "".join(code), depth, open_string
+            code.append(line[i:end + len(open_string)])
+            i = end + len(open_string)
+            open_string = None
+            continue
+
+        char = line[i]
+        if char == "#":
+            break
+
+        if line.startswith('"""', i) or line.startswith("'''", i):
+            open_string = line[i:i + 3]
+            code.append(open_string)
+            i += 3
+            continue
+
+        if char in "\"'":
+            end = find_string_end(line, i)
+            code.append(line[i:end])
+            i = end
+            continue
+
+        if char in "([{":
+            depth += 1
+        elif char in ")]}":
+            depth -= 1
+        code.append(char)
+        i += 1
+
+    return "".join(code), depth, open_string
+
+
+def read_statements(f) -> Iterator[Tuple[int, str, List[str], bool]]:
+    # Streams the top level statements of a script as (indentation, code, doc comment lines, blank line after the doc).
+    # Statements that span several lines are joined.
+    doc_lines: List[str] = []
+    blank_after_doc = False
+    statement = ""
+    indentation = 0
+    depth = 0
+    open_string = None
+
+    for raw_line in f:
+        line = raw_line.rstrip("\r\n")
+        stripped = line.strip()
+
+        if statement == "" and open_string is None:
+            if stripped.startswith("##") and not line[0].isspace():
+                if blank_after_doc:
+                    doc_lines = []
+                    blank_after_doc = False
+                doc_lines.append(stripped[3:] if stripped.startswith("## ") else stripped[2:])
+                continue
+            if stripped == "" or stripped.startswith("#"):
+                if stripped == "" and doc_lines:
+                    blank_after_doc = True
+                continue
+            indentation = len(line) - len(line.lstrip())
+
+        code, depth_change, open_string = scan_line(line, open_string)
+        depth += depth_change
+        statement += " " + code.strip() if statement else code.strip()
+
+        if depth > 0 or open_string is not None or statement.endswith("\\"):
+            statement = statement.rstrip("\\")
+            continue
+
+        yield indentation, statement, doc_lines, blank_after_doc
+        doc_lines = []
+        blank_after_doc = False
+        statement = ""
+        depth = 0
+
+
+def split_top_level(text: str, separator: str = ",") -> List[str]:
+    # splits at the separators that are not inside brackets or strings
+    parts = []
+    depth = 0
+    start = 0
+    i = 0
+    while i < len(text):
+        char = text[i]
+        if char in "\"'":
+            i = find_string_end(text, i)
+            continue
+        if char in "([{":
+            depth += 1
+        elif char in ")]}":
+            depth -= 1
+        elif char == separator and depth == 0:
+            parts.append(text[start:i].strip())
+            start = i + 1
+        i += 1
+
+    if text[start:].strip():
+        parts.append(text[start:].strip())
+    return parts
+
+
+def find_closing_bracket(text: str, start: int) -> int:
+    # brackets inside strings don't count
+    depth = 0
+    i = start
+    while i < len(text):
+        char = text[i]
+        if char in "\"'":
+            i = find_string_end(text, i)
+            continue
+        if char in "([{":
+            depth += 1
+        elif char in ")]}":
+            depth -= 1
+            if depth == 0:
+                return i
+        i += 1
+    return len(text)
+
+
+def infer_type(value: str) -> str:
+    # only the types of literals can be known without evaluating the script
+    if re.fullmatch(r"-?(0x[0-9a-fA-F_]+|0b[01_]+|[0-9_]+)", value):
+        return "int"
+    if re.fullmatch(r"-?([0-9_]*\.[0-9_]+|[0-9_]+\.[0-9_]*)(e-?[0-9]+)?|-?[0-9_]+e-?[0-9]+|INF|NAN|PI|TAU", value):
+        return "float"
+    if value in ["true", "false"]:
+        return "bool"
+    if re.fullmatch(r"\"(\\.|[^\"])*\"|'(\\.|[^'])*'", value):
+        return "String"
+    if value.startswith("&\""):
+        return "StringName"
+    if value.startswith("^\""):
+        return "NodePath"
+    if value.startswith("["):
+        return "Array"
+    if value.startswith("{"):
+        return "Dictionary"
+
+    if value.startswith("func"):
+        return "Callable"
+
+    constructor = re.match(r"^([A-Z]\w*)(?:\.new)?\(", value)
+    if constructor:
+        return constructor.group(1)
+
+    conversion = re.match(r"^(int|float|bool|str)\(", value)
+    if conversion:
+        return "String" if conversion.group(1) == "str" else conversion.group(1)
+    return "Variant"
+
+
+def parse_typed_name(text: str) -> Dict[str, str]:
+    # parses "name: Type = default", "name := default" and "name = default"
+    name_part, separator, default = text.partition("=")
+    default = default.strip() if separator else ""
+    inferred = name_part.rstrip().endswith(":")
+    name, _, type_name = name_part.rstrip().rstrip(":").partition(":")
+
+    type_name = type_name.strip()
+    if not type_name:
+        type_name = infer_type(default) if inferred or default else "Variant"
+        if not inferred and type_name != "Variant":
+            type_name = "Variant"
+
+    return {"name": name.strip(), "type": type_name, "default": default}
+
+
+def parse_parameters(text: str) -> List[Dict[str, str]]:
+    return [parse_typed_name(parameter) for parameter in split_top_level(text)]
+
+
+def parse_doc(doc_lines: List[str]) -> Tuple[str, str, List[Tuple[str, str]]]:
+    # Splits a class doc comment into the brief description (first paragraph),
+    # the description and the @tutorial links.
+    brief = []
+    description = []
+    tutorials = []
+    target = brief
+    for line in doc_lines:
+        tutorial = tutorial_pattern.match(line.strip())
+        if tutorial:
+            tutorials.append((tutorial.group(1) or "", tutorial.group(2)))
+            continue
+
+        if line.strip() == "" and target is brief and brief:
+            target = description
+            continue
+        target.append(line)
+
+    return "\n".join(brief).strip(), "\n".join(description).strip(), tutorials
+
+
+def parse_script(f, res_path: str) -> Dict:
+    # Parses the top level declarations of a script.
+    # Everything with a leading underscore is private and left out unless it is documented.
+    doc = {
+        "name": '"{}"'.format(res_path),
+        "inherits": "RefCounted",
+        "brief_description": "",
+        "description": "",
+        "tutorials": [],
+        "methods": [],
+        "members": [],
+        "signals": [],
+        "constants": [],
+    }
+    class_doc_found = False
+    seen_member = False
+    annotation_doc: Tuple[List[str], bool] = ([], False)
+    last_member = None
+
+    for indentation, statement, doc_lines, blank_after_doc in read_statements(f):
+        if indentation > 0:
+            # the setter and getter of a property can be in the indented block after it
+            accessor = re.match(r"^(set|get)\s*=\s*(\w+)", statement)
+            if accessor and last_member is not None:
+                last_member["setter" if accessor.group(1) == "set" else "getter"] = accessor.group(2)
+            continue
+
+        last_member = None
+        if annotation_doc[0] and not doc_lines:
+            doc_lines, blank_after_doc = annotation_doc
+        annotation_doc = ([], False)
+
+        declaration = declaration_pattern.match(statement)
+        if declaration is None:
+            # annotations on their own line belong to the next declaration
+            if statement.startswith("@"):
+                annotation_doc = (doc_lines, blank_after_doc)
+            continue
+
+        is_static, keyword, rest = declaration.groups()
+
+        # the class doc is either attached to class_name/extends or separated from the first member by a blank line
+        if doc_lines and not class_doc_found and (keyword in ["class_name", "extends"] or (blank_after_doc and not seen_member)):
+            doc["brief_description"], doc["description"], doc["tutorials"] = parse_doc(doc_lines)
+            class_doc_found = True
+            doc_lines = []
+
+        description = "\n".join(doc_lines).strip()
+
+        if keyword == "class_name":
+            class_name, _, extends = rest.partition(" extends ")
+            doc["name"] = class_name.strip().rstrip(":")
+            if extends:
+                doc["inherits"] = extends.strip().rstrip(":")
+            continue
+
+        if keyword == "extends":
+            doc["inherits"] = rest.strip().rstrip(":")
+            continue
+
+        if keyword == "class":
+            seen_member = True
+            continue
+
+        seen_member = True
+        if keyword == "func":
+            name, _, signature = rest.partition("(")
+            if name.strip().startswith("_") and not description:
+                continue
+
+            closing = find_closing_bracket("(" + signature, 0) - 1
+            return_type = signature[closing + 1:].partition("->")[2].partition(":")[0].strip()
+            doc["methods"].append({
+                "name": name.strip(),
+                "return": return_type or "Variant",
+                "parameters": parse_parameters(signature[:closing]),
+                "static": bool(is_static),
+                "description": description,
+            })
+
+        elif keyword == "signal":
+            name, _, parameters = rest.partition("(")
+            if name.strip().startswith("_") and not description:
+                continue
+
+            doc["signals"].append({
+                "name": name.strip(),
+                "parameters": parse_parameters(parameters.rpartition(")")[0]),
+                "description": description,
+            })
+
+        elif keyword == "var":
+            # a property can end with "set = ..., get = ..." or a colon followed by an accessor block
+            definition = rest
+            accessors = ""
+            accessor_match = re.search(r":\s*(set|get)\b", definition)
+            if accessor_match:
+                accessors = definition[accessor_match.start() + 1:]
+                definition = definition[:accessor_match.start()]
+            elif definition.endswith(":"):
+                definition = definition[:-1]
+
+            member = parse_typed_name(definition)
+            if member["name"].startswith("_") and not description:
+                continue
+
+            setter = setter_pattern.search(accessors)
+            getter = getter_pattern.search(accessors)
+            member["setter"] = setter.group(1) if setter else ""
+            member["getter"] = getter.group(1) if getter else ""
+            member["description"] = description
+            doc["members"].append(member)
+            last_member = member
+
+        elif keyword == "const":
+            constant = parse_typed_name(rest)
+            if constant["name"].startswith("_") and not description:
+                continue
+
+            doc["constants"].append({"name": constant["name"], "value": constant["default"], "enum": "", "description": description})
+
+        elif keyword == "enum":
+            enum_name, _, values = rest.partition("{")
+            value = 0
+            for entry in split_top_level(values.rpartition("}")[0]):
+                constant_name, separator, constant_value = entry.partition("=")
+                if separator:
+                    try:
+                        value = int(constant_value.strip(), 0)
+                    except ValueError:
+                        value = constant_value.strip()
+                doc["constants"].append({
+                    "name": constant_name.strip(),
+                    "value": str(value),
+                    "enum": enum_name.strip(),
+                    "description": description if not enum_name.strip() else "",
+                })
+                value = value + 1 if isinstance(value, int) else value
+
+    return doc
+
+
+def get_enum_names(doc: Dict) -> List[str]:
+    return sorted({constant["enum"] for constant in doc["constants"] if constant["enum"]})
+
+
+def resolve_type(type_name: str, class_name: str, local_enums: List[str], script_enums: Dict[str, List[str]]) -> Tuple[str, str]:
+    # Returns the type and enum attributes doctool writes for a type.
+    # Enums are ints with the qualified enum name, typed arrays are written as Type[].
+    typed_array = typed_array_pattern.match(type_name)
+    element_type = typed_array.group(1).strip() if typed_array else type_name
+
+    enum = ""
+    owner, _, name = element_type.rpartition(".")
+    if element_type in local_enums:
+        enum = class_name + "." + element_type
+    elif element_type in global_enums:
+        enum = element_type
+    elif owner in script_enums:
+        enum = element_type if name in script_enums[owner] else ""
+    elif owner and name[:1].isupper():
+        # built-in classes have no inner classes, so Class.Name is one of their enums
+        enum = element_type
+
+    if enum:
+        element_type = "int"
+    return (element_type + "[]" if typed_array else element_type), enum
+
+
+def resolve_types(doc: Dict, script_enums: Dict[str, List[str]]):
+    # adds the enum attributes to the parameters, return types and members of a parsed script
+    local_enums = get_enum_names(doc)
+
+    def resolve(entry: Dict, key: str):
+        entry[key], entry[key + "_enum"] = resolve_type(entry[key], doc["name"], local_enums, script_enums)
+
+    for method in doc["methods"]:
+        resolve(method, "return")
+        for parameter in method["parameters"]:
+            resolve(parameter, "type")
+    for signal in doc["signals"]:
+        for parameter in signal["parameters"]:
+            resolve(parameter, "type")
+    for member in doc["members"]:
+        resolve(member, "type")
+
+
+def format_enum(entry: Dict, key: str) -> str:
+    enum = entry.get(key + "_enum", "")
+    return " enum={}".format(quoteattr(enum)) if enum else ""
+
+
+def write_text(lines: List[str], tag: str, text: str, indentation: int):
+    tabs = "\t" * indentation
+    lines.append("{}<{}>".format(tabs, tag))
+    for line in escape(text).splitlines():
+        lines.append("{}\t{}".format(tabs, line) if line.strip() else "")
+    lines.append("{}</{}>".format(tabs, tag))
+
+
+def write_parameters(lines: List[str], parameters: List[Dict[str, str]]):
+    for index, parameter in enumerate(parameters):
+        default = " default={}".format(quoteattr(parameter["default"])) if parameter["default"] else ""
+        lines.append("\t\t\t<param index=\"{}\" name={} type={}{}{} />".format(
+            index, quoteattr(parameter["name"]), quoteattr(parameter["type"]), format_enum(parameter, "type"), default
+        ))
+
+
+def to_xml(doc: Dict) -> str:
+    lines = ['<?xml version="1.0" encoding="UTF-8" ?>']
+    lines.append("<class name={} inherits={} xmlns:xsi=\"http://www.w3.org/2001/XMLSchema-instance\" xsi:noNamespaceSchemaLocation={}>".format(
+        quoteattr(doc["name"]), quoteattr(doc["inherits"]), quoteattr(schema_location)
+    ))
+    write_text(lines, "brief_description", doc["brief_description"], 1)
+    write_text(lines, "description", doc["description"], 1)
+
+    lines.append("\t<tutorials>")
+    for title, link in doc["tutorials"]:
+        lines.append("\t\t<link title={}>{}</link>".format(quoteattr(title), escape(link)))
+    lines.append("\t</tutorials>")
+
+    if doc["methods"]:
+        lines.append("\t<methods>")
+        for method in sorted(doc["methods"], key=lambda method: method["name"]):
+            qualifiers = " qualifiers=\"static\"" if method["static"] else ""
+            lines.append("\t\t<method name={}{}>".format(quoteattr(method["name"]), qualifiers))
+            lines.append("\t\t\t<return type={}{} />".format(quoteattr(method["return"]), format_enum(method, "return")))
+            write_parameters(lines, method["parameters"])
+            write_text(lines, "description", method["description"], 3)
+            lines.append("\t\t</method>")
+        lines.append("\t</methods>")
+
+    if doc["members"]:
+        lines.append("\t<members>")
+        for member in sorted(doc["members"], key=lambda member: member["name"]):
+            default = " default={}".format(quoteattr(member["default"])) if member["default"] else ""
+            lines.append("\t\t<member name={} type={} setter={} getter={}{}{}>".format(
+                quoteattr(member["name"]), quoteattr(member["type"]), quoteattr(member["setter"]), quoteattr(member["getter"]),
+                format_enum(member, "type"), default
+            ))
+            for line in escape(member["description"]).splitlines():
+                lines.append("\t\t\t" + line if line.strip() else "")
+            lines.append("\t\t</member>")
+        lines.append("\t</members>")
+
+    if doc["signals"]:
+        lines.append("\t<signals>")
+        for signal in sorted(doc["signals"], key=lambda signal: signal["name"]):
+            lines.append("\t\t<signal name={}>".format(quoteattr(signal["name"])))
+            write_parameters(lines, signal["parameters"])
+            write_text(lines, "description", signal["description"], 3)
+            lines.append("\t\t</signal>")
+        lines.append("\t</signals>")
+
+    if doc["constants"]:
+        lines.append("\t<constants>")
+        for constant in doc["constants"]:
+            enum = " enum={}".format(quoteattr(constant["enum"])) if constant["enum"] else ""
+            lines.append("\t\t<constant name={} value={}{}>".format(quoteattr(constant["name"]), quoteattr(constant["value"]), enum))
+            for line in escape(constant["description"]).splitlines():
+                lines.append("\t\t\t" + line if line.strip() else "")
+            lines.append("\t\t</constant>")
+        lines.append("\t</constants>")
+
+    lines.append("</class>")
+    return "\n".join(lines) + "\n"
+
+
+def get_doc_file_name(class_name: str) -> str:
+    # the same name godot uses for the xml files of scripts
+    return class_name.replace("\"", "").replace("/", "--") + ".xml"
+
+
+def find_scripts(directory: str) -> Iterator[str]:
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+        for file in sorted(files):
+            if file.endswith(".gd"):
+                yield os.path.join(root, file)
+
+
+def parse_file(project_dir: str, script_path: str) -> Dict:
+    res_path = "res://" + os.path.relpath(script_path, project_dir).replace("\\", "/")
+    with open(script_path, "r", encoding="utf-8") as f:
+        return parse_script(f, res_path)
+
+
+def collect_script_enums(project_dir: str) -> Dict[str, List[str]]:
+    # the enums of every named script in the project, so Class.Enum types of other directories are known
+    script_enums = {}
+    for script_path in find_scripts(project_dir):
+        doc = parse_file(project_dir, script_path)
+        if not doc["name"].startswith('"'):
+            script_enums[doc["name"]] = get_enum_names(doc)
+
+    return script_enums
+
+
+def extract_directory(project_dir: str, gd_dir: str, output_dir: str) -> List[str]:
+    # writes one xml file for every script in gd_dir and returns their names
+    script_enums = collect_script_enums(project_dir)
+    written_files = []
+    for script_path in find_scripts(os.path.join(project_dir, gd_dir)):
+        doc = parse_file(project_dir, script_path)
+        resolve_types(doc, script_enums)
+
+        doc_file = get_doc_file_name(doc["name"])
+        with open(os.path.join(output_dir, doc_file), "w", encoding="utf-8") as f:
+            f.write(to_xml(doc))
+        written_files.append(doc_file)
+
+    return written_files
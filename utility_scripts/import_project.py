@@ -1,17 +1,393 @@
 import argparse
+import glob
+import hashlib
+import json
 import os
 import platform
+import re
 import subprocess
 import stat
 import shutil
+import tarfile
+import time
 
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List
+from typing import Dict, List, Tuple
+
+
+# the file extensions godot imports, everything with a .import file next to it is imported as well
+importable_extensions = (
+    ".png", ".jpg", ".jpeg", ".webp", ".svg", ".bmp", ".tga", ".exr", ".hdr", ".dds", ".ktx",
+    ".glb", ".gltf", ".fbx", ".blend", ".obj", ".dae",
+    ".wav", ".ogg", ".mp3",
+    ".ttf", ".otf", ".woff", ".woff2", ".fnt", ".font",
+    ".csv",
+)
+skipped_dirs = [".godot", ".git", "build"]
+
+# kept next to the import outputs, so it goes away when .godot is deleted
+manifest_name = "asset_manifest.json"
+
+dest_base_pattern = re.compile(r"^(.*-[0-9a-f]{32})\.")
+
+# the snapshots are only valid for the godot version that created them
+snapshot_format = 1
+
+
+def get_imported_dir(project_dir: str) -> str:
+    return os.path.join(project_dir, ".godot", "imported")
+
+
+def find_source_assets(project_dir: str) -> List[str]:
+    # returns the project relative paths of every asset godot would import
+    assets = []
+    for root, dirs, files in os.walk(project_dir):
+        if root != project_dir and ".gdignore" in files:
+            dirs[:] = []
+            continue
+
+        dirs[:] = [d for d in dirs if d not in skipped_dirs and not d.startswith(".")]
+        file_set = set(files)
+        for file in files:
+            if file.lower().endswith(importable_extensions) or file + ".import" in file_set:
+                assets.append(os.path.relpath(os.path.join(root, file), project_dir).replace("\\", "/"))
+
+    return sorted(assets)
+
+
+def get_file_md5(path: str) -> str:
+    # godot stores the md5 of the source file, so the manifest uses the same hash
+    file_hash = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            file_hash.update(chunk)
+
+    return file_hash.hexdigest()
+
+
+def load_manifest(project_dir: str) -> Dict[str, Dict]:
+    try:
+        with open(os.path.join(get_imported_dir(project_dir), manifest_name), "r") as f:
+            return json.load(f)["assets"]
+    except (OSError, ValueError, KeyError):
+        return {}
+
+
+def save_manifest(project_dir: str, assets: Dict[str, Dict]):
+    imported_dir = get_imported_dir(project_dir)
+    os.makedirs(imported_dir, exist_ok=True)
+
+    manifest_path = os.path.join(imported_dir, manifest_name)
+    temp_path = "{}.{}.tmp".format(manifest_path, os.getpid())
+    with open(temp_path, "w") as f:
+        json.dump({"assets": assets}, f, indent=1, sort_keys=True)
+    os.replace(temp_path, manifest_path)
+
+
+def hash_assets(project_dir: str, assets: List[str], manifest: Dict[str, Dict], jobs: int) -> Dict[str, Dict]:
+    # only hashes the files whose size or mtime changed since the manifest was written
+    def hash_asset(asset: str) -> Tuple[str, Dict]:
+        file_stat = os.stat(os.path.join(project_dir, asset))
+        entry = manifest.get(asset)
+        if entry and entry["size"] == file_stat.st_size and entry["mtime_ns"] == file_stat.st_mtime_ns:
+            return asset, entry
+
+        return asset, {
+            "size": file_stat.st_size,
+            "mtime_ns": file_stat.st_mtime_ns,
+            "md5": get_file_md5(os.path.join(project_dir, asset)),
+        }
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        hashes = dict(executor.map(hash_asset, assets))
+
+    # assets godot doesn't produce any output for stay handled until their content changes
+    for asset, entry in hashes.items():
+        previous = manifest.get(asset, {})
+        if previous.get("unimported") and previous.get("md5") == entry["md5"]:
+            hashes[asset] = {**entry, "unimported": True}
+
+    return hashes
+
+
+def read_import_file(path: str) -> Dict[str, str]:
+    # the .import files are ini like, the values that are needed here are all on one line
+    values = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            key, separator, value = line.strip().partition("=")
+            if separator and key not in values:
+                values[key] = value
+
+    return values
+
+
+def res_to_path(project_dir: str, res_path: str) -> str:
+    return os.path.join(project_dir, res_path.removeprefix("res://"))
+
+
+def is_imported(project_dir: str, asset: str, md5: str) -> bool:
+    # An asset is imported when its .import file and all the outputs it lists exist
+    # and the .md5 file godot writes next to the outputs matches the current source.
+    try:
+        import_values = read_import_file(os.path.join(project_dir, asset + ".import"))
+    except OSError:
+        return False
+
+    if import_values.get("importer", "").strip('"') in ["keep", "skip"]:
+        return True
+
+    try:
+        dest_files = json.loads(import_values.get("dest_files", "[]"))
+    except ValueError:
+        return False
+
+    if not dest_files:
+        return True
+
+    if not all(os.path.exists(res_to_path(project_dir, dest_file)) for dest_file in dest_files):
+        return False
+
+    dest_base = dest_base_pattern.match(dest_files[0])
+    if dest_base is None:
+        return True
+
+    try:
+        md5_values = read_import_file(res_to_path(project_dir, dest_base.group(1) + ".md5"))
+    except OSError:
+        return False
+
+    return md5_values.get("source_md5", "").strip('"') == md5
+
+
+def is_skipped(project_dir: str, asset: str) -> bool:
+    # godot writes no .import file for files it doesn't import, or marks them with the keep or skip importer
+    try:
+        import_values = read_import_file(os.path.join(project_dir, asset + ".import"))
+    except OSError:
+        return True
+
+    return import_values.get("importer", "").strip('"') in ["keep", "skip"]
+
+
+def needs_project_scan(project_dir: str) -> bool:
+    # the editor writes its filesystem cache at the end of the first scan
+    return not glob.glob(os.path.join(project_dir, ".godot", "editor", "filesystem_cache*"))
+
+
+def get_default_snapshot_dir() -> str:
+    # the snapshots are shared between all checkouts of the current user
+    if platform.system() == "Windows":
+        cache_root = os.getenv("LOCALAPPDATA") or os.path.expanduser("~")
+    elif platform.system() == "Darwin":
+        cache_root = os.path.expanduser("~/Library/Caches")
+    else:
+        cache_root = os.getenv("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+
+    return os.path.join(cache_root, "openchamp", "import_snapshots")
+
+
+def get_godot_version(editor_command: List[str]) -> str:
+    # editor_command ends with --headless --import, the launcher and godot come before that
+    version_output = subprocess.run(editor_command[:-2] + ["--version"], capture_output=True, timeout=60)
+    version_lines = version_output.stdout.decode(errors="replace").strip().splitlines()
+    if version_output.returncode != 0 or not version_lines:
+        print("Could not get the godot version")
+        return ""
+
+    return version_lines[-1].strip()
+
+
+def get_snapshot_key(godot_version: str, hashes: Dict[str, Dict]) -> str:
+    key_hash = hashlib.sha256("{}\n{}\n".format(snapshot_format, godot_version).encode())
+    for asset in sorted(hashes.keys()):
+        key_hash.update("{}\0{}\n".format(asset, hashes[asset]["md5"]).encode())
+
+    return key_hash.hexdigest()
+
+
+def load_snapshot_index(snapshot_dir: str, key: str) -> Dict | None:
+    try:
+        with open(os.path.join(snapshot_dir, key + ".json"), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def find_snapshot(snapshot_dir: str, godot_version: str, hashes: Dict[str, Dict]) -> Tuple[str, int] | None:
+    # Returns the exact snapshot if there is one, otherwise the one that shares the most assets.
+    # Assets that differ are reimported after restoring it.
+    key = get_snapshot_key(godot_version, hashes)
+    if os.path.exists(os.path.join(snapshot_dir, key + ".tar.gz")):
+        return key, len(hashes)
+
+    best_match = None
+    for index_file in glob.glob(os.path.join(snapshot_dir, "*.json")):
+        snapshot_key = os.path.basename(index_file)[:-len(".json")]
+        index = load_snapshot_index(snapshot_dir, snapshot_key)
+        if index is None or index.get("godot_version") != godot_version:
+            continue
+        if not os.path.exists(os.path.join(snapshot_dir, snapshot_key + ".tar.gz")):
+            continue
+
+        matching = sum(1 for asset, md5 in index["assets"].items() if asset in hashes and hashes[asset]["md5"] == md5)
+        if matching > 0 and (best_match is None or matching > best_match[1]):
+            best_match = (snapshot_key, matching)
+
+    return best_match
+
+
+def save_snapshot(project_dir: str, snapshot_dir: str, godot_version: str, hashes: Dict[str, Dict], max_size: int):
+    # Stores .godot/imported and the .import files of all the assets.
+    # The manifest isn't included, it holds the mtimes of this checkout.
+    key = get_snapshot_key(godot_version, hashes)
+    snapshot_path = os.path.join(snapshot_dir, key + ".tar.gz")
+    if os.path.exists(snapshot_path):
+        os.utime(snapshot_path)
+        print("Snapshot {} exists already".format(key[:16]))
+        return
+
+    os.makedirs(snapshot_dir, exist_ok=True)
+    imported_dir = get_imported_dir(project_dir)
+    temp_path = "{}.{}.tmp".format(snapshot_path, os.getpid())
+
+    with tarfile.open(temp_path, "w:gz", compresslevel=3) as snapshot:
+        for file in sorted(os.listdir(imported_dir)):
+            if file == manifest_name or file.endswith(".tmp"):
+                continue
+            snapshot.add(os.path.join(imported_dir, file), arcname=".godot/imported/" + file)
+
+        for asset in sorted(hashes.keys()):
+            import_file = os.path.join(project_dir, asset + ".import")
+            if os.path.exists(import_file):
+                snapshot.add(import_file, arcname=asset + ".import")
+
+    index_path = os.path.join(snapshot_dir, key + ".json")
+    temp_index_path = "{}.{}.tmp".format(index_path, os.getpid())
+    with open(temp_index_path, "w") as f:
+        json.dump({
+            "godot_version": godot_version,
+            "assets": {asset: entry["md5"] for asset, entry in hashes.items()},
+            "unimported": sorted(asset for asset, entry in hashes.items() if entry.get("unimported")),
+        }, f)
+
+    os.replace(temp_path, snapshot_path)
+    os.replace(temp_index_path, index_path)
+    print("Saved snapshot {} ({:.1f} MB)".format(key[:16], os.path.getsize(snapshot_path) / 1024 / 1024))
+
+    evict_snapshots(snapshot_dir, max_size, keep=key)
+
+
+def evict_snapshots(snapshot_dir: str, max_size: int, keep: str = ""):
+    # Removes the least recently used snapshots until the rest fits into max_size.
+    # The keep snapshot stays even if it is bigger than max_size on its own.
+    snapshots = []
+    for snapshot_path in glob.glob(os.path.join(snapshot_dir, "*.tar.gz")):
+        file_stat = os.stat(snapshot_path)
+        snapshots.append((file_stat.st_mtime, file_stat.st_size, snapshot_path))
+
+    keep_path = os.path.join(snapshot_dir, keep + ".tar.gz")
+    total_size = sum(size for _, size, snapshot_path in snapshots if snapshot_path == keep_path)
+    for _, size, snapshot_path in sorted(snapshots, reverse=True):
+        if snapshot_path == keep_path:
+            continue
+
+        total_size += size
+        if total_size <= max_size:
+            continue
+
+        os.remove(snapshot_path)
+        index_path = snapshot_path[:-len(".tar.gz")] + ".json"
+        if os.path.exists(index_path):
+            os.remove(index_path)
+        print("Evicted snapshot {}".format(os.path.basename(snapshot_path)[:16]))
+
+
+def restore_snapshot(project_dir: str, snapshot_dir: str, key: str) -> int:
+    # Extracts the import outputs and the .import files that don't exist yet.
+    # .import files in the checkout are never overwritten, if they differ from the snapshot
+    # the .md5 file of the asset is dropped, so it is imported again with the checked in settings.
+    snapshot_path = os.path.join(snapshot_dir, key + ".tar.gz")
+    project_dir = os.path.abspath(project_dir)
+    restored_files = 0
+
+    with tarfile.open(snapshot_path, "r:gz") as snapshot:
+        members = snapshot.getmembers()
+        outdated_imports = []
+        for member in members:
+            target = os.path.abspath(os.path.join(project_dir, member.name))
+            if not member.isfile() or os.path.commonpath([project_dir, target]) != project_dir:
+                continue
+
+            if member.name.endswith(".import") and os.path.exists(target):
+                with open(target, "rb") as f:
+                    if f.read() != snapshot.extractfile(member).read():
+                        outdated_imports.append(member.name[:-len(".import")])
+                continue
+
+            snapshot.extract(member, project_dir, filter="data")
+            restored_files += 1
+
+    for asset in outdated_imports:
+        dest_files = json.loads(read_import_file(os.path.join(project_dir, asset + ".import")).get("dest_files", "[]"))
+        dest_base = dest_base_pattern.match(dest_files[0]) if dest_files else None
+        if dest_base is not None and os.path.exists(res_to_path(project_dir, dest_base.group(1) + ".md5")):
+            os.remove(res_to_path(project_dir, dest_base.group(1) + ".md5"))
+
+    os.utime(snapshot_path)
+    return restored_files
+
+
+def run_import(
+    editor_command: List[str],
+    project_dir: str,
+    pending: List[str],
+    hashes: Dict[str, Dict],
+    timeout: float,
+    exit_grace: float,
+) -> Tuple[int | None, List[str]]:
+    # Runs the import and watches the import state on disk.
+    # Once everything is imported godot gets exit_grace seconds to finish writing its caches,
+    # so a hanging editor doesn't block the import.
+    remaining = list(pending)
+    start_time = time.monotonic()
+    finished_time = None
+
+    process = subprocess.Popen(editor_command, cwd=project_dir)
+    while True:
+        try:
+            returncode = process.wait(timeout=0.5)
+            break
+        except subprocess.TimeoutExpired:
+            pass
+
+        remaining = [asset for asset in remaining if not is_imported(project_dir, asset, hashes[asset]["md5"])]
+        now = time.monotonic()
+        if not remaining and finished_time is None:
+            finished_time = now
+
+        if finished_time is not None and now - finished_time > exit_grace:
+            print("All assets are imported, but godot didn't exit. Stopping it.")
+            process.terminate()
+            process.wait()
+            return 0, []
+
+        if timeout > 0 and now - start_time > timeout:
+            print("The import timed out after {:.0f}s".format(timeout))
+            process.kill()
+            process.wait()
+            returncode = None
+            break
+
+    remaining = [asset for asset in remaining if not is_imported(project_dir, asset, hashes[asset]["md5"])]
+    return returncode, remaining
+
 
 if __name__ == "__main__":
     script_dir = os.path.abspath(os.path.dirname(os.path.realpath(__file__)))
-    project_dir = os.path.join(script_dir, '..')
-    
+    project_dir = os.path.abspath(os.path.join(script_dir, '..'))
+
     parser = argparse.ArgumentParser(
         description="import all the assets"
     )
@@ -23,7 +399,7 @@ if __name__ == "__main__":
         help="A command or script used to launch the godot exe",
         dest="launcher_cmd"
     )
-    
+
     parser.add_argument(
         "--godot_path",
         type=str,
@@ -32,35 +408,175 @@ if __name__ == "__main__":
         dest="godot_cmd"
     )
 
+    parser.add_argument(
+        "--max_attempts",
+        type=int,
+        default=3,
+        help="How often godot is started while it crashes, times out or still imports more assets",
+    )
+
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=900,
+        help="The maximum time in seconds a single godot run may take, 0 disables it",
+    )
+
+    parser.add_argument(
+        "--exit_grace",
+        type=float,
+        default=10,
+        help="How long godot may keep running after all the assets are imported",
+    )
+
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Run the import even if no asset changed",
+    )
+
+    parser.add_argument(
+        "--restore_snapshot",
+        action="store_true",
+        help="Restore the import snapshot that matches the assets best before importing",
+    )
+
+    parser.add_argument(
+        "--save_snapshot",
+        action="store_true",
+        help="Save a snapshot of the import outputs after a successful import",
+    )
+
+    parser.add_argument(
+        "--snapshot_dir",
+        type=str,
+        default=get_default_snapshot_dir(),
+        help="The directory the import snapshots are kept in",
+    )
+
+    parser.add_argument(
+        "--snapshot_cache_size",
+        type=int,
+        default=2048,
+        help="The maximum size of all the snapshots in MB",
+    )
+
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="The number of threads used to hash the assets",
+    )
+
     args = vars(parser.parse_args())
     print(args)
-    
+
     editor_command = []
     if args["launcher_cmd"] != "":
         launcher_path = Path(args["launcher_cmd"])
         editor_command.append(str(launcher_path))
-        
+
     if args["godot_cmd"] == "":
         print("No godot exe given. Exiting!")
         exit(1)
-    
+
     godot_command = Path(args["godot_cmd"])
     editor_command.append(str(godot_command))
     editor_command.append('--headless')
     editor_command.append('--import')
-    
+
     print(editor_command)
-    
-    try:
-        subprocess.run(editor_command, cwd=project_dir, check=False, timeout=15)
-    except:
-        print('timeout on try 1')
-        
-    try:
-        subprocess.run(editor_command, cwd=project_dir, check=False, timeout=30)
-    except:
-        print('timeout on try 2')
-    
-    import_output = subprocess.run(editor_command, cwd=project_dir, check=False)
-    if import_output.returncode != 0:
+
+    start_time = time.monotonic()
+    manifest = load_manifest(project_dir)
+    assets = find_source_assets(project_dir)
+    hashes = hash_assets(project_dir, assets, manifest, max(1, args["jobs"]))
+
+    godot_version = ""
+    if args["restore_snapshot"] or args["save_snapshot"]:
+        godot_version = get_godot_version(editor_command)
+
+    # the snapshots don't contain the editor's filesystem cache, an exact snapshot needs no scan to build it
+    exact_snapshot = False
+    if args["restore_snapshot"] and godot_version != "":
+        snapshot = find_snapshot(args["snapshot_dir"], godot_version, hashes)
+        if snapshot is None:
+            print("No matching import snapshot found")
+        else:
+            snapshot_key, matching = snapshot
+            restored_files = restore_snapshot(project_dir, args["snapshot_dir"], snapshot_key)
+            exact_snapshot = snapshot_key == get_snapshot_key(godot_version, hashes)
+
+            # the assets godot skipped when the snapshot was saved have no .import file to restore
+            index = load_snapshot_index(args["snapshot_dir"], snapshot_key) or {}
+            for asset in index.get("unimported", []):
+                if asset in hashes and index["assets"].get(asset) == hashes[asset]["md5"]:
+                    hashes[asset] = {**hashes[asset], "unimported": True}
+            print("Restored {} files from snapshot {} ({} of {} assets match)".format(
+                restored_files, snapshot_key[:16], matching, len(assets)
+            ))
+
+    changed = [asset for asset in assets if manifest.get(asset, {}).get("md5") != hashes[asset]["md5"]]
+    deleted = [asset for asset in manifest if asset not in hashes]
+    pending = [
+        asset for asset in assets
+        if not (hashes[asset].get("unimported") and is_skipped(project_dir, asset))
+        and not is_imported(project_dir, asset, hashes[asset]["md5"])
+    ]
+    print("{} assets, {} changed, {} deleted, {} need to be imported".format(
+        len(assets), len(changed), len(deleted), len(pending)
+    ))
+
+    if not pending and not deleted and not args["force"] and (exact_snapshot or not needs_project_scan(project_dir)):
+        save_manifest(project_dir, hashes)
+        if args["save_snapshot"] and godot_version != "":
+            save_snapshot(project_dir, args["snapshot_dir"], godot_version, hashes, args["snapshot_cache_size"] * 1024 * 1024)
+        print("Everything is imported already ({:.1f}s)".format(time.monotonic() - start_time))
+        exit(0)
+
+    # Godot often needs more than one pass, assets that depend on textures imported
+    # in the same run are only imported by the next one. Godot is started again
+    # as long as it crashes or still makes progress.
+    returncode = None
+    remaining = pending
+    for attempt in range(1, args["max_attempts"] + 1):
+        previous_remaining = len(remaining)
+        returncode, remaining = run_import(
+            editor_command, project_dir, remaining, hashes, args["timeout"], args["exit_grace"]
+        )
+        if not remaining and returncode is not None:
+            break
+        if returncode == 0 and len(remaining) == previous_remaining:
+            break
+        if returncode == 0 and all(is_skipped(project_dir, asset) for asset in remaining):
+            break
+        print("Import attempt {} left {} assets".format(attempt, len(remaining)))
+
+    print("Reimported {} assets in {:.1f}s".format(len(pending) - len(remaining), time.monotonic() - start_time))
+
+    # assets godot skipped explicitly are recorded as handled, so the next run doesn't start godot for them again
+    skipped = [asset for asset in remaining if returncode == 0 and is_skipped(project_dir, asset)]
+    missing = [asset for asset in remaining if asset not in skipped]
+
+    if skipped:
+        print("Godot skipped these assets:")
+        for asset in skipped:
+            print("  " + asset)
+
+    if missing:
+        print("These assets were not imported:")
+        for asset in missing:
+            print("  " + asset)
+
+        # assets that aren't imported yet stay out of the manifest, so the next run picks them up again
+        save_manifest(project_dir, {asset: hashes[asset] for asset in assets if asset not in missing})
         print("Failed to import the project")
+        exit(1)
+
+    for asset in skipped:
+        hashes[asset] = {**hashes[asset], "unimported": True}
+    save_manifest(project_dir, hashes)
+
+    if args["save_snapshot"] and godot_version != "":
+        save_snapshot(project_dir, args["snapshot_dir"], godot_version, hashes, args["snapshot_cache_size"] * 1024 * 1024)
@@ -0,0 +1,52 @@
+extends SceneTree
+
+# Training workload for the profile guided builds of the extension.
+# Run with: godot --headless --path <project> --script utility_scripts/pgo_training.gd -- <iterations>
+# It prints the time spent in the workload as PGO_WORKLOAD_USEC=<usec>.
+# compile.py --pgo points the debug entries of the .gdextension at the release library while it runs,
+# so the release build is measured even though the editor loads the debug library otherwise.
+
+
+func _init() -> void:
+	var iterations := 10
+	var user_args := OS.get_cmdline_user_args()
+	if user_args.size() > 0 and user_args[0].is_valid_int():
+		iterations = int(user_args[0])
+
+	var asset_indexer = Engine.get_singleton("AssetIndexer")
+	var data_cache = Engine.get_singleton("DataCache")
+	if asset_indexer == null or data_cache == null:
+		printerr("The openchamp extension is not loaded")
+		quit(1)
+		return
+
+	var start_time := Time.get_ticks_usec()
+	var resolved_assets := 0
+	var loaded_patches := 0
+
+	for iteration in range(iterations):
+		# index all the asset packs, including default_assets
+		asset_indexer.re_index_files()
+		var asset_map := asset_indexer.get_asset_map() as Dictionary
+
+		# resolve every identifier that was found
+		for key in asset_map.keys():
+			var asset_id = Identifier.from_string(key)
+			if not asset_id.is_valid():
+				continue
+
+			asset_id.get_content_identifier()
+			if asset_indexer.get_asset_path(asset_id) != "":
+				resolved_assets += 1
+
+		# load all the cached patch json files
+		data_cache.re_index_files()
+		var hash_map := data_cache.get_hash_map() as Dictionary
+		for data_hash in hash_map.keys():
+			if data_cache.get_cached_json(data_hash) != null:
+				loaded_patches += 1
+
+	var duration := Time.get_ticks_usec() - start_time
+	print("Resolved %d assets and loaded %d patches" % [resolved_assets, loaded_patches])
+	print("PGO_WORKLOAD_USEC=%d" % duration)
+	quit(0)
@@ -1,4 +1,6 @@
 import argparse
+import hashlib
+import json
 import os
 import zipfile
 import sys
@@ -6,9 +8,15 @@ import platform
 import stat
 import shutil
 import subprocess
+import urllib.request
 from pathlib import Path
+from typing import List
 
-import wget
+
+aseprite_repo = "https://github.com/aseprite/aseprite"
+
+# written into the build dir after a successful configure
+configure_stamp_name = ".setup_aseprite.json"
 
 
 def install_sys_deps():
@@ -20,7 +28,7 @@ def install_sys_deps():
         subprocess.run([
             "sudo", "apt-get", "install", "-y",
             "g++", "clang", "libc++-dev", "libc++abi-dev",
-            "cmake", "ninja-build", "libx11-dev", "libxcursor-dev",
+            "cmake", "ninja-build", "ccache", "libx11-dev", "libxcursor-dev",
             "libxi-dev", "libgl1-mesa-dev", "libfontconfig1-dev"
         ])
         return
@@ -29,7 +37,7 @@ def install_sys_deps():
         subprocess.run([
             "sudo", "dnf", "install", "-y",
             "gcc-c++", "clang", "libcxx-devel", "cmake",
-            "ninja-build", "libX11-devel", "libXcursor-devel",
+            "ninja-build", "ccache", "libX11-devel", "libXcursor-devel",
             "libXi-devel", "mesa-libGL-devel", "fontconfig-devel"
         ])
         return
@@ -37,14 +45,14 @@ def install_sys_deps():
     if shutil.which("pacman"):
         subprocess.run([
             "sudo", "pacman", "-S", "gcc", "clang", "libc++", "cmake",
-            "ninja", "libx11", "libxcursor", "mesa-libgl", "fontconfig", "libwebp"
+            "ninja", "ccache", "libx11", "libxcursor", "mesa-libgl", "fontconfig", "libwebp"
         ])
         return
     
     if shutil.which("zypper"):
         subprocess.run([
             "sudo", "zypper", "install", "gcc-c++", "clang", "libc++-devel",
-            "libc++abi-devel", "cmake", "ninja", "libX11-devel", "libXcursor-devel",
+            "libc++abi-devel", "cmake", "ninja", "ccache", "libX11-devel", "libXcursor-devel",
             "libXi-devel", "Mesa-libGL-devel", "fontconfig-devel"
         ])
         return
@@ -52,71 +60,194 @@ def install_sys_deps():
     print("didn't find a valid package manager")
 
 
-def compile(script_dir, skia_tag, should_update, linker):
-    aesprite_dir=Path(os.path.join(script_dir, "aseprite"))
-    
-    if aesprite_dir.is_dir() is True:
-        if should_update:
-            print("pulling the latest commits from the aseprite repo")
-            subprocess.run(["git", "pull"], cwd=aesprite_dir)
+def get_default_skia_cache_dir() -> str:
+    # the skia binaries are shared between all checkouts of the current user
+    if platform.system() == "Windows":
+        cache_root = os.getenv("LOCALAPPDATA") or os.path.expanduser("~")
+    elif platform.system() == "Darwin":
+        cache_root = os.path.expanduser("~/Library/Caches")
     else:
-        print("cloning the aseprite repo")
-        subprocess.run(["git", "clone", "https://github.com/aseprite/aseprite"], cwd=script_dir)
-        
-    # setup/update the submodules
-    subprocess.run(["git", "submodule", "update", "--init", "--recursive"], cwd=aesprite_dir)
-    
-    # set the skia path
-    skia_dir=Path(os.path.join(script_dir, "skia"))
-    
-    if not skia_dir.is_dir() or should_update:
-        build_os=platform.system()
-        match build_os:
-            case "Windows":
-                build_os="Windows"
-            case "Linux":
-                build_os="Linux"
-            case "Darwin":
-                build_os="macOS"
-            case _:
-                print(f"not a valid build os: {build_os}")
-                return 1
-                
-        build_arch=platform.machine()
-        match build_arch:
-            case "amd64" | "x86_64" | "AMD64":
-                build_arch="x64"
-            case "i386" | "x86":
-                build_arch="x86"
-            case "arm64" | "aarch64":
-                build_arch="arm64"
-            case _:
-                print(f"not a valid build arch: {build_arch}")
-                return 2
-        
-        link_suffix=""
-        if build_os == "Linux":
-            link_suffix="-libstdc++"
-        
-        
-        skia_dl_link = f"https://github.com/aseprite/skia/releases/download/{skia_tag}/Skia-{build_os}-Release-{build_arch}{link_suffix}.zip"
-        print(f"downloading the skia binaries from '{skia_dl_link}'")
-        
-        skia_dl_zip = wget.download(skia_dl_link)
-        
+        cache_root = os.getenv("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+
+    return os.path.join(cache_root, "openchamp", "skia")
+
+
+def get_skia_package() -> str | None:
+    # the name of the prebuilt skia package for this machine, without the tag
+    build_os = platform.system()
+    match build_os:
+        case "Windows":
+            build_os = "Windows"
+        case "Linux":
+            build_os = "Linux"
+        case "Darwin":
+            build_os = "macOS"
+        case _:
+            print(f"not a valid build os: {build_os}")
+            return None
+
+    build_arch = platform.machine()
+    match build_arch:
+        case "amd64" | "x86_64" | "AMD64":
+            build_arch = "x64"
+        case "i386" | "x86":
+            build_arch = "x86"
+        case "arm64" | "aarch64":
+            build_arch = "arm64"
+        case _:
+            print(f"not a valid build arch: {build_arch}")
+            return None
+
+    link_suffix = ""
+    if build_os == "Linux":
+        link_suffix = "-libstdc++"
+
+    return f"Skia-{build_os}-Release-{build_arch}{link_suffix}"
+
+
+def get_skia(skia_cache_dir: str, skia_tag: str, skia_package: str) -> str | None:
+    # Every tag/os/arch combination gets its own dir in the cache, so switching the tag
+    # or updating aseprite never downloads a skia version that was downloaded before.
+    skia_dir = os.path.join(skia_cache_dir, f"{skia_tag}-{skia_package}")
+    if os.path.isdir(skia_dir):
+        return skia_dir
+
+    os.makedirs(skia_cache_dir, exist_ok=True)
+    skia_dl_link = f"https://github.com/aseprite/skia/releases/download/{skia_tag}/{skia_package}.zip"
+    print(f"downloading the skia binaries from '{skia_dl_link}'")
+
+    # download and extract next to the final dir, an interrupted download never leaves a broken skia dir behind
+    skia_dl_zip = f"{skia_dir}.{os.getpid()}.zip"
+    temp_dir = f"{skia_dir}.{os.getpid()}.tmp"
+    try:
+        request = urllib.request.Request(skia_dl_link, headers={"User-Agent": "openchamp-setup-aseprite"})
+        with urllib.request.urlopen(request, timeout=60) as response, open(skia_dl_zip, "wb") as f:
+            shutil.copyfileobj(response, f, 1024 * 1024)
+
         with zipfile.ZipFile(skia_dl_zip, "r") as zip_ref:
-            zip_ref.extractall(skia_dir)
-        
-        os.remove(skia_dl_zip)
+            zip_ref.extractall(temp_dir)
+        os.replace(temp_dir, skia_dir)
+    except (OSError, zipfile.BadZipFile) as e:
+        # a truncated download or an error page isn't a valid zip
+        print(f"Failed to download skia: {e}")
+        return None
+    finally:
+        if os.path.exists(skia_dl_zip):
+            os.remove(skia_dl_zip)
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    return skia_dir
+
+
+def get_git_head(repo_dir: Path) -> str:
+    head_output = subprocess.run(["git", "rev-parse", "HEAD"], cwd=repo_dir, capture_output=True)
+    return head_output.stdout.decode().strip()
+
+
+def update_sources(script_dir: str, aesprite_dir: Path, should_update: bool, jobs: int) -> bool:
+    # Only the latest commit of aseprite and of every submodule is fetched,
+    # the full history of aseprite and its dependencies isn't needed to build it
+    if not aesprite_dir.is_dir():
+        print("cloning the aseprite repo")
+        clone_output = subprocess.run([
+            "git", "clone",
+            "--depth", "1",
+            "--recurse-submodules",
+            "--shallow-submodules",
+            "--jobs", str(jobs),
+            aseprite_repo,
+            str(aesprite_dir)
+        ], cwd=script_dir)
+        return clone_output.returncode == 0
+
+    if should_update:
+        print("fetching the latest commit from the aseprite repo")
+        old_head = get_git_head(aesprite_dir)
+        fetch_output = subprocess.run(["git", "fetch", "--depth", "1", "origin"], cwd=aesprite_dir)
+        if fetch_output.returncode != 0:
+            return False
+
+        # a shallow fetch has no common history to merge with, move to the fetched commit instead.
+        # --keep refuses to overwrite local changes
+        reset_output = subprocess.run(["git", "reset", "--keep", "FETCH_HEAD"], cwd=aesprite_dir)
+        if reset_output.returncode != 0:
+            return False
+
+        if get_git_head(aesprite_dir) == old_head:
+            print("aseprite is up to date")
+            return True
+
+    # setup/update the submodules, this is a no-op if they are checked out already
+    submodule_output = subprocess.run([
+        "git", "submodule", "update",
+        "--init", "--recursive",
+        "--depth", "1",
+        "--jobs", str(jobs)
+    ], cwd=aesprite_dir)
+    return submodule_output.returncode == 0
+
+
+def get_compiler_launcher_args(script_dir: str) -> List[str]:
+    # the same launcher the extension uses, it runs the compiler through ccache or sccache if installed
+    extensions_dir = os.path.join(script_dir, "..", "extensions")
+    if platform.system() == "Windows":
+        launcher = os.path.join(extensions_dir, "compiler_launcher.bat")
+    else:
+        launcher = os.path.join(extensions_dir, "compiler_launcher.sh")
+
+    if not os.path.exists(launcher):
+        return []
+
+    launcher = Path(os.path.abspath(launcher)).as_posix()
+    return [f"-DCMAKE_C_COMPILER_LAUNCHER={launcher}", f"-DCMAKE_CXX_COMPILER_LAUNCHER={launcher}"]
+
+
+def get_configure_hash(setup_command: List[str]) -> str:
+    # everything that changes the configuration, changed CMakeLists.txt files are picked up by ninja itself
+    configure_state = {
+        "command": setup_command,
+        "linker": os.getenv("CMAKE_LINKER_TYPE", ""),
+        "cmake": shutil.which("cmake") or "",
+        "cc": os.getenv("CC", ""),
+        "cxx": os.getenv("CXX", ""),
+    }
+    return hashlib.sha256(json.dumps(configure_state, sort_keys=True).encode()).hexdigest()
+
+
+def needs_configure(build_dir: Path, configure_hash: str) -> bool:
+    if not (build_dir / "build.ninja").exists() or not (build_dir / "CMakeCache.txt").exists():
+        return True
+
+    try:
+        with open(build_dir / configure_stamp_name, "r") as f:
+            return json.load(f).get("hash") != configure_hash
+    except (OSError, ValueError):
+        return True
+
+
+def compile(script_dir, skia_tag, should_update, linker, skia_cache_dir, use_compiler_launcher, jobs):
+    aesprite_dir=Path(os.path.join(script_dir, "aseprite"))
+
+    if not update_sources(script_dir, aesprite_dir, should_update, jobs):
+        print("Failed to get the aseprite sources")
+        return 3
+
+    skia_package = get_skia_package()
+    if skia_package is None:
+        return 1
+
+    skia_dir = get_skia(skia_cache_dir, skia_tag, skia_package)
+    if skia_dir is None:
+        return 2
 
     # try setting the linker
     if linker == "" and shutil.which("mold"):
         linker = "MOLD"
-    
+
     if linker:
         print("Using linker: {}".format(linker))
         os.environ["CMAKE_LINKER_TYPE"] = linker
-        
+
     # try running the setup
     setup_command = [
         "cmake",
@@ -124,24 +255,39 @@ def compile(script_dir, skia_tag, should_update, linker):
         "-DCMAKE_BUILD_TYPE=Release",
         "-DLAF_BACKEND=skia",
         f"-DSKIA_DIR={skia_dir}",
+    ]
+    if use_compiler_launcher:
+        setup_command += get_compiler_launcher_args(script_dir)
+    setup_command += [
         "-B", "build",
         "."
     ]
-    setup_output = subprocess.run(setup_command, cwd=aesprite_dir, check=True)
-    if setup_output.returncode != 0:
-        print("Failed to run the setup command")
-        return 4
 
-    # try compiling the code
+    build_dir = aesprite_dir / "build"
+    configure_hash = get_configure_hash(setup_command)
+    if needs_configure(build_dir, configure_hash):
+        setup_output = subprocess.run(setup_command, cwd=aesprite_dir)
+        if setup_output.returncode != 0:
+            print("Failed to run the setup command")
+            return 4
+
+        with open(build_dir / configure_stamp_name, "w") as f:
+            json.dump({"hash": configure_hash, "skia_dir": skia_dir}, f, indent=2)
+    else:
+        print("The build configuration didn't change, skipping the setup")
+
+    # try compiling the code, ninja only rebuilds what changed
     compile_command = [
         "cmake",
         "--build", "build"
     ]
-    compile_output = subprocess.run(compile_command, cwd=aesprite_dir, check=True)
-    if setup_output.returncode != 0:
+    compile_output = subprocess.run(compile_command, cwd=aesprite_dir)
+    if compile_output.returncode != 0:
         print("Failed to run the compile command")
         return 5
 
+    return 0
+
 
 if __name__ == "__main__":
     # change to the project root, which is the dir of this file
@@ -183,10 +329,34 @@ if __name__ == "__main__":
         action='store_true',
         required=False,
         default=False,
-        dest='cleanup',
+        dest='system_deps',
         help="install system build deps"
     )
-    
+
+    parser.add_argument(
+        "--skia_cache_dir",
+        type=str,
+        required=False,
+        default="",
+        help="The dir the skia binaries of every tag are cached in (default: the openchamp/skia dir in the user cache)"
+    )
+
+    parser.add_argument(
+        "--no_compiler_launcher",
+        action='store_true',
+        required=False,
+        default=False,
+        help="don't build through the ccache/sccache compiler launcher of the extension"
+    )
+
+    parser.add_argument(
+        "--jobs", "-j",
+        type=int,
+        required=False,
+        default=8,
+        help="How many submodules are fetched at the same time (default: 8)"
+    )
+
     parser.add_argument(
         "action",
         action="store",
@@ -196,17 +366,29 @@ if __name__ == "__main__":
 
     args = vars(parser.parse_args())
 
+    skia_cache_dir = args["skia_cache_dir"] or get_default_skia_cache_dir()
+
     match args["action"]:
         case "run":
             aesprite_exe = os.path.join(script_dir, "aseprite", "build", "bin", "aseprite")
             subprocess.run(aesprite_exe)
         case "update" | "compile" as operation:
             if args["cleanup"]:
-                shutil.rmtree("aseprite")
-                shutil.rmtree("skia")
-                
+                shutil.rmtree("aseprite", ignore_errors=True)
+                skia_package = get_skia_package()
+                if skia_package is not None:
+                    shutil.rmtree(os.path.join(skia_cache_dir, f"{args['skia_tag']}-{skia_package}"), ignore_errors=True)
+
             if args["system_deps"]:
                 install_sys_deps()
                 
-            sys.exit(compile(script_dir, args["skia_tag"], operation == "update", args["set_linker"]))
+            sys.exit(compile(
+                script_dir,
+                args["skia_tag"],
+                operation == "update",
+                args["set_linker"],
+                skia_cache_dir,
+                not args["no_compiler_launcher"],
+                args["jobs"]
+            ))
     